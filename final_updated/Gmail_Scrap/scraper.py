@@ -37,6 +37,13 @@ except ImportError:
     # If direct import fails, try with the full module path
     from Gmail_Scrap.config import EMAIL_ID, LABEL_ID
 
+# The transaction record shared with the fetcher, the model and the app
+try:
+    from transaction import Transaction
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from transaction import Transaction
+
 # Fetching date from 3 months ago to get more transactions
 dt = (datetime.today() - timedelta(days=90)).replace(hour=0, minute=0, second=0, microsecond=0).date()
 dt = str(dt)
@@ -163,7 +170,11 @@ def extract_phonepe_details(messageBody: str) -> tuple:
         return 0, "Unknown", "payment", "", "", "", "", ""
 
 def main(force_refresh=False, progress_callback=None):
-    """Main execution function for the Gmail scraper"""
+    """Main execution function for the Gmail scraper
+
+    Returns the transactions as Transaction records; the CSV cache keeps every column
+    the emails provide.
+    """
     setup_logging()
     
     # Try to load cached data if force_refresh is False
@@ -173,7 +184,7 @@ def main(force_refresh=False, progress_callback=None):
             logging.info("Using cached data instead of fetching from Gmail")
             if progress_callback:
                 progress_callback("Using cached data", 100)
-            return cached_data
+            return [Transaction.from_dict(row) for row in cached_data]
     
     # If we get here, either force_refresh=True or no cached data exists
     if progress_callback:
@@ -238,7 +249,7 @@ def main(force_refresh=False, progress_callback=None):
             else:
                 progress_callback("No transactions found. Please try again or check your Gmail account.", 100)
                 
-        return all_transactions
+        return [Transaction.from_dict(row) for row in all_transactions]
     except Exception as e:
         logging.error(f"Error in main function: {str(e)}")
         if progress_callback:
@@ -1,6 +1,15 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify, Response, send_file
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+import sqlite3
+import hashlib
+import secrets
+import heapq
+import base64
+from collections import defaultdict
 import subprocess
 import sys
 import os
@@ -10,8 +19,8 @@ import time
 from datetime import datetime
 import pandas as pd
 import logging
-import random
 import traceback
+from functools import wraps
 
 # Configure logging with detailed file logging
 log_dir = os.path.dirname(os.path.abspath(__file__))
@@ -32,21 +41,57 @@ from Gmail_Scrap.scraper import main
 # Import transaction fetcher
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from transaction_fetcher import fetch_transactions
+from transaction import Transaction as TransactionRecord
+
+from jobs import JobQueue, QueueFull
+from dashboard_store import DashboardStore
+from spend_index import SpendIndex, SpendIndexCache
+from dates import MISSING_DAY, day_numbers, in_range, iso_dates, month_keys, to_date, to_day
+from response_cache import ResponseCache, Revisions
+from shared_state import StateDB, SharedDashboardStore, SharedJobQueue, SharedRevisions
+from fast_json import FastJSONProvider, compress_response
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///users.db')
 app.config['SECRET_KEY'] = 'your_secret_key_here'  # Change this to a secure secret key
 db = SQLAlchemy(app)
 
-# Global variable to track progress
-current_progress = {
-    "status": "Idle",
-    "percent": 0,
-    "last_update": time.time()
-}
+# jsonify through orjson when available; large JSON responses are compressed in after_request
+app.json = FastJSONProvider(app)
+
+# Where jobs, their progress, dashboard data and data revisions live: in this
+# process ('memory', for `python app.py`), or in a SQLite file shared by every worker
+# process ('sqlite', for multi-worker servers; see wsgi.py)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+
+# Background workers for /fetch_data (per process); the scrape and categorization
+# can take minutes, so they run here instead of inside the request
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '2'))
+FETCH_MAX_PENDING = int(os.getenv('FETCH_MAX_PENDING', '20'))
+
+# Dashboard data lives on the server; the session only keeps its key
+DASHBOARD_STORE_SIZE = int(os.getenv('DASHBOARD_STORE_SIZE', '1000'))
+
+if STATE_BACKEND == 'sqlite':
+    os.makedirs(app.instance_path, exist_ok=True)
+    state_db = StateDB(os.getenv('STATE_DB', os.path.join(app.instance_path, 'state.db')))
+    data_revisions = SharedRevisions(state_db)
+    dashboard_store = SharedDashboardStore(state_db, max_entries=DASHBOARD_STORE_SIZE)
+    job_queue = SharedJobQueue(state_db, max_workers=FETCH_WORKERS, max_pending=FETCH_MAX_PENDING)
+else:
+    data_revisions = Revisions()
+    dashboard_store = DashboardStore(max_entries=DASHBOARD_STORE_SIZE)
+    job_queue = JobQueue(max_workers=FETCH_WORKERS, max_pending=FETCH_MAX_PENDING)
+
+# Serialized JSON responses per user, dropped when the user's stored data changes
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '500')),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '300')),
+    revisions=data_revisions
+)
 
-# Global variable to store categorized expenses
-global_categorized_expenses = []
+# Seconds between keep-alive comments on an idle job event stream
+SSE_KEEPALIVE = 15
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,12 +100,417 @@ class User(db.Model):
     password = db.Column(db.String(120), nullable=False)
 
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_transaction_user_date', 'user_id', 'date'),
+        db.Index('ix_transaction_user_category_date', 'user_id', 'category', 'date'),
+        db.UniqueConstraint('user_id', 'txn_id', name='uq_transaction_user_txn')
+    )
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    txn_id = db.Column(db.String(64))
     date = db.Column(db.Date, nullable=False)
     description = db.Column(db.String(120), nullable=False)
     category = db.Column(db.String(50), nullable=False)
     amount = db.Column(db.Float, nullable=False)
-    balance = db.Column(db.Float, nullable=False)
+    balance = db.Column(db.Float)
+
+class SpendRollup(db.Model):
+    """Per-user monthly category totals, kept in step with the transaction table"""
+    __tablename__ = 'spend_rollup'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    category = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+# Rows per INSERT statement, well under SQLite's limit on bound parameters
+INSERT_CHUNK_SIZE = 500
+
+# Page sizes for /api/transactions
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Transactions shown in "recent" lists
+RECENT_LIMIT = 10
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets dashboard reads carry on while a fetch job writes transactions"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+def upgrade_transaction_table():
+    """Rebuild a transaction table created before user_id and txn_id existed
+
+    SQLite cannot add constraints or drop NOT NULL in place, so the old table is
+    renamed, the current one created and the rows copied across.
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns('transaction')}
+    if 'user_id' in columns:
+        return
+    logging.info("Upgrading the transaction table (adding user_id, txn_id and indexes)")
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE "transaction" RENAME TO transaction_old'))
+        Transaction.__table__.create(conn)
+        conn.execute(text(
+            'INSERT INTO "transaction" (id, date, description, category, amount, balance) '
+            'SELECT id, date, description, category, amount, balance FROM transaction_old'
+        ))
+        conn.execute(text('DROP TABLE transaction_old'))
+
+def init_db():
+    """Create missing tables and bring older ones up to the current schema"""
+    inspector = inspect(db.engine)
+    if inspector.has_table('transaction'):
+        upgrade_transaction_table()
+    had_rollups = inspector.has_table('spend_rollup')
+    db.create_all()
+    # create_all skips indexes on tables that already exist
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP INDEX IF EXISTS ix_transaction_user_category'))
+    for index in Transaction.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    if not had_rollups:
+        rebuild_rollups()
+
+def rebuild_rollups(user_id=None):
+    """Recompute the rollup table from the transactions (for one user, or everyone)"""
+    condition = 'user_id = :user_id' if user_id is not None else 'user_id IS NOT NULL'
+    with db.engine.begin() as conn:
+        conn.execute(text(f'DELETE FROM spend_rollup WHERE {condition}'), {'user_id': user_id})
+        conn.execute(text(
+            'INSERT INTO spend_rollup (user_id, month, category, total, count) '
+            "SELECT user_id, substr(date, 1, 7), category, SUM(amount), COUNT(*) "
+            f'FROM "transaction" WHERE {condition} GROUP BY user_id, substr(date, 1, 7), category'
+        ), {'user_id': user_id})
+
+def apply_rollup_deltas(user_id, deltas):
+    """Add {(month, category): [amount, count]} changes to a user's rollups"""
+    rows = [
+        {'user_id': user_id, 'month': month, 'category': category, 'total': total, 'count': count}
+        for (month, category), (total, count) in deltas.items() if total or count
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        statement = sqlite_insert(SpendRollup).values(rows[start:start + INSERT_CHUNK_SIZE])
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'month', 'category'],
+            set_={
+                'total': SpendRollup.total + statement.excluded.total,
+                'count': SpendRollup.count + statement.excluded.count
+            }
+        )
+        db.session.execute(statement)
+    if rows:
+        SpendRollup.query.filter(SpendRollup.user_id == user_id, SpendRollup.count <= 0).delete()
+
+def derived_txn_id(date, description, amount, occurrence=0):
+    """Stable ID for a transaction whose source gave none, so re-imports update it in place
+
+    occurrence numbers the repeats of the same date, description and amount within
+    one import, so two identical purchases on a day are stored as two rows.
+    """
+    key = f"{date}|{description}|{amount:.2f}"
+    if occurrence:
+        key += f"|{occurrence}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return f"auto-{digest[:24]}"
+
+def save_transactions(user_id, transactions):
+    """Bulk insert categorized transactions for a user, updating rows whose txn_id exists
+
+    Each transaction is a TransactionRecord, or a dictionary with date, description,
+    category, amount and optionally txn_id, and day (its day number) if the date was
+    already converted. The source's txn_id is kept when there is one; otherwise an ID
+    is derived from the transaction (see derived_txn_id).
+    Returns the number of rows written.
+    """
+    if all(tx.get('day') is not None for tx in transactions):
+        days = [tx['day'] for tx in transactions]
+    else:
+        days = day_numbers([tx.get('date') for tx in transactions])
+    
+    rows = []
+    occurrences = defaultdict(int)
+    for tx, day in zip(transactions, days):
+        try:
+            if day == MISSING_DAY:
+                raise ValueError(f"unreadable date {tx.get('date')!r}")
+            date = to_date(day)
+            amount = float(tx.get('amount', 0))
+        except (ValueError, TypeError) as e:
+            logging.warning(f"Skipping transaction that cannot be stored {tx}: {str(e)}")
+            continue
+        description = str(tx.get('description') or 'Unknown')[:120]
+        txn_id = str(tx.get('txn_id') or '')[:64]
+        if not txn_id:
+            occurrence = occurrences[(date, description, round(amount, 2))]
+            occurrences[(date, description, round(amount, 2))] += 1
+            txn_id = derived_txn_id(date, description, amount, occurrence)
+        rows.append({
+            'user_id': user_id,
+            'txn_id': txn_id,
+            'date': date,
+            'description': description,
+            'category': str(tx.get('category') or 'Other')[:50],
+            'amount': amount
+        })
+    
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+        
+        # Rollup changes: rows being replaced leave their old month and category, and
+        # every row adds itself to its new one
+        current = {
+            txn_id: (date, category, amount)
+            for txn_id, date, category, amount in db.session.query(
+                Transaction.txn_id, Transaction.date, Transaction.category, Transaction.amount
+            ).filter(Transaction.user_id == user_id, Transaction.txn_id.in_([row['txn_id'] for row in chunk]))
+        }
+        deltas = defaultdict(lambda: [0.0, 0])
+        for row in chunk:
+            previous = current.get(row['txn_id'])
+            if previous:
+                date, category, amount = previous
+                deltas[(date.strftime('%Y-%m'), category)][0] -= amount
+                deltas[(date.strftime('%Y-%m'), category)][1] -= 1
+            deltas[(row['date'].strftime('%Y-%m'), row['category'])][0] += row['amount']
+            deltas[(row['date'].strftime('%Y-%m'), row['category'])][1] += 1
+            current[row['txn_id']] = (row['date'], row['category'], row['amount'])
+        
+        statement = sqlite_insert(Transaction).values(chunk)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'txn_id'],
+            set_={
+                'date': statement.excluded.date,
+                'description': statement.excluded.description,
+                'category': statement.excluded.category,
+                'amount': statement.excluded.amount
+            }
+        )
+        db.session.execute(statement)
+        apply_rollup_deltas(user_id, deltas)
+    db.session.commit()
+    # Cached responses and spend indexes of this user (in every worker) are now stale
+    data_revisions.bump(user_id)
+    return len(rows)
+
+def build_spend_index(user_id):
+    """SpendIndex over a user's stored transactions, read as one row per day and category"""
+    rows = db.session.query(
+        Transaction.date, Transaction.category, func.sum(Transaction.amount), func.count(Transaction.id)
+    ).filter(Transaction.user_id == user_id).group_by(Transaction.date, Transaction.category).all()
+    return SpendIndex.from_daily_rows(rows)
+
+# Prefix sums per user, rebuilt after save_transactions changes their data
+spend_indexes = SpendIndexCache(
+    build_spend_index, data_revisions.get, max_entries=int(os.getenv('SPEND_INDEX_CACHE_SIZE', '200'))
+)
+
+def category_totals(user_id, start_date=None, end_date=None):
+    """Per-category sums for a user (same keys as build_dashboard_data)
+
+    Without a date range this reads the monthly rollups, so it costs
+    O(categories x months) however many transactions there are. A date range can
+    cut through months, so it is answered from the user's daily prefix sums.
+    """
+    if start_date or end_date:
+        rows = spend_indexes.get(user_id).category_totals(start_date, end_date)
+    else:
+        rows = db.session.query(
+            SpendRollup.category, func.sum(SpendRollup.total), func.sum(SpendRollup.count)
+        ).filter(SpendRollup.user_id == user_id).group_by(SpendRollup.category).order_by(
+            func.sum(SpendRollup.total).desc()
+        ).all()
+    
+    categories = {category: total for category, total, count in rows}
+    return {
+        'categories': categories,
+        'category_names': list(categories.keys()),
+        'category_values': list(categories.values()),
+        'total': sum(categories.values()),
+        'transaction_count': sum(count for category, total, count in rows)
+    }
+
+def monthly_totals(user_id):
+    """{YYYY-MM: total} for a user from the rollups"""
+    rows = db.session.query(SpendRollup.month, func.sum(SpendRollup.total)).filter(
+        SpendRollup.user_id == user_id
+    ).group_by(SpendRollup.month).order_by(SpendRollup.month).all()
+    return {month: total for month, total in rows}
+
+def transaction_to_dict(tx):
+    return {
+        'id': tx.id,
+        'txn_id': tx.txn_id,
+        'date': str(tx.date),
+        'description': tx.description,
+        'category': tx.category,
+        'amount': tx.amount,
+        'balance': tx.balance
+    }
+
+def encode_cursor(tx):
+    """Opaque page cursor for the position just after tx in (date, id) descending order"""
+    return base64.urlsafe_b64encode(f"{tx.date.isoformat()}|{tx.id}".encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(date, id) from a page cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_str, tx_id = raw.split('|')
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(tx_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+def transaction_page(user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, category=None, start_date=None, end_date=None):
+    """One page of a user's transactions, newest first, and the cursor of the next page
+
+    Pages are keyed on (date, id) rather than an offset, so every page is a range
+    scan of the (user_id, date) or (user_id, category, date) index however deep
+    into the history it is.
+    """
+    query = Transaction.query.filter(Transaction.user_id == user_id)
+    if category:
+        query = query.filter(Transaction.category == category)
+    if start_date:
+        query = query.filter(Transaction.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(Transaction.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            Transaction.date < cursor_date,
+            db.and_(Transaction.date == cursor_date, Transaction.id < cursor_id)
+        ))
+    
+    rows = query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def recent_transactions_for(user_id, limit=RECENT_LIMIT):
+    """A user's latest transactions, read from the head of the (user_id, date) index"""
+    rows, _ = transaction_page(user_id, limit=limit)
+    return [transaction_to_dict(tx) for tx in rows]
+
+def attach_categories(transactions, categorized_expenses):
+    """Set the categories of a job's Transaction records; returns the records that got one
+
+    The model returns its rows in input order, so equal lengths pair up by position;
+    otherwise rows are matched on description and amount.
+    """
+    def row_fields(row):
+        if isinstance(row, dict):
+            return row.get('description'), row.get('category'), row.get('amount')
+        return row[0], row[1], row[2]
+    
+    if len(transactions) == len(categorized_expenses):
+        categories = [row_fields(row)[1] for row in categorized_expenses]
+    else:
+        by_key = {}
+        for row in categorized_expenses:
+            description, category, amount = row_fields(row)
+            by_key.setdefault((str(description), round(float(amount), 2)), []).append(category)
+        categories = []
+        for tx in transactions:
+            matches = by_key.get((tx.recipient, round(tx.amount, 2)))
+            categories.append(matches.pop(0) if matches else None)
+    
+    categorized = []
+    for tx, category in zip(transactions, categories):
+        if category:
+            tx.category = category
+            categorized.append(tx)
+    return categorized
+
+def persist_categorized(user_id, transactions, categorized_expenses, start_date=None, end_date=None):
+    """Store a job's categorized transactions for its user and return SQL totals for the range
+
+    Returns {} for anonymous jobs or if storing fails, so the caller keeps its own totals.
+    """
+    if user_id is None:
+        return {}
+    with app.app_context():
+        try:
+            count = save_transactions(user_id, attach_categories(transactions, categorized_expenses))
+            logging.info(f"Stored {count} categorized transactions for user {user_id}")
+            return {
+                **category_totals(user_id, start_date, end_date),
+                'monthly_data': spend_indexes.get(user_id).monthly_totals(start_date, end_date)
+            }
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error storing categorized transactions: {str(e)}", exc_info=True)
+            return {}
+
+def job_owner():
+    """Owner of the current session's jobs: the user's id, or a random token per anonymous session
+
+    Anonymous callers get a token of their own so they cannot see each other's jobs.
+    """
+    if 'user_id' in session:
+        return session['user_id']
+    if 'job_owner' not in session:
+        session['job_owner'] = f"anon-{secrets.token_hex(16)}"
+    return session['job_owner']
+
+def cached_response(view):
+    """Serve a JSON view from response_cache and answer If-None-Match with 304
+
+    Only for GET views built from the user's stored data: the cached copy is valid
+    until save_transactions bumps the user's revision. Responses are cached per
+    logged-in user and keyed on the path and query string; only successful ones
+    ("status": "success") are kept. ?refresh=1 runs the view again and replaces the
+    cached copy. Other methods and anonymous callers always run the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        owner = session.get('user_id')
+        if request.method != 'GET' or owner is None:
+            return view(*args, **kwargs)
+        key = (
+            request.path,
+            tuple(sorted((k, v) for k, v in request.args.items(multi=True) if k != 'refresh'))
+        )
+        revision = response_cache.revision(owner)
+        entry = None if request.args.get('refresh') else response_cache.get(owner, key, revision)
+        if entry is None:
+            response = app.make_response(view(*args, **kwargs))
+            payload = response.get_json(silent=True) if response.status_code == 200 else None
+            if not isinstance(payload, dict) or payload.get('status') != 'success':
+                return response
+            entry = response_cache.put(owner, key, response.get_data(), response.mimetype, revision)
+        
+        response = Response(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        # Browsers keep the body but check back every time, getting a 304 if unchanged
+        response.headers['Cache-Control'] = 'private, no-cache'
+        compress_response(response, request.accept_encodings, entry.encoded)
+        return response.make_conditional(request)
+    return wrapper
+
+def conditional_response(view):
+    """Give a GET view's successful responses a content-hash ETag and answer If-None-Match with 304
+
+    For views whose data has no revision to cache against (such as n8n's): the view
+    still runs on every request, but an unchanged body is not sent again.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = app.make_response(view(*args, **kwargs))
+        if request.method != 'GET' or response.status_code != 200:
+            return response
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    return wrapper
+
+@app.after_request
+def compress_json(response):
+    """gzip (or brotli) large JSON responses for clients that accept it"""
+    return compress_response(response, request.accept_encodings)
 
 @app.route('/')
 def home():
@@ -129,11 +579,16 @@ def dashboard():
     # Get current date for display
     current_date = datetime.now().strftime('%B %d, %Y')
     
-    # Get dashboard data from session if available
-    dashboard_data = session.get('dashboard_data', {})
+    # Get dashboard data from the server-side store if available
+    dashboard_data = load_dashboard_data()
     
-    # Get transactions from database as fallback
-    db_transactions = Transaction.query.order_by(Transaction.date.desc()).limit(10).all()
+    # Totals over everything stored for the user come from the database
+    totals = category_totals(session['user_id'])
+    if totals['category_names']:
+        dashboard_data = {**dashboard_data, **totals}
+    
+    # Get the user's latest transactions from database as fallback
+    db_transactions = recent_transactions_for(session['user_id'])
     
     # If we have dashboard data from categorized expenses
     if dashboard_data:
@@ -142,17 +597,7 @@ def dashboard():
         
         # If no recent transactions, try to use transactions from database
         if not recent_transactions:
-            # Convert database transactions to dictionary format
-            recent_transactions = [
-                {
-                    'date': str(tx.date),
-                    'description': tx.description,
-                    'category': tx.category,
-                    'amount': tx.amount,
-                    'balance': tx.balance
-                }
-                for tx in db_transactions
-            ]
+            recent_transactions = db_transactions
             
         # Pass the processed expense data to the template
         return render_template(
@@ -167,38 +612,105 @@ def dashboard():
         )
     else:
         # If no data yet, just show the dashboard without expense data
-        # Convert database transactions to dictionary format for display
-        recent_transactions = [
-            {
-                'date': str(tx.date),
-                'description': tx.description,
-                'category': tx.category,
-                'amount': tx.amount,
-                'balance': tx.balance
-            }
-            for tx in db_transactions
-        ]
-        
         return render_template(
             'dashboard.html', 
             user=user,
             current_date=current_date,
-            transactions=recent_transactions
+            transactions=db_transactions
         )
 
 @app.route('/logout')
 def logout():
+    dashboard_key = session.pop('dashboard_key', None)
+    if dashboard_key:
+        dashboard_store.delete(dashboard_key)
     session.pop('user_id', None)
     flash('You have been logged out.', 'success')
     return redirect(url_for('home'))
 
 @app.route('/get_progress', methods=['GET'])
 def get_progress():
-    """Get the current progress status"""
-    global current_progress
-    return jsonify(current_progress)
+    """Progress of the current user's latest job (kept for clients that still poll)"""
+    job = job_queue.latest_job(job_owner())
+    if job is None:
+        return jsonify({"status": "Idle", "percent": 0})
+    return jsonify(job.to_dict(include_result=False)["progress"])
+
+@app.route('/api/llm_telemetry', methods=['GET'])
+def llm_telemetry():
+    """Token counts, eval/load durations and queue wait of recent categorization batches"""
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Login required"}), 401
+    
+    from model import telemetry
+    recent = request.args.get('recent', 20, type=int)
+    return jsonify(telemetry.summary(recent=recent))
+
+@app.route('/api/transactions', methods=['GET'])
+@cached_response
+def list_transactions():
+    """Page through the current user's stored transactions, newest first
+
+    Query parameters: limit (default 50, at most 200), cursor (next_cursor from the
+    previous page), category, start_date and end_date (YYYY-MM-DD).
+    """
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Login required"}), 401
+    
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    try:
+        rows, next_cursor = transaction_page(
+            session['user_id'],
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            category=request.args.get('category'),
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date')
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    return jsonify({
+        "status": "success",
+        "transactions": [transaction_to_dict(tx) for tx in rows],
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    })
+
+@app.route('/api/charts/<kind>.<fmt>', methods=['GET'])
+def expense_chart(kind, fmt):
+    """The current user's category or trend chart as PNG or SVG, rendered from their stored totals
+
+    Charts are cached by a hash of the data they show, so unchanged totals are served
+    without rendering.
+    """
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Login required"}), 401
+    
+    from model import charts
+    if kind not in ('category', 'trend') or fmt not in charts.SUPPORTED_FORMATS:
+        return jsonify({"status": "error", "message": "Unknown chart"}), 404
+    
+    user_id = session['user_id']
+    data = category_totals(user_id)['categories'] if kind == 'category' else monthly_totals(user_id)
+    if not data:
+        return jsonify({"status": "error", "message": "No transactions to chart yet"}), 404
+    
+    path = charts.render_chart(kind, data, fmt)
+    response = send_file(path, mimetype='image/svg+xml' if fmt == 'svg' else 'image/png', conditional=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Advice shown when the n8n webhook could not provide transactions, by FetchResult.error_kind
+N8N_WARNINGS = {
+    "webhook_inactive": "n8n webhook needs to be activated. Please open n8n (http://localhost:5678), navigate to your workflow, and click the 'Test' button on the Webhook node before trying again.",
+    "invalid_json": "n8n webhook returned invalid JSON. Make sure the 'Respond to Webhook' node in n8n is configured to return JSON data with a 'transactions' array.",
+    "timeout": "n8n took too long to respond. Make sure the workflow is ACTIVATED, or simplify it so it responds sooner.",
+    "connection": "Could not connect to n8n. Make sure it is running at http://localhost:5678."
+}
 
 @app.route('/api/n8n/transactions', methods=['GET'])
+@conditional_response
 def get_n8n_transactions():
     """Get transactions using the n8n API workflow"""
     try:
@@ -206,68 +718,26 @@ def get_n8n_transactions():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        # Update progress
-        update_progress("Fetching transactions from n8n API...", 30)
-        
         # Log the attempt
         app.logger.info(f"Fetching transactions from n8n API with date range: {start_date or 'all'} to {end_date or 'all'}")
         
-        # Fetch transactions from n8n
-        # Try both test mode and production mode
-        transactions = fetch_transactions(start_date, end_date, test_mode=True)
+        # Fetch transactions from n8n (one call; the result says why it is empty)
+        result = fetch_transactions(start_date, end_date, test_mode=True)
+        transactions = result.transactions
         
         # Log the result
-        app.logger.info(f"Fetched {len(transactions)} transactions from n8n API")
-        
-        # Update progress
-        update_progress("Processing transactions...", 70)
+        app.logger.info(f"Fetched {len(transactions)} transactions from n8n API in {result.elapsed:.2f}s ({result.status})")
         
         if not transactions:
-            # Check if we got any error responses 
-            import sys
-            import io
-            
-            # Capture the stdout from fetch_transactions to see if there was an error message
-            stdout_capture = io.StringIO()
-            sys.stdout = stdout_capture
-            
-            # Call fetch_transactions again to get the error message
-            fetch_transactions(start_date, end_date, test_mode=True)
-            
-            # Reset stdout
-            sys.stdout = sys.__stdout__
-            
-            # Get the output
-            captured_output = stdout_capture.getvalue()
-            
-            # Check for different types of errors
-            if any(err in captured_output for err in ["webhook needs to be activated", "webhook is not registered", "WEBHOOK ERROR"]):
-                update_progress("n8n webhook needs to be activated", 100)
-                return jsonify({
-                    "status": "warning", 
-                    "message": "n8n webhook needs to be activated. Please open n8n (http://localhost:5678), navigate to your workflow, and click the 'Test' button on the Webhook node before trying again.",
-                    "transaction_count": 0
-                })
-            elif "Invalid JSON response" in captured_output:
-                update_progress("n8n returned invalid JSON", 100) 
-                return jsonify({
-                    "status": "warning", 
-                    "message": "n8n webhook returned invalid JSON. Make sure the 'Respond to Webhook' node in n8n is configured to return JSON data with a 'transactions' array.",
-                    "transaction_count": 0
-                })
-            else:
-                update_progress("No transactions found", 100)
-                return jsonify({
-                    "status": "warning", 
-                    "message": "No transactions found for the specified date range.",
-                    "transaction_count": 0
-                })
+            return jsonify({
+                "status": "warning",
+                "message": N8N_WARNINGS.get(result.error_kind, "No transactions found for the specified date range."),
+                "error_kind": result.error_kind,
+                "transaction_count": 0
+            })
         
         # Process transactions
-        processed_data = process_transactions(transactions)
-        
-        # Update progress
-        update_progress("Completed successfully", 100)
+        processed_data = process_transactions(result.records)
         
         # Return data
         return jsonify({
@@ -288,9 +758,6 @@ def get_n8n_transactions():
         app.logger.error(f"Error fetching transactions from n8n API: {str(e)}")
         app.logger.error(traceback.format_exc())
         
-        # Update progress to indicate error
-        update_progress("Error fetching transactions", 100)
-        
         # Return error response
         return jsonify({
             "status": "error",
@@ -299,19 +766,19 @@ def get_n8n_transactions():
         }), 500
 
 def process_transactions(transactions):
-    """Process transactions into a format for the dashboard"""
+    """Process Transaction records into a format for the dashboard"""
     try:
         # Calculate total expenses
-        total_expenses = sum(float(tx.get('amount', 0)) for tx in transactions)
+        total_expenses = sum(tx.amount for tx in transactions)
         
         # Count transactions by category
         categories = {}
         for tx in transactions:
-            category = tx.get('category', 'Uncategorized')
+            category = tx.category or 'Uncategorized'
             if category in categories:
-                categories[category] += float(tx.get('amount', 0))
+                categories[category] += tx.amount
             else:
-                categories[category] = float(tx.get('amount', 0))
+                categories[category] = tx.amount
         
         # Sort categories by amount
         sorted_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)
@@ -326,25 +793,15 @@ def process_transactions(transactions):
             for cat, amount in sorted_categories
         ]
         
-        # Get recent transactions (last 10)
-        recent_transactions = sorted(transactions, key=lambda x: x.get('date', ''), reverse=True)[:10]
+        # Day numbers for every date, converted once in the format inferred for n8n
+        days = day_numbers([tx.date for tx in transactions], source='n8n')
+        
+        # Get recent transactions (last 10) without sorting the whole list
+        latest = heapq.nlargest(RECENT_LIMIT, range(len(transactions)), key=days.__getitem__)
+        recent_transactions = [transactions[i].to_dict() for i in latest]
         
         # Group by month for trend chart
-        monthly_data = {}
-        for tx in transactions:
-            date_str = tx.get('date', '')
-            if date_str:
-                try:
-                    # Extract month from date
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-                    month_key = date_obj.strftime("%b %Y")
-                    
-                    if month_key in monthly_data:
-                        monthly_data[month_key] += float(tx.get('amount', 0))
-                    else:
-                        monthly_data[month_key] = float(tx.get('amount', 0))
-                except Exception as e:
-                    app.logger.warning(f"Error parsing date '{date_str}': {str(e)}")
+        monthly_data = SpendIndex.from_transactions(transactions, days=days).monthly_totals()
         
         # Return processed data
         return {
@@ -361,36 +818,102 @@ def process_transactions(transactions):
         app.logger.error(traceback.format_exc())
         return {}
 
-# Function to update progress status
-def update_progress(status, percentage):
-    """Update the global progress status for tracking by the frontend"""
-    global current_progress
-    current_progress = {
-        "status": status,
-        "percentage": percentage,
-        "last_update": time.time()
-    }
-    app.logger.debug(f"Progress update: {status} - {percentage}%")
-
 @app.route('/fetch_data', methods=['POST'])
 def fetch_data():
+    """Queue the scrape-and-categorize pipeline and return its job ID right away"""
+    # Parse request data
+    data = request.json if request.is_json else request.form
+    
+    # Handle force_refresh whether it's a string or boolean
+    force_refresh_param = data.get('force_refresh', 'true')
+    if isinstance(force_refresh_param, bool):
+        force_refresh = force_refresh_param
+    else:
+        force_refresh = str(force_refresh_param).lower() == 'true'
+    
+    # Get date range parameters
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    
+    logging.info(f"Fetch data requested with force_refresh={force_refresh}, start_date={start_date}, end_date={end_date}")
+    
+    # A user with the same fetch already in progress gets that job instead of a second
+    # one; the check and the submit are one step, even across worker processes
+    try:
+        job = job_queue.submit_once(
+            'fetch_data', run_fetch_pipeline, force_refresh, start_date, end_date, session.get('user_id'),
+            owner=job_owner(), key=json.dumps([force_refresh, start_date, end_date])
+        )
+    except QueueFull as e:
+        logging.warning(f"Rejected fetch request: {str(e)}")
+        return jsonify({"status": "error", "message": "The server is busy processing other requests. Please try again shortly."}), 503
+    
+    return jsonify({
+        "status": "accepted",
+        "job_id": job.id,
+        "status_url": url_for('job_status', job_id=job.id)
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """State, progress and (once finished) result of a background job"""
+    job = job_queue.get(job_id)
+    if job is None or job.owner != job_owner():
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    
+    data = job.to_dict()
+    result = data.pop('result', None)
+    if result is not None:
+        # The worker has no request context, so the dashboard data is stored for the
+        # user when they collect the result
+        if result.get('dashboard_data'):
+            save_dashboard_data(result['dashboard_data'])
+        data['result'] = result['response']
+    return jsonify(data)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events with a job's progress, ending with a 'done' event
+
+    The result itself is collected from /jobs/<job_id>, which also stores the
+    dashboard data for the session.
+    """
+    job = job_queue.get(job_id)
+    if job is None or job.owner != job_owner():
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    
+    def stream():
+        version = None
+        while True:
+            current = job.wait_for_change(version, timeout=SSE_KEEPALIVE)
+            if current == version:
+                # Comment line so proxies do not close an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            data = job.to_dict(include_result=False)
+            if job.active:
+                yield f"event: progress\ndata: {json.dumps(data)}\n\n"
+            else:
+                yield f"event: done\ndata: {json.dumps(data)}\n\n"
+                return
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def run_fetch_pipeline(job, force_refresh, start_date, end_date, user_id):
+    """Scrape Gmail, categorize the transactions and build the dashboard data (runs as a job)
+
+    Transactions are stored for user_id (None for anonymous callers, whose jobs are
+    owned by a session token instead). Returns {"response": <payload for the
+    dashboard>, "dashboard_data": <data for the session>}.
+    """
+    # Progress belongs to the job, so concurrent fetches do not overwrite each other
+    update_progress = job.update_progress
+    
     try:
-        # Parse request data
-        data = request.json if request.is_json else request.form
-        
-        # Handle force_refresh whether it's a string or boolean
-        force_refresh_param = data.get('force_refresh', 'true')
-        if isinstance(force_refresh_param, bool):
-            force_refresh = force_refresh_param
-        else:
-            force_refresh = str(force_refresh_param).lower() == 'true'
-        
-        # Get date range parameters
-        start_date = data.get('start_date')
-        end_date = data.get('end_date')
-        
-        logging.info(f"Fetch data requested with force_refresh={force_refresh}, start_date={start_date}, end_date={end_date}")
-        
         # Reset progress for new request
         update_progress("Initializing Gmail scraper...", 5)
         
@@ -400,77 +923,38 @@ def fetch_data():
         logging.info("Starting Gmail scraper...")
         
         # Run the scraper with a progress callback
-        transactions = scraper.main(force_refresh=force_refresh, progress_callback=update_progress)
+        transactions = scraper.main(force_refresh=force_refresh, progress_callback=job.stage(0, 40))
         
         if not transactions:
             update_progress("No transactions found", 100)
-            return jsonify({"status": "error", "message": "No transactions found"})
+            return {"response": {"status": "error", "message": "No transactions found"}}
         
         logging.info(f"Scraper returned {len(transactions)} transactions")
-        update_progress(f"Processing {len(transactions)} transactions for categorization...", 80)
-        
-        # Process and format the transaction data for consistency
-        formatted_transactions = []
-        for tx in transactions:
-            # Ensure date is properly formatted for filtering
-            date_str = tx.get('Date', datetime.now().strftime('%Y-%m-%d'))
-            # Try to handle different date formats
-            try:
-                # If date is not in YYYY-MM-DD format, try to parse and convert it
-                if not re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
-                    # Try common date formats
-                    for fmt in ['%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y', '%Y/%m/%d']:
-                        try:
-                            date_obj = datetime.strptime(date_str, fmt)
-                            date_str = date_obj.strftime('%Y-%m-%d')
-                            break
-                        except ValueError:
-                            continue
-            except Exception as e:
-                logging.warning(f"Could not parse date '{date_str}': {str(e)}")
-                # Use current date if parsing fails
-                date_str = datetime.now().strftime('%Y-%m-%d')
-                
-            # Ensure amount is a valid float
-            try:
-                amount = float(tx.get('Amount', 0))
-            except (ValueError, TypeError):
-                amount = 0
-                
-            formatted_tx = {
-                'date': date_str,
-                'amount': amount,
-                'recipient': tx.get('Recipient', 'Unknown'),
-                'txn_id': tx.get('Txn ID', ''),
-                'txn_status': tx.get('Txn Status', ''),
-                'payment_mode': tx.get('Payment Mode', ''),
-                'type': tx.get('Type', '')
-            }
-            formatted_transactions.append(formatted_tx)
-        
-        # Filter transactions by date range if provided
+        update_progress(f"Processing {len(transactions)} transactions for categorization...", 40)
+        
+        # Convert every date in one pass, in the format inferred for the scraper's output,
+        # to a day number; a missing date counts as today, an unreadable one is kept as is
+        days = day_numbers([tx.date for tx in transactions], source='gmail')
+        days[[not tx.date for tx in transactions]] = to_day(datetime.now().date())
+        unreadable = int((days == MISSING_DAY).sum())
+        if unreadable:
+            logging.warning(f"{unreadable} transactions have dates that could not be read")
+        
+        # The scraper's records (amounts already parsed) go on to the model and the
+        # dashboard as they are, with their dates normalized in place
+        formatted_transactions = transactions
+        for tx, day, date_str in zip(formatted_transactions, days.tolist(), iso_dates(days)):
+            tx.date = date_str or tx.date
+            tx.day = None if day == MISSING_DAY else day
+        
+        # Filter transactions by date range if provided, comparing day numbers
+        # (transactions with unreadable dates are kept)
         original_count = len(formatted_transactions)
         if start_date and end_date:
             try:
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                
-                # Filter transactions that fall within the date range
-                filtered_transactions = []
-                for tx in formatted_transactions:
-                    try:
-                        tx_date = datetime.strptime(tx['date'], '%Y-%m-%d')
-                        if start_date_obj <= tx_date <= end_date_obj:
-                            filtered_transactions.append(tx)
-                        else:
-                            logging.debug(f"Filtered out transaction from {tx['date']} - outside date range")
-                    except (ValueError, TypeError) as e:
-                        logging.warning(f"Error parsing date '{tx['date']}': {str(e)}")
-                        # Include transactions with invalid dates if we can't determine if they're in range
-                        filtered_transactions.append(tx)
-                
-                logging.info(f"Filtered {len(filtered_transactions)} transactions from {original_count} based on date range")
-                formatted_transactions = filtered_transactions
+                mask = in_range(days, start_date, end_date)
+                formatted_transactions = [tx for tx, keep in zip(formatted_transactions, mask) if keep]
+                logging.info(f"Filtered {len(formatted_transactions)} transactions from {original_count} based on date range")
             except (ValueError, TypeError) as e:
                 logging.error(f"Error parsing date range: {str(e)}")
                 # Continue with unfiltered transactions
@@ -484,48 +968,35 @@ def fetch_data():
             logging.info(f"Starting expense categorization for {len(formatted_transactions)} transactions")
             
             # Pass the transactions directly to the model
-            categorized_expenses = init.main(transactions=formatted_transactions, progress_callback=update_progress)
+            categorized_expenses = init.main(transactions=formatted_transactions, progress_callback=job.stage(40, 100))
             
-            # After model processing, check if the JSON file exists
-            json_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model', 'categorized_expenses.json')
+            # The model hands its results back in-process, so there is no need to
+            # re-read the snapshot file it publishes for other processes
+            if not categorized_expenses:
+                raise ValueError("Model returned no categorized expenses")
+            logging.info(f"Model returned {len(categorized_expenses)} categorized expenses")
             
-            # Try to read the file with retries
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    if os.path.exists(json_file_path):
-                        with open(json_file_path, 'r') as f:
-                            categorized_data = json.load(f)
-                            if 'expenses' in categorized_data and categorized_data['expenses']:
-                                categorized_expenses = categorized_data['expenses']
-                                logging.info(f"Loaded {len(categorized_expenses)} categorized expenses from file")
-                                
-                                # Process and store in session for dashboard display
-                                send_to_dashboard(categorized_expenses)
-                                
-                                # Get the dashboard data from session
-                                dashboard_data = session.get('dashboard_data', {})
-                                
-                                # Return the processed data for immediate display
-                                return jsonify({
-                                    "status": "success",
-                                    "message": "Data fetched successfully",
-                                    "expense_categories": dashboard_data.get('category_names', []),
-                                    "expense_values": dashboard_data.get('category_values', []),
-                                    "total_expenses": dashboard_data.get('total', 0),
-                                    "categorized_expenses": dashboard_data.get('expenses', []),
-                                    "transaction_count": len(categorized_expenses),
-                                    "monthly_data": generate_monthly_data(dashboard_data.get('total', 0)),
-                                    "recent_transactions": format_recent_transactions(formatted_transactions, limit=10),
-                                    "date_range": {"start_date": start_date, "end_date": end_date} if start_date and end_date else None
-                                })
-                                
-                except Exception as e:
-                    logging.error(f"Error loading categorized expenses from file (attempt {attempt + 1}): {str(e)}")
-                    if attempt < max_retries - 1:
-                        time.sleep(1)  # Wait before retrying
-                        continue
-                    raise
+            # Process for dashboard display, storing the transactions for a logged-in user
+            # and taking the totals from the database
+            dashboard_data = build_dashboard_data(categorized_expenses) or {}
+            dashboard_data.update(persist_categorized(
+                user_id, formatted_transactions, categorized_expenses, start_date, end_date
+            ))
+            
+            # Return the processed data for immediate display
+            update_progress("Completed successfully", 100)
+            return {"dashboard_data": dashboard_data, "response": {
+                "status": "success",
+                "message": "Data fetched successfully",
+                "expense_categories": dashboard_data.get('category_names', []),
+                "expense_values": dashboard_data.get('category_values', []),
+                "total_expenses": dashboard_data.get('total', 0),
+                "categorized_expenses": dashboard_data.get('expenses', []),
+                "transaction_count": len(categorized_expenses),
+                "monthly_data": dashboard_data.get('monthly_data') or spend_trend(formatted_transactions, categorized_expenses),
+                "recent_transactions": format_recent_transactions(formatted_transactions, limit=RECENT_LIMIT),
+                "date_range": {"start_date": start_date, "end_date": end_date} if start_date and end_date else None
+            }}
             
         except Exception as model_error:
             logging.error(f"Error in model categorization: {str(model_error)}", exc_info=True)
@@ -535,7 +1006,7 @@ def fetch_data():
             categorized_expenses = []
             for tx in formatted_transactions:
                 # Check what category this might belong to based on recipient name
-                recipient = tx.get('recipient', '').lower()
+                recipient = tx.recipient.lower()
                 
                 # Determine category based on keywords
                 category = 'Extra'  # Default category
@@ -553,19 +1024,21 @@ def fetch_data():
                     category = 'Health'
                 
                 categorized_expenses.append({
-                    'description': tx.get('recipient', 'Unknown'),
+                    'description': tx.recipient,
                     'category': category,
-                    'amount': float(tx.get('amount', 0))
+                    'amount': tx.amount
                 })
             
-            # Process and store in session
-            send_to_dashboard(categorized_expenses)
-            
-            # Get the dashboard data from session
-            dashboard_data = session.get('dashboard_data', {})
+            # Process for dashboard display, storing the transactions for a logged-in user
+            # and taking the totals from the database
+            dashboard_data = build_dashboard_data(categorized_expenses) or {}
+            dashboard_data.update(persist_categorized(
+                user_id, formatted_transactions, categorized_expenses, start_date, end_date
+            ))
             
             # Return the processed data for immediate display
-            return jsonify({
+            update_progress("Completed successfully", 100)
+            return {"dashboard_data": dashboard_data, "response": {
                 "status": "success",
                 "message": "Data fetched successfully",
                 "expense_categories": dashboard_data.get('category_names', []),
@@ -573,17 +1046,14 @@ def fetch_data():
                 "total_expenses": dashboard_data.get('total', 0),
                 "categorized_expenses": dashboard_data.get('expenses', []),
                 "transaction_count": len(categorized_expenses),
-                "monthly_data": generate_monthly_data(dashboard_data.get('total', 0)),
-                "recent_transactions": format_recent_transactions(formatted_transactions, limit=10),
+                "monthly_data": dashboard_data.get('monthly_data') or spend_trend(formatted_transactions, categorized_expenses),
+                "recent_transactions": format_recent_transactions(formatted_transactions, limit=RECENT_LIMIT),
                 "date_range": {"start_date": start_date, "end_date": end_date} if start_date and end_date else None
-            })
-        
-        update_progress("Processing complete!", 100)
-        return jsonify({"status": "success", "message": "Data fetched successfully"})
+            }}
     except Exception as e:
         logging.error(f"Error fetching data: {str(e)}", exc_info=True)
         update_progress(f"Error: {str(e)}", 100)
-        return jsonify({"status": "error", "message": f"Error: {str(e)}"})
+        raise
 
 @app.route('/fetch_n8n_data', methods=['POST'])
 def fetch_n8n_data():
@@ -598,32 +1068,26 @@ def fetch_n8n_data():
         
         logging.info(f"Fetch n8n data requested with start_date={start_date}, end_date={end_date}")
         
-        # Reset progress for new request
-        update_progress("Initializing n8n transaction fetch...", 5)
-        
         # Fetch transactions from n8n using PRODUCTION mode
         # This will use the activated workflow instead of test mode
-        transactions = fetch_transactions(start_date, end_date, test_mode=False)
-        
-        # Log the raw transactions for debugging
-        logging.info(f"Raw n8n response: {json.dumps(transactions, indent=2)[:1000]}...")
+        result = fetch_transactions(start_date, end_date, test_mode=False)
+        transactions = result.transactions
         
         if not transactions:
-            update_progress("No transactions found", 100)
             return jsonify({
                 "status": "warning", 
-                "message": "No transactions found for the specified date range. Make sure your n8n workflow is ACTIVATED.",
+                "message": N8N_WARNINGS.get(
+                    result.error_kind,
+                    "No transactions found for the specified date range. Make sure your n8n workflow is ACTIVATED."
+                ),
+                "error_kind": result.error_kind,
                 "transaction_count": 0
             })
         
         logging.info(f"n8n API returned {len(transactions)} transactions")
-        update_progress(f"Processing {len(transactions)} transactions for categorization...", 80)
         
         # Process transactions for dashboard display
-        processed_data = process_transactions(transactions)
-        
-        # Update progress
-        update_progress("Completed successfully", 100)
+        processed_data = process_transactions(result.records)
         
         # Return the processed data for immediate display
         return jsonify({
@@ -640,13 +1104,10 @@ def fetch_n8n_data():
         
     except Exception as e:
         logging.error(f"Error fetching data from n8n: {str(e)}", exc_info=True)
-        update_progress(f"Error: {str(e)}", 100)
         return jsonify({"status": "error", "message": f"Error: {str(e)}"})
 
 def process_categorized_expenses(categorized_expenses):
     """Process categorized expenses for dashboard display"""
-    global current_progress
-    
     app.logger.info("Processing categorized expenses for dashboard")
     
     # Initialize data structures
@@ -694,26 +1155,16 @@ def process_categorized_expenses(categorized_expenses):
     total_expenses = sum(expense_values)
     app.logger.info(f"Total expenses: {total_expenses}")
     
-    # Generate monthly data for the spending trend
-    months = ["Jan", "Feb", "Mar", "Apr", "May"]
-    monthly_data = []
-    
-    # Create a simple trend based on total expenses
-    monthly_avg = total_expenses / len(months) if len(months) > 0 else 0
-    for _ in months:
-        # Add some random variation
-        variation = 0.8 + (0.4 * random.random())
-        monthly_data.append(round(monthly_avg * variation))
+    # Spending trend from the expenses that carry a date (the model's list rows do not)
+    trend = SpendIndex.from_transactions([
+        TransactionRecord.from_dict(expense) for expense in categorized_expenses if isinstance(expense, dict)
+    ])
+    monthly_totals = trend.monthly_totals()
+    months = list(monthly_totals.keys())
+    monthly_data = list(monthly_totals.values())
     
     app.logger.info("Successfully prepared data for dashboard")
     
-    # Update progress to completed
-    current_progress = {
-        "progress": 100,
-        "status": "Completed",
-        "last_update": time.time()
-    }
-    
     return {
         "expense_categories": expense_categories,
         "expense_values": expense_values,
@@ -763,9 +1214,12 @@ def create_basic_categorization(transactions):
         # Also initialize 'Other' category
         result['categories']['Other'] = 0
             
+        # Month of every transaction, from one conversion of all the dates
+        months = month_keys(day_numbers([tx.get('date') for tx in transactions]))
+        
         # Process each transaction
         categorized_transactions = []
-        for tx in transactions:
+        for tx, month_key in zip(transactions, months):
             amount = float(tx.get('amount', 0))
             recipient = tx.get('recipient', '').lower()
             date = tx.get('date', '')
@@ -794,20 +1248,11 @@ def create_basic_categorization(transactions):
                 'category': assigned_category
             })
             
-            # Update monthly data
-            try:
-                # Try to parse the date to extract month
-                date_obj = datetime.strptime(date, '%Y-%m-%d')
-                month_key = date_obj.strftime('%Y-%m')
-                
-                if month_key not in result['monthly_data']:
-                    result['monthly_data'][month_key] = 0
-                result['monthly_data'][month_key] += amount
-            except:
-                # If date parsing fails, use 'Unknown' as month
-                if 'Unknown' not in result['monthly_data']:
-                    result['monthly_data']['Unknown'] = 0
-                result['monthly_data']['Unknown'] += amount
+            # Update monthly data ('Unknown' if the date could not be read)
+            month_key = month_key or 'Unknown'
+            if month_key not in result['monthly_data']:
+                result['monthly_data'][month_key] = 0
+            result['monthly_data'][month_key] += amount
         
         # Calculate total expense
         result['total_expense'] = sum(result['categories'].values())
@@ -829,7 +1274,37 @@ def create_basic_categorization(transactions):
         return {}
 
 def send_to_dashboard(categorized_expenses):
-    """Save categorized expenses to the session for display on the dashboard"""
+    """Save categorized expenses for display on the dashboard"""
+    dashboard_data = build_dashboard_data(categorized_expenses)
+    if dashboard_data is None:
+        return False
+    
+    save_dashboard_data(dashboard_data)
+    
+    logging.info("Successfully stored dashboard data")
+    return True
+
+def save_dashboard_data(dashboard_data):
+    """Keep dashboard data in the server-side store and its key in the session"""
+    session['dashboard_key'] = dashboard_store.put(
+        session.get('user_id'), dashboard_data, session.get('dashboard_key')
+    )
+
+def load_dashboard_data():
+    """The current user's dashboard data, or an empty dict"""
+    # Sessions from before the server-side store carry the data in the cookie itself
+    legacy_data = session.pop('dashboard_data', None)
+    if legacy_data:
+        save_dashboard_data(legacy_data)
+        return legacy_data
+    
+    dashboard_key = session.get('dashboard_key')
+    if not dashboard_key:
+        return {}
+    return dashboard_store.get(dashboard_key, session.get('user_id')) or {}
+
+def build_dashboard_data(categorized_expenses):
+    """Aggregate categorized expenses into the data the dashboard displays (None on error)"""
     try:
         # Log the incoming data for debugging
         logging.info(f"Processing {len(categorized_expenses)} categorized expenses for dashboard display")
@@ -906,85 +1381,41 @@ def send_to_dashboard(categorized_expenses):
         logging.info(f"Categories: {list(categories.keys())}")
         logging.info(f"Total amount: {total}")
         
-        # Store in session
-        session['dashboard_data'] = dashboard_data
-        
-        logging.info("Successfully stored dashboard data in session")
-        return True
+        return dashboard_data
     except Exception as e:
         logging.error(f"Error processing categorized expenses: {str(e)}", exc_info=True)
-        return False
+        return None
 
-def generate_monthly_data(total_expenses):
-    """Generate monthly data for the spending trend"""
-    months = ["Jan", "Feb", "Mar", "Apr", "May"]
-    monthly_data = []
-    
-    # Create a simple trend based on total expenses
-    monthly_avg = total_expenses / len(months) if len(months) > 0 else 0
-    for _ in months:
-        # Add some random variation
-        variation = 0.8 + (0.4 * random.random())
-        monthly_data.append(round(monthly_avg * variation))
-    
-    return monthly_data
+def spend_trend(transactions, categorized_expenses):
+    """{'Mon YYYY': total} for a job's transactions, when they are not stored for a user"""
+    categorized = attach_categories(transactions, categorized_expenses)
+    # The pipeline has already converted the dates of the transactions it formatted
+    days = [tx.day for tx in categorized]
+    if any(day is None for day in days):
+        days = None
+    return SpendIndex.from_transactions(categorized, days=days).monthly_totals()
 
 def format_recent_transactions(transactions, limit=None):
     """Format recent transactions for display
     
     Args:
-        transactions: List of transaction dictionaries
+        transactions: List of TransactionRecords or transaction dictionaries
         limit: Optional limit on number of transactions to return (default: return all)
     
     Returns:
         List of formatted transaction dictionaries
     """
-    formatted_transactions = []
+    records = [TransactionRecord.from_dict(tx) for tx in transactions]
     
-    # Sort transactions by date (most recent first)
-    sorted_transactions = sorted(
-        transactions, 
-        key=lambda x: x.get('date', '0000-00-00'),
-        reverse=True
-    )
-    
-    # Apply limit if specified
+    # Most recent first; with a limit only the top entries are selected (O(n log limit))
     if limit and isinstance(limit, int) and limit > 0:
-        transactions_to_format = sorted_transactions[:limit]
+        transactions_to_format = heapq.nlargest(limit, records, key=lambda x: x.date or '0000-00-00')
     else:
-        transactions_to_format = sorted_transactions
+        transactions_to_format = sorted(records, key=lambda x: x.date or '0000-00-00', reverse=True)
     
-    # Format each transaction
-    for tx in transactions_to_format:
-        try:
-            # Ensure date is formatted correctly
-            date_str = tx.get('date', '')
-            
-            # Format amount to ensure it's a float
-            try:
-                amount = float(tx.get('amount', 0))
-            except (ValueError, TypeError):
-                amount = 0
-            
-            formatted_transactions.append({
-                'date': date_str,
-                'amount': amount,
-                'recipient': tx.get('recipient', 'Unknown'),
-                'description': tx.get('recipient', 'Unknown'),  # Add description for dashboard display
-                'category': tx.get('category', 'Other'),        # Add category if available
-                'txn_id': tx.get('txn_id', ''),
-                'txn_status': tx.get('txn_status', ''),
-                'payment_mode': tx.get('payment_mode', ''),
-                'type': tx.get('type', '')
-            })
-        except Exception as e:
-            logging.warning(f"Error formatting transaction: {str(e)}")
-            # Skip problematic transactions
-            continue
-            
-    return formatted_transactions
+    return [tx.to_dict() for tx in transactions_to_format]
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
     app.run(debug=True) 
\ No newline at end of file
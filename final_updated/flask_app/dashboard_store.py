@@ -0,0 +1,60 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Dashboards not updated or viewed for this many seconds are dropped
+DASHBOARD_TTL = 7 * 24 * 3600
+
+
+class DashboardStore:
+    """Dashboard data kept on the server, one entry per session key
+
+    The session cookie only carries the short key, so request and response sizes do
+    not grow with the number of expenses. Entries remember their owner and are only
+    handed back to that user. The least recently used entries are evicted once
+    max_entries is reached.
+    """
+
+    def __init__(self, max_entries=1000, ttl=DASHBOARD_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, owner, data, key=None):
+        """Store data for owner under key (a new key if missing or not theirs); returns the key"""
+        with self.lock:
+            entry = self.entries.get(key) if key else None
+            if entry is None or entry["owner"] != owner:
+                key = secrets.token_urlsafe(16)
+            self.entries[key] = {"owner": owner, "data": data, "touched_at": time.time()}
+            self.entries.move_to_end(key)
+            self._evict()
+            return key
+
+    def get(self, key, owner):
+        """The owner's data stored under key, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry["owner"] != owner:
+                return None
+            if time.time() - entry["touched_at"] > self.ttl:
+                del self.entries[key]
+                return None
+            entry["touched_at"] = time.time()
+            self.entries.move_to_end(key)
+            return entry["data"]
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def _evict(self):
+        """Drop expired and least recently used entries; called with self.lock held"""
+        cutoff = time.time() - self.ttl
+        while self.entries:
+            oldest_key, oldest = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_entries and oldest["touched_at"] >= cutoff:
+                break
+            del self.entries[oldest_key]
@@ -0,0 +1,131 @@
+import logging
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Day number given to dates that cannot be read
+MISSING_DAY = np.iinfo(np.int64).min
+
+# Ordinal of day number 0 (1970-01-01)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Formats a source's dates may be in, tried in this order when inferring one (so an
+# ambiguous 01/02/2025 is read day first, as the scraper's old cascade did)
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y', '%Y/%m/%d', '%d %b %Y', '%b %d, %Y']
+
+# Values looked at when inferring a format
+SAMPLE_SIZE = 200
+
+# Format last inferred for each named source ('gmail', 'n8n', ...)
+source_formats = {}
+source_formats_lock = threading.Lock()
+
+
+def _date_strings(values):
+    """Values as stripped strings, with None, NaN and NaT as ''"""
+    series = pd.Series(list(values), dtype=object)
+    return series.where(series.notna(), '').astype(str).str.strip()
+
+
+def _parse(strings, fmt):
+    """Timestamps for strings in fmt (NaT where they do not match), in one vectorised call"""
+    if '%b' not in fmt:
+        # Numeric formats: ignore a time part ('2025-01-05 10:30', '2025-01-05T10:30:00')
+        strings = strings.str.split(r'[T\s]', n=1, regex=True).str[0]
+    return pd.to_datetime(strings, format=fmt, errors='coerce')
+
+
+def infer_date_format(strings):
+    """The format in DATE_FORMATS that reads the most of a sample of strings (None if none reads any)"""
+    present = strings[strings != '']
+    if present.empty:
+        return None
+    step = max(1, len(present) // SAMPLE_SIZE)
+    sample = present.iloc[::step].iloc[:SAMPLE_SIZE]
+    best, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        count = int(_parse(sample, fmt).notna().sum())
+        if count > best_count:
+            best, best_count = fmt, count
+        if count == len(sample):
+            break
+    return best
+
+
+def day_numbers(values, source=None):
+    """Day numbers (days since 1970-01-01) for a batch of dates; MISSING_DAY where unreadable
+
+    Values may be strings in any of DATE_FORMATS, dates or datetimes. The batch is
+    converted with one vectorised parse in the source's format, which is inferred from
+    a sample the first time a source is seen and remembered. Values that do not match
+    it (a source that mixes formats) are retried with the other formats.
+    """
+    strings = _date_strings(values)
+    if strings.empty:
+        return np.empty(0, dtype=np.int64)
+
+    with source_formats_lock:
+        fmt = source_formats.get(source) if source else None
+    if fmt is None:
+        fmt = infer_date_format(strings)
+        if source and fmt:
+            with source_formats_lock:
+                source_formats[source] = fmt
+            logging.info(f"Dates from {source} are read as {fmt}")
+
+    parsed = _parse(strings, fmt) if fmt else pd.Series(pd.NaT, index=strings.index)
+    unread = parsed.isna() & (strings != '')
+    for other in DATE_FORMATS:
+        if not unread.any():
+            break
+        if other == fmt:
+            continue
+        parsed[unread] = _parse(strings[unread], other)
+        unread = parsed.isna() & (strings != '')
+
+    days = parsed.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    numbers = days.astype(np.int64)
+    numbers[np.isnat(days)] = MISSING_DAY
+    return numbers
+
+
+def to_day(value):
+    """Day number of a single date, datetime or 'YYYY-MM-DD...' string; None if empty"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH_ORDINAL
+    return int(np.datetime64(str(value)[:10], 'D').astype(np.int64))
+
+
+def to_date(day):
+    """datetime.date for a day number"""
+    return date.fromordinal(int(day) + EPOCH_ORDINAL)
+
+
+def iso_dates(days):
+    """'YYYY-MM-DD' for each day number, None where MISSING_DAY"""
+    days = np.asarray(days, dtype=np.int64)
+    missing = days == MISSING_DAY
+    strings = np.datetime_as_string(np.where(missing, 0, days).astype('datetime64[D]'), unit='D')
+    return [None if gone else text for text, gone in zip(strings.tolist(), missing.tolist())]
+
+
+def month_keys(days):
+    """'YYYY-MM' for each day number, None where MISSING_DAY"""
+    return [text[:7] if text else None for text in iso_dates(days)]
+
+
+def in_range(days, start_date=None, end_date=None):
+    """Boolean mask of days within [start_date, end_date]; unreadable days are kept"""
+    mask = np.ones(len(days), dtype=bool)
+    start, end = to_day(start_date), to_day(end_date)
+    if start is not None:
+        mask &= days >= start
+    if end is not None:
+        mask &= days <= end
+    return mask | (days == MISSING_DAY)
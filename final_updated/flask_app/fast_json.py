@@ -0,0 +1,101 @@
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson and brotli are optional: without them responses use the standard json
+# module and gzip only
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = 1024
+
+# Fast settings suited to compressing each response as it is sent
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify via orjson when it is installed, writing the bytes straight into the response
+
+    Keys keep their insertion order (e.g. monthly totals stay in date order) instead
+    of being sorted. Dates and datetimes are passed to Flask's default hook, so they
+    come out as HTTP dates as with the standard provider, not as orjson's ISO strings.
+    """
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._orjson_dumps(obj) + b"\n", mimetype=self.mimetype)
+
+    def _orjson_dumps(self, obj):
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+
+
+def choose_encoding(accept_encodings):
+    """The best content coding the client accepts ('br' or 'gzip'), or None"""
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(candidates)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response, accept_encodings, encoded=None):
+    """Compress a finished JSON response in place if it is large enough and the client accepts it
+
+    encoded, if given, is a dictionary of already compressed bodies by encoding; new
+    ones are added to it so a cached response is compressed only once.
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if encoded is not None and encoding in encoded:
+        compressed = encoded[encoding]
+    else:
+        compressed = compress(body, encoding)
+        if encoded is not None:
+            encoded[encoding] = compressed
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the identity body the ETag was computed on
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Seconds a finished job (and its result) is kept for its owner to collect
+JOB_TTL = 3600
+
+
+class QueueFull(Exception):
+    """Too many jobs are already waiting for a worker"""
+
+
+class Job:
+    """One background run of a long task, with its progress and result
+
+    key identifies the job's parameters for submit_once (None for jobs submitted
+    without one).
+    """
+
+    def __init__(self, kind, owner=None, key=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.key = key
+        self.state = 'queued'
+        self.progress = {"status": "Queued", "percent": 0}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+        # Bumped on every progress or state change; watchers wait on `changed`
+        self.version = 0
+        self.changed = threading.Condition(self.lock)
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    def update_progress(self, status, percent):
+        """Progress callback handed to the task; percent is 0-100 and never moves backwards"""
+        with self.lock:
+            previous = self.progress.get("percent", 0)
+            percent = previous if percent is None else max(previous, min(100, float(percent)))
+            self.progress = {"status": status, "percent": round(percent, 1), "last_update": time.time()}
+            self._touch()
+
+    def stage(self, start, end):
+        """Progress callback for one step of the job, mapping its 0-100 onto start-end"""
+        def update(status, percent):
+            self.update_progress(status, None if percent is None else start + (end - start) * float(percent) / 100)
+        return update
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job changes past version (or timeout); returns the current version"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _touch(self):
+        """Record a change; called with self.lock held"""
+        self.version += 1
+        self.changed.notify_all()
+
+    def to_dict(self, include_result=True):
+        with self.lock:
+            data = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "state": self.state,
+                "progress": dict(self.progress),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at
+            }
+            if include_result and self.state == 'succeeded':
+                data["result"] = self.result
+            return data
+
+
+class JobQueue:
+    """Runs jobs on a bounded worker pool and keeps them by ID until they expire
+
+    At most max_workers jobs run at once; up to max_pending more wait in the queue,
+    beyond which submit raises QueueFull.
+    """
+
+    def __init__(self, max_workers=2, max_pending=20, ttl=JOB_TTL):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, owner=None, **kwargs):
+        """Queue fn(job, *args, **kwargs); its return value becomes the job result"""
+        with self.lock:
+            job = self._add(kind, owner)
+        self._start(job, fn, args, kwargs)
+        return job
+
+    def submit_once(self, kind, fn, *args, owner=None, key=None, **kwargs):
+        """The owner's queued or running job of this kind and key, or else a newly submitted one
+
+        key is a string identifying the parameters the job runs with, so a request
+        with different parameters does not get a job that ignores them. The check and
+        the submit happen as one step, so concurrent identical requests from the same
+        owner share a single job.
+        """
+        with self.lock:
+            for job in self.jobs.values():
+                if job.kind == kind and job.owner == owner and job.key == key and job.active:
+                    return job
+            job = self._add(kind, owner, key)
+        self._start(job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def active_job(self, kind, owner):
+        """The owner's queued or running job of this kind, if any"""
+        with self.lock:
+            for job in self.jobs.values():
+                if job.kind == kind and job.owner == owner and job.active:
+                    return job
+        return None
+
+    def latest_job(self, owner, kind=None):
+        """The owner's most recently created job (of this kind), if any"""
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if job.owner == owner and kind in (None, job.kind)]
+        return max(jobs, key=lambda job: job.created_at) if jobs else None
+
+    def _add(self, kind, owner, key=None):
+        """Create and keep a queued job, or raise QueueFull; called with self.lock held"""
+        self._prune()
+        pending = sum(1 for job in self.jobs.values() if job.state == 'queued')
+        if pending >= self.max_pending:
+            raise QueueFull(f"{pending} jobs are already waiting")
+        job = Job(kind, owner, key)
+        self.jobs[job.id] = job
+        return job
+
+    def _start(self, job, fn, args, kwargs):
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        logging.info(f"Queued {job.kind} job {job.id} for owner {job.owner}")
+
+    def _run(self, job, fn, args, kwargs):
+        with job.lock:
+            job.state = 'running'
+            job.started_at = time.time()
+            job._touch()
+        try:
+            result = fn(job, *args, **kwargs)
+            with job.lock:
+                job.result = result
+                job.state = 'succeeded'
+                job.finished_at = time.time()
+                job._touch()
+        except Exception as e:
+            logging.error(f"Job {job.id} ({job.kind}) failed: {str(e)}", exc_info=True)
+            with job.lock:
+                job.error = str(e)
+                job.state = 'failed'
+                job.finished_at = time.time()
+                job._touch()
+        logging.info(f"Job {job.id} finished as {job.state} in {job.finished_at - job.started_at:.1f}s")
+
+    def _prune(self):
+        """Drop finished jobs older than the TTL; called with self.lock held"""
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
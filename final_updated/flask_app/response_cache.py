@@ -0,0 +1,98 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached response is served before its view runs again, as a backstop:
+# entries are dropped as soon as the owner's revision moves on. Only responses built
+# from stored data are cached; upstream (n8n) data has no revision to follow.
+RESPONSE_TTL = 300
+
+
+class CachedResponse:
+    """A serialized response body with its ETag and the data revision it was built from
+
+    encoded holds compressed copies of the body by content coding, filled on demand.
+    """
+
+    __slots__ = ('body', 'mimetype', 'etag', 'revision', 'created_at', 'encoded')
+
+    def __init__(self, body, mimetype, revision):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.revision = revision
+        self.created_at = time.time()
+        self.encoded = {}
+
+
+class Revisions:
+    """Per-owner data revision counters, kept in this process
+
+    Each owner (user ID, or None for anonymous callers) has a counter that bump()
+    advances whenever their data changes; anything derived from the data remembers
+    the revision it was built from.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def get(self, owner):
+        with self.lock:
+            return self.counts.get(owner, 0)
+
+    def bump(self, owner):
+        with self.lock:
+            self.counts[owner] = self.counts.get(owner, 0) + 1
+
+
+class ResponseCache:
+    """Serialized responses keyed by (owner, key), valid for one revision of the owner's data
+
+    Bumping an owner's revision invalidates all of their entries at once. The least
+    recently used entries are evicted once max_entries is reached. revisions may be
+    shared between processes (shared_state.SharedRevisions) while the entries stay
+    local to each one.
+    """
+
+    def __init__(self, max_entries=500, ttl=RESPONSE_TTL, revisions=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.revisions = revisions if revisions is not None else Revisions()
+        self.lock = threading.Lock()
+
+    def revision(self, owner):
+        return self.revisions.get(owner)
+
+    def bump(self, owner):
+        """Record that the owner's data changed; their cached responses stop being served"""
+        self.revisions.bump(owner)
+
+    def get(self, owner, key, revision=None):
+        """The cached response for the owner's current revision (or the one given), or None"""
+        if revision is None:
+            revision = self.revisions.get(owner)
+        with self.lock:
+            entry = self.entries.get((owner, key))
+            if entry is None:
+                return None
+            if entry.revision != revision or time.time() - entry.created_at > self.ttl:
+                del self.entries[(owner, key)]
+                return None
+            self.entries.move_to_end((owner, key))
+            return entry
+
+    def put(self, owner, key, body, mimetype, revision):
+        """Cache body as built from the owner's data at revision; returns the entry"""
+        entry = CachedResponse(body, mimetype, revision)
+        # Data changed while the response was being built, so it may already be stale
+        if revision != self.revisions.get(owner):
+            return entry
+        with self.lock:
+            self.entries[(owner, key)] = entry
+            self.entries.move_to_end((owner, key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
@@ -0,0 +1,406 @@
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from dashboard_store import DASHBOARD_TTL
+from jobs import JOB_TTL, Job, JobQueue, QueueFull
+
+# Seconds between reads of a job row by a process that is not running the job
+POLL_INTERVAL = 0.25
+
+# Seconds between the heartbeats a process writes for the jobs it holds, and after
+# which a queued or running job without one counts as abandoned (its process died,
+# even if the pid has since been reused)
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner INTEGER,
+    state TEXT NOT NULL,
+    progress TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    version INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    heartbeat REAL NOT NULL DEFAULT 0,
+    dedupe_key TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_owner_created ON jobs (owner, created_at);
+CREATE TABLE IF NOT EXISTS dashboards (
+    key TEXT PRIMARY KEY,
+    owner INTEGER,
+    data TEXT NOT NULL,
+    touched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_dashboards_touched ON dashboards (touched_at);
+CREATE TABLE IF NOT EXISTS revisions (
+    owner TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+"""
+
+
+def process_alive(pid):
+    """Whether a process on this machine is still running (always True where it cannot be checked)"""
+    if pid == os.getpid() or os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class StateDB:
+    """The SQLite file shared by every worker process, with one connection per thread
+
+    Connections are opened lazily and never reused across a fork, so the object can
+    be created before a pre-forking server starts its workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        conn = self.connect()
+        conn.executescript(SCHEMA)
+        # Files created before jobs had heartbeats or dedupe keys
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'heartbeat' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat REAL NOT NULL DEFAULT 0')
+        if 'dedupe_key' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN dedupe_key TEXT')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connect().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Run statements as one write transaction; BEGIN IMMEDIATE takes the write lock
+        up front, so no other process can change the file in between"""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+
+class SharedJob(Job):
+    """A job run by this process whose changes are written through to the jobs table"""
+
+    def __init__(self, kind, owner=None, queue=None, key=None):
+        super().__init__(kind, owner, key)
+        self.queue = queue
+
+    def _touch(self):
+        super()._touch()
+        self.queue.save_job(self)
+
+
+class JobSnapshot(Job):
+    """A job running in another process, read from its row and refreshed by polling"""
+
+    def __init__(self, queue, row):
+        super().__init__(row['kind'], row['owner'], row['dedupe_key'])
+        self.queue = queue
+        self.id = row['id']
+        self.load(row)
+
+    def load(self, row):
+        with self.lock:
+            self.state = row['state']
+            self.progress = json.loads(row['progress'])
+            self.result = json.loads(row['result']) if row['result'] else None
+            self.error = row['error']
+            self.created_at = row['created_at']
+            self.started_at = row['started_at']
+            self.finished_at = row['finished_at']
+            self.version = row['version']
+
+    def refresh(self):
+        row = self.queue.load_row(self.id)
+        if row is not None and row['state'] in ('queued', 'running'):
+            # Fail the job first if the process running it has died or stopped beating
+            self.queue._expire_stale()
+            row = self.queue.load_row(self.id)
+        if row is not None:
+            self.load(row)
+
+    def wait_for_change(self, version, timeout):
+        deadline = time.time() + timeout
+        while True:
+            self.refresh()
+            remaining = deadline - time.time()
+            if self.version != version or remaining <= 0:
+                return self.version
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+
+class SharedJobQueue(JobQueue):
+    """JobQueue whose jobs are visible to every worker process
+
+    Jobs run on this process's worker pool, but their state, progress and result are
+    kept in the shared database, so any worker can report on them, deduplicate
+    against them and count them towards max_pending. A job is claimed with a single
+    INSERT in a write transaction, so concurrent requests in different processes
+    cannot both create it. The process holding a job writes a heartbeat for it every
+    HEARTBEAT_INTERVAL seconds; jobs left unfinished by a process that has died, or
+    whose heartbeat is older than STALE_AFTER, are marked failed when jobs are next
+    looked up (checked at most once per HEARTBEAT_INTERVAL). The row of a job marked
+    failed that way is not overwritten if the job later finishes after all.
+    """
+
+    def __init__(self, state_db, max_workers=2, max_pending=20, ttl=JOB_TTL):
+        super().__init__(max_workers=max_workers, max_pending=max_pending, ttl=ttl)
+        self.db = state_db
+        self.heartbeat_pid = None
+        # When this process last looked for abandoned jobs
+        self.expired_at = 0
+
+    def submit(self, kind, fn, *args, owner=None, **kwargs):
+        job, created = self._claim(kind, owner, None, unique=False)
+        self._start(job, fn, args, kwargs)
+        return job
+
+    def submit_once(self, kind, fn, *args, owner=None, key=None, **kwargs):
+        job, created = self._claim(kind, owner, key, unique=True)
+        if created:
+            self._start(job, fn, args, kwargs)
+        return job
+
+    def _claim(self, kind, owner, key, unique):
+        """Insert a queued job row unless the queue is full, raising QueueFull
+
+        If unique and the owner already has an active job of this kind and key,
+        nothing is inserted and that job is returned instead. Returns (job, created).
+        """
+        with self.lock:
+            self._prune()
+            job = SharedJob(kind, owner, self, key)
+            with self.db.transaction():
+                self._expire_stale(force=True)
+                cursor = self.db.execute(
+                    'INSERT INTO jobs (id, kind, owner, state, progress, result, error, created_at, started_at, '
+                    'finished_at, version, pid, heartbeat, dedupe_key) '
+                    'SELECT ?, ?, ?, ?, ?, NULL, NULL, ?, NULL, NULL, 0, ?, ?, ? '
+                    "WHERE (SELECT COUNT(*) FROM jobs WHERE state = 'queued') < ? "
+                    "AND NOT (? AND EXISTS (SELECT 1 FROM jobs WHERE kind = ? AND owner IS ? "
+                    "AND dedupe_key IS ? AND state IN ('queued', 'running')))",
+                    (
+                        job.id, kind, owner, job.state, json.dumps(job.progress), job.created_at, os.getpid(),
+                        time.time(), key, self.max_pending, unique, kind, owner, key
+                    )
+                )
+                if cursor.rowcount == 0:
+                    row = self.db.execute(
+                        "SELECT id FROM jobs WHERE kind = ? AND owner IS ? AND dedupe_key IS ? "
+                        "AND state IN ('queued', 'running') ORDER BY created_at DESC LIMIT 1",
+                        (kind, owner, key)
+                    ).fetchone() if unique else None
+                    if row is None:
+                        pending = self.db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+                        raise QueueFull(f"{pending} jobs are already waiting")
+                    existing_id = row['id']
+                else:
+                    existing_id = None
+                    self.jobs[job.id] = job
+        if existing_id is not None:
+            return self.get(existing_id), False
+        self._start_heartbeat()
+        return job, True
+
+    def _start(self, job, fn, args, kwargs):
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        logging.info(f"Queued {job.kind} job {job.id} for owner {job.owner} in process {os.getpid()}")
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        row = self.load_row(job_id)
+        return JobSnapshot(self, row) if row is not None else None
+
+    def active_job(self, kind, owner):
+        rows = self._active_rows('AND kind = ? AND owner IS ?', (kind, owner))
+        return self.get(rows[0]['id']) if rows else None
+
+    def latest_job(self, owner, kind=None):
+        row = self.db.execute(
+            'SELECT id FROM jobs WHERE owner IS ? AND (? IS NULL OR kind = ?) ORDER BY created_at DESC LIMIT 1',
+            (owner, kind, kind)
+        ).fetchone()
+        return self.get(row['id']) if row is not None else None
+
+    def save_job(self, job):
+        """Write a job's changes to its row (inserted by _claim); called with job.lock held
+
+        A row another process has already marked finished (see _expire_stale) is left
+        as it is, and the job takes on its state instead.
+        """
+        updated = self.db.execute(
+            'UPDATE jobs SET state = ?, progress = ?, result = ?, error = ?, started_at = ?, finished_at = ?, '
+            "version = ?, pid = ?, heartbeat = ? WHERE id = ? AND state IN ('queued', 'running')",
+            (
+                job.state, json.dumps(job.progress),
+                json.dumps(job.result, default=str) if job.result is not None else None,
+                job.error, job.started_at, job.finished_at, job.version, os.getpid(), time.time(), job.id
+            )
+        ).rowcount
+        if not updated:
+            row = self.load_row(job.id)
+            if row is not None:
+                job.state, job.error, job.finished_at = row['state'], row['error'], row['finished_at']
+
+    def load_row(self, job_id):
+        return self.db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def _active_rows(self, condition='', params=()):
+        """Queued and running job rows (newest first), after failing abandoned ones"""
+        self._expire_stale()
+        return self.db.execute(
+            f"SELECT * FROM jobs WHERE state IN ('queued', 'running') {condition} ORDER BY created_at DESC", params
+        ).fetchall()
+
+    def _expire_stale(self, force=False):
+        """Mark failed the active jobs whose process has exited or whose heartbeat stopped
+
+        Runs at most once per HEARTBEAT_INTERVAL in each process (heartbeats do not
+        change any faster), unless forced.
+        """
+        now = time.time()
+        if not force and now - self.expired_at < HEARTBEAT_INTERVAL:
+            return
+        self.expired_at = now
+        expired = self.db.execute(
+            "UPDATE jobs SET state = 'failed', error = ?, finished_at = ?, version = version + 1 "
+            "WHERE state IN ('queued', 'running') AND heartbeat < ?",
+            ('The worker running this job stopped responding', now, now - STALE_AFTER)
+        ).rowcount
+        if expired:
+            logging.warning(f"Failed {expired} jobs without a heartbeat for {STALE_AFTER}s")
+        for row in self.db.execute("SELECT id, state, pid FROM jobs WHERE state IN ('queued', 'running')").fetchall():
+            if process_alive(row['pid']):
+                continue
+            logging.warning(f"Job {row['id']} was left {row['state']} by process {row['pid']}, which has exited")
+            self.db.execute(
+                "UPDATE jobs SET state = 'failed', error = ?, finished_at = ?, version = version + 1 "
+                "WHERE id = ? AND state IN ('queued', 'running')",
+                ('The worker running this job exited', now, row['id'])
+            )
+
+    def _start_heartbeat(self):
+        """Start this process's heartbeat thread (once per process, so also after a fork)"""
+        with self.lock:
+            if self.heartbeat_pid == os.getpid():
+                return
+            self.heartbeat_pid = os.getpid()
+        threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True).start()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self.lock:
+                job_ids = [job.id for job in self.jobs.values() if job.active]
+            if not job_ids:
+                continue
+            try:
+                self.db.execute(
+                    f"UPDATE jobs SET heartbeat = ? WHERE id IN ({', '.join('?' * len(job_ids))}) "
+                    "AND state IN ('queued', 'running')",
+                    (time.time(), *job_ids)
+                )
+            except sqlite3.Error as e:
+                logging.warning(f"Could not write job heartbeat: {str(e)}")
+
+    def _prune(self):
+        super()._prune()
+        self.db.execute('DELETE FROM jobs WHERE finished_at < ?', (time.time() - self.ttl,))
+
+
+class SharedDashboardStore:
+    """DashboardStore kept in the shared database, so every worker sees a session's data"""
+
+    def __init__(self, state_db, max_entries=1000, ttl=DASHBOARD_TTL):
+        self.db = state_db
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def put(self, owner, data, key=None):
+        """Store data for owner under key (a new key if missing or not theirs); returns the key"""
+        row = self.db.execute('SELECT owner FROM dashboards WHERE key = ?', (key,)).fetchone() if key else None
+        if row is None or row['owner'] != owner:
+            key = secrets.token_urlsafe(16)
+        self.db.execute(
+            'INSERT OR REPLACE INTO dashboards (key, owner, data, touched_at) VALUES (?, ?, ?, ?)',
+            (key, owner, json.dumps(data, default=str), time.time())
+        )
+        self._evict()
+        return key
+
+    def get(self, key, owner):
+        """The owner's data stored under key, or None"""
+        row = self.db.execute('SELECT owner, data, touched_at FROM dashboards WHERE key = ?', (key,)).fetchone()
+        if row is None or row['owner'] != owner:
+            return None
+        if time.time() - row['touched_at'] > self.ttl:
+            self.delete(key)
+            return None
+        self.db.execute('UPDATE dashboards SET touched_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row['data'])
+
+    def delete(self, key):
+        self.db.execute('DELETE FROM dashboards WHERE key = ?', (key,))
+
+    def _evict(self):
+        """Drop expired entries and all but the max_entries most recently used"""
+        self.db.execute('DELETE FROM dashboards WHERE touched_at < ?', (time.time() - self.ttl,))
+        self.db.execute(
+            'DELETE FROM dashboards WHERE key IN '
+            '(SELECT key FROM dashboards ORDER BY touched_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+
+class SharedRevisions:
+    """Per-owner data revision counters in the shared database (see response_cache.Revisions)"""
+
+    def __init__(self, state_db):
+        self.db = state_db
+
+    def get(self, owner):
+        row = self.db.execute('SELECT revision FROM revisions WHERE owner = ?', (str(owner),)).fetchone()
+        return row['revision'] if row is not None else 0
+
+    def bump(self, owner):
+        self.db.execute(
+            'INSERT INTO revisions (owner, revision) VALUES (?, 1) '
+            'ON CONFLICT(owner) DO UPDATE SET revision = revision + 1',
+            (str(owner),)
+        )
@@ -0,0 +1,190 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from dates import MISSING_DAY, day_numbers, to_date, to_day
+
+
+class SpendIndex:
+    """Spend per category held as prefix sums over the days with transactions
+
+    days[c] are the distinct days category c has transactions on, in order, and
+    prefix[c][i] is the amount spent in it on days[c][:i] (counts likewise), so a
+    range total is two binary searches and a subtraction. Only days with data are
+    stored, so a stray date years away from the rest costs one entry, not one per
+    day in between. all_days and total_prefix do the same over all categories.
+    Transactions whose date cannot be read are left out.
+    """
+
+    def __init__(self, days, amounts, categories, counts=None):
+        days = np.asarray(days, dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        categories = np.asarray(categories, dtype=object).astype(str)
+        counts = np.ones(len(days), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        valid = days != MISSING_DAY
+        days, amounts, categories, counts = days[valid], amounts[valid], categories[valid], counts[valid]
+
+        names, codes = np.unique(categories, return_inverse=True)
+        self.categories = [str(name) for name in names]
+        self.first_day = int(days.min()) if len(days) else 0
+        self.last_day = int(days.max()) if len(days) else -1
+
+        self.all_days, day_codes = np.unique(days, return_inverse=True)
+        self.total_prefix = _prefix(np.bincount(day_codes.ravel(), weights=amounts, minlength=len(self.all_days)))
+
+        # One entry per (category, day): sort by both and sum each run of equal pairs
+        order = np.lexsort((days, codes))
+        codes, days, amounts, counts = codes.ravel()[order], days[order], amounts[order], counts[order]
+        new = np.ones(len(days), dtype=bool)
+        new[1:] = (codes[1:] != codes[:-1]) | (days[1:] != days[:-1])
+        runs = np.flatnonzero(new)
+        if len(runs):
+            amounts, counts = np.add.reduceat(amounts, runs), np.add.reduceat(counts, runs)
+        codes, days = codes[runs], days[runs]
+        bounds = np.searchsorted(codes, np.arange(len(names) + 1))
+        self.days = [days[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        self.prefix = [_prefix(amounts[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+        self.count_prefix = [_prefix(counts[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    @classmethod
+    def from_transactions(cls, transactions, default_category='Uncategorized', days=None, source=None):
+        """Index Transaction records (see transaction.py), whose amounts are already floats
+
+        days are the transactions' day numbers if already converted; otherwise their
+        dates are converted here (see dates.day_numbers for source).
+        """
+        if days is None:
+            days = day_numbers([tx.date for tx in transactions], source=source)
+        return cls(
+            days,
+            [tx.amount for tx in transactions],
+            [tx.category or default_category for tx in transactions]
+        )
+
+    @classmethod
+    def from_daily_rows(cls, rows):
+        """Index (date, category, total, count) rows, e.g. a GROUP BY date, category"""
+        rows = list(rows)
+        return cls(
+            day_numbers([row[0] for row in rows]),
+            [row[2] for row in rows],
+            [row[1] for row in rows],
+            [row[3] for row in rows]
+        )
+
+    @property
+    def empty(self):
+        return len(self.all_days) == 0
+
+    def _range(self, start_date=None, end_date=None):
+        """First and last day number of the inclusive date range, clipped to the index"""
+        start, end = to_day(start_date), to_day(end_date)
+        first = self.first_day if start is None else max(start, self.first_day)
+        last = self.last_day if end is None else min(end, self.last_day)
+        return first, last
+
+    @staticmethod
+    def _positions(days, first, last):
+        """Prefix positions (lo, hi) of the days within first..last"""
+        lo = int(np.searchsorted(days, first, 'left'))
+        return lo, max(lo, int(np.searchsorted(days, last, 'right')))
+
+    def total(self, start_date=None, end_date=None, category=None):
+        """Amount spent in the range, over all categories or just one"""
+        first, last = self._range(start_date, end_date)
+        if category is None:
+            days, prefix = self.all_days, self.total_prefix
+        elif category in self.categories:
+            c = self.categories.index(category)
+            days, prefix = self.days[c], self.prefix[c]
+        else:
+            return 0.0
+        lo, hi = self._positions(days, first, last)
+        return float(prefix[hi] - prefix[lo])
+
+    def category_totals(self, start_date=None, end_date=None):
+        """[(category, total, count)] for the range, largest total first, skipping empty categories"""
+        first, last = self._range(start_date, end_date)
+        totals = np.zeros(len(self.categories))
+        counts = np.zeros(len(self.categories), dtype=np.int64)
+        for c, days in enumerate(self.days):
+            lo, hi = self._positions(days, first, last)
+            totals[c] = self.prefix[c][hi] - self.prefix[c][lo]
+            counts[c] = self.count_prefix[c][hi] - self.count_prefix[c][lo]
+        return [
+            (self.categories[c], float(totals[c]), int(counts[c]))
+            for c in np.argsort(-totals, kind='stable') if counts[c]
+        ]
+
+    def _period_totals(self, period_starts, first, last, label):
+        """{label: total} for consecutive periods starting on the given day numbers, up to last"""
+        lo, hi = self._positions(self.all_days, first, last)
+        starts = np.clip(np.searchsorted(self.all_days, period_starts, 'left'), lo, hi)
+        edges = np.append(starts, hi)
+        totals = self.total_prefix[edges[1:]] - self.total_prefix[edges[:-1]]
+        return {label(day): round(float(total), 2) for day, total in zip(period_starts, totals)}
+
+    def monthly_totals(self, start_date=None, end_date=None):
+        """{'Mon YYYY': total} for every month the range touches, empty months included"""
+        first, last = self._range(start_date, end_date)
+        if last < first:
+            return {}
+        months = np.arange(
+            np.datetime64(first, 'D').astype('datetime64[M]'),
+            np.datetime64(last, 'D').astype('datetime64[M]') + 1
+        )
+        return self._period_totals(
+            months.astype('datetime64[D]').astype(np.int64), first, last,
+            lambda day: to_date(day).strftime('%b %Y')
+        )
+
+    def weekly_totals(self, start_date=None, end_date=None):
+        """{'YYYY-MM-DD' of the Monday: total} for every week the range touches"""
+        first, last = self._range(start_date, end_date)
+        if last < first:
+            return {}
+        # Day 0 (1970-01-01) was a Thursday
+        monday = first - (first + 3) % 7
+        return self._period_totals(
+            np.arange(monday, last + 1, 7, dtype=np.int64), first, last,
+            lambda day: str(np.datetime64(int(day), 'D'))
+        )
+
+
+def _prefix(values):
+    """Prefix sums of values, starting with 0"""
+    prefix = np.zeros(len(values) + 1, dtype=np.asarray(values).dtype if len(values) else np.float64)
+    np.cumsum(values, out=prefix[1:])
+    return prefix
+
+
+class SpendIndexCache:
+    """Per-user SpendIndex objects, rebuilt on first use after the user's data revision changes
+
+    revision(user_id) returns the user's current data revision (see
+    response_cache.Revisions), which may be shared with other processes. The least
+    recently used indexes are dropped once max_entries users have one.
+    """
+
+    def __init__(self, build, revision, max_entries=200):
+        self.build = build
+        self.revision = revision
+        self.max_entries = max_entries
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        revision = self.revision(user_id)
+        with self.lock:
+            cached = self.indexes.get(user_id)
+            if cached is not None and cached[0] == revision:
+                self.indexes.move_to_end(user_id)
+                return cached[1]
+        index = self.build(user_id)
+        with self.lock:
+            self.indexes[user_id] = (revision, index)
+            self.indexes.move_to_end(user_id)
+            while len(self.indexes) > self.max_entries:
+                self.indexes.popitem(last=False)
+        return index
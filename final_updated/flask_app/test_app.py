@@ -0,0 +1,95 @@
+import os
+import tempfile
+from datetime import date
+
+import pytest
+
+# The app reads its database URL on import
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+from app import SpendRollup, Transaction, app, db, init_db, rebuild_rollups, save_transactions, transaction_page
+
+USER_ID = 1
+
+
+@pytest.fixture
+def ctx():
+    with app.app_context():
+        init_db()
+        yield
+        db.session.rollback()
+        Transaction.query.delete()
+        SpendRollup.query.delete()
+        db.session.commit()
+
+
+def rollups():
+    return {
+        (row.month, row.category): (round(row.total, 2), row.count)
+        for row in SpendRollup.query.filter_by(user_id=USER_ID)
+    }
+
+
+def tx(txn_id, day, category, amount, description='Shop'):
+    return {'txn_id': txn_id, 'date': day, 'description': description, 'category': category, 'amount': amount}
+
+
+def test_rollups_follow_upserts(ctx):
+    save_transactions(USER_ID, [
+        tx('a', '2025-01-05', 'Food', 10),
+        tx('b', '2025-01-20', 'Food', 5),
+        tx('c', '2025-02-01', 'Travel', 30),
+    ])
+    assert rollups() == {('2025-01', 'Food'): (15, 2), ('2025-02', 'Travel'): (30, 1)}
+
+    # Recategorize one row, move another to a new month and change its amount
+    save_transactions(USER_ID, [tx('a', '2025-01-05', 'Travel', 10), tx('c', '2025-03-01', 'Travel', 40)])
+    assert rollups() == {('2025-01', 'Food'): (5, 1), ('2025-01', 'Travel'): (10, 1), ('2025-03', 'Travel'): (40, 1)}
+
+    # Rollups left empty by a move are deleted, and the result matches a full rebuild
+    save_transactions(USER_ID, [tx('b', '2025-01-20', 'Travel', 5)])
+    assert ('2025-01', 'Food') not in rollups()
+    incremental = rollups()
+    rebuild_rollups(USER_ID)
+    assert rollups() == incremental
+
+
+def test_repeat_purchases_are_separate_rows(ctx):
+    written = save_transactions(USER_ID, [tx('', '2025-01-05', 'Food', 10), tx('', '2025-01-05', 'Food', 10)])
+    assert written == 2
+    assert Transaction.query.filter_by(user_id=USER_ID).count() == 2
+    # Re-importing the same two updates them in place
+    save_transactions(USER_ID, [tx('', '2025-01-05', 'Food', 10), tx('', '2025-01-05', 'Food', 10)])
+    assert Transaction.query.filter_by(user_id=USER_ID).count() == 2
+    assert rollups() == {('2025-01', 'Food'): (20, 2)}
+
+
+def test_cursor_pagination_across_equal_dates(ctx):
+    save_transactions(USER_ID, [tx(f't{i}', '2025-01-05', 'Food', i) for i in range(7)] + [
+        tx('old', '2025-01-01', 'Food', 100),
+        tx('new', '2025-01-09', 'Travel', 100),
+    ])
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = transaction_page(USER_ID, limit=3, cursor=cursor)
+        seen.extend(rows)
+        if cursor is None:
+            break
+    assert len(seen) == 9
+    assert len({row.id for row in seen}) == 9
+    assert [(row.date, row.id) for row in seen] == sorted(((row.date, row.id) for row in seen), reverse=True)
+    assert seen[0].txn_id == 'new' and seen[-1].txn_id == 'old'
+
+    rows, cursor = transaction_page(USER_ID, limit=10, category='Food', start_date='2025-01-02')
+    assert cursor is None
+    assert {row.date for row in rows} == {date(2025, 1, 5)}
+
+
+def test_malformed_cursor(ctx):
+    with pytest.raises(ValueError):
+        transaction_page(USER_ID, cursor='not-a-cursor')
+
+
+def test_transactions_api_requires_login(ctx):
+    assert app.test_client().get('/api/transactions').status_code == 401
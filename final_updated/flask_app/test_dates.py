@@ -0,0 +1,44 @@
+from datetime import date, datetime
+
+import numpy as np
+
+import dates
+from dates import MISSING_DAY, day_numbers, in_range, iso_dates, month_keys, to_date, to_day
+
+JAN_5 = to_day('2025-01-05')
+
+
+def test_day_numbers_mixed_formats():
+    values = [
+        '2025-01-05', '05/01/2025', '2025-01-05 10:30', '2025-01-05T10:30:00', '05-01-2025',
+        '2025/01/05', '05 Jan 2025', 'Jan 05, 2025', date(2025, 1, 5), datetime(2025, 1, 5, 23, 59)
+    ]
+    assert day_numbers(values).tolist() == [JAN_5] * len(values)
+
+
+def test_day_numbers_unreadable_and_empty():
+    numbers = day_numbers(['2025-01-05', None, '', float('nan'), 'not a date'])
+    assert numbers.tolist() == [JAN_5, MISSING_DAY, MISSING_DAY, MISSING_DAY, MISSING_DAY]
+    assert day_numbers([]).tolist() == []
+
+
+def test_day_numbers_ambiguous_dates_read_day_first():
+    assert iso_dates(day_numbers(['01/02/2025', '13/02/2025'])) == ['2025-02-01', '2025-02-13']
+
+
+def test_day_numbers_remembers_source_format():
+    dates.source_formats.pop('test-source', None)
+    # Month-first only fits the first value, so the whole source is read month first
+    day_numbers(['12/31/2024'], source='test-source')
+    assert dates.source_formats['test-source'] == '%m/%d/%Y'
+    assert iso_dates(day_numbers(['01/02/2025', '2025-03-04'], source='test-source')) == ['2025-01-02', '2025-03-04']
+    dates.source_formats.pop('test-source')
+
+
+def test_day_helpers():
+    assert to_date(JAN_5) == date(2025, 1, 5)
+    assert to_day(datetime(2025, 1, 5, 12)) == JAN_5
+    assert to_day('') is None
+    assert month_keys([JAN_5, MISSING_DAY]) == ['2025-01', None]
+    days = np.array([JAN_5 - 1, JAN_5, JAN_5 + 1, MISSING_DAY])
+    assert in_range(days, '2025-01-05', '2025-01-05').tolist() == [False, True, False, True]
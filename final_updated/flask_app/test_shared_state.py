@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+import pytest
+
+import shared_state
+from jobs import QueueFull
+from shared_state import SharedJobQueue, StateDB
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SharedJobQueue(StateDB(str(tmp_path / 'state.db')), max_workers=1, max_pending=2)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_submit_once_claims_one_job_per_key(queue):
+    release = threading.Event()
+    first = queue.submit_once('fetch', lambda job: release.wait(5), owner=1, key='a')
+    wait_until(lambda: queue.load_row(first.id)['state'] == 'running')
+    assert queue.submit_once('fetch', lambda job: None, owner=1, key='a').id == first.id
+    assert queue.submit_once('fetch', lambda job: None, owner=1, key='b').id != first.id
+    assert queue.submit_once('fetch', lambda job: None, owner=2, key='a').id != first.id
+    release.set()
+    wait_until(lambda: queue.load_row(first.id)['state'] == 'succeeded')
+    # Once the first job is done, the same request gets a new one
+    assert queue.submit_once('fetch', lambda job: None, owner=1, key='a').id != first.id
+
+
+def test_claim_respects_max_pending(queue):
+    release = threading.Event()
+    running = queue.submit('fetch', lambda job: release.wait(5), owner=1)
+    wait_until(lambda: queue.load_row(running.id)['state'] == 'running')
+    queue.submit('fetch', lambda job: None, owner=2)
+    queue.submit('fetch', lambda job: None, owner=3)
+    with pytest.raises(QueueFull):
+        queue.submit('fetch', lambda job: None, owner=4)
+    release.set()
+
+
+def test_other_process_sees_progress_and_result(queue, tmp_path):
+    release = threading.Event()
+
+    def task(job):
+        job.update_progress('Working', 40)
+        release.wait(5)
+        return {'total': 3}
+
+    job = queue.submit('fetch', task, owner=1)
+    other = SharedJobQueue(StateDB(str(tmp_path / 'state.db')))
+    wait_until(lambda: other.get(job.id).to_dict()['progress']['percent'] == 40)
+    snapshot = other.get(job.id)
+    version = snapshot.version
+    release.set()
+    assert snapshot.wait_for_change(version, timeout=5) != version
+    wait_until(lambda: other.get(job.id).state == 'succeeded')
+    assert other.get(job.id).to_dict()['result'] == {'total': 3}
+
+
+def test_stale_job_expires_and_is_requeued(queue):
+    release = threading.Event()
+    stale = queue.submit_once('fetch', lambda job: release.wait(5) or 'late', owner=1, key='a')
+    wait_until(lambda: queue.load_row(stale.id)['state'] == 'running')
+    queue.db.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (time.time() - shared_state.STALE_AFTER - 1, stale.id))
+
+    # The same request now gets a new job, since claiming fails the stale one first
+    fresh = queue.submit_once('fetch', lambda job: 'fresh', owner=1, key='a')
+    assert fresh.id != stale.id
+    row = queue.load_row(stale.id)
+    assert row['state'] == 'failed'
+    assert 'stopped responding' in row['error']
+
+    # The stale job finishing late does not overwrite its failed row
+    release.set()
+    wait_until(lambda: queue.load_row(fresh.id)['state'] == 'succeeded')
+    wait_until(lambda: not stale.active)
+    assert queue.load_row(stale.id)['state'] == 'failed'
+
+
+def test_job_of_exited_process_expires(queue):
+    job = queue.submit('fetch', lambda job: None, owner=1)
+    wait_until(lambda: queue.load_row(job.id)['state'] == 'succeeded')
+    queue.db.execute("UPDATE jobs SET state = 'running', pid = ? WHERE id = ?", (2 ** 22 + os.getpid(), job.id))
+    queue._expire_stale(force=True)
+    assert queue.load_row(job.id)['error'] == 'The worker running this job exited'
+
+
+def test_expiry_is_throttled(queue, monkeypatch):
+    queue._expire_stale(force=True)
+    calls = []
+    monkeypatch.setattr(queue.db, 'execute', lambda *args: calls.append(args))
+    queue._expire_stale()
+    assert calls == []
+
+
+def test_heartbeat_advances(queue, monkeypatch):
+    monkeypatch.setattr(shared_state, 'HEARTBEAT_INTERVAL', 0.05)
+    release = threading.Event()
+    job = queue.submit('fetch', lambda job: release.wait(5), owner=1)
+    wait_until(lambda: queue.load_row(job.id)['state'] == 'running')
+    queue.db.execute('UPDATE jobs SET heartbeat = 0 WHERE id = ?', (job.id,))
+    wait_until(lambda: queue.load_row(job.id)['heartbeat'] > 0)
+    release.set()
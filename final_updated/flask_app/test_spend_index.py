@@ -0,0 +1,90 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from dates import MISSING_DAY, to_day
+from spend_index import SpendIndex, SpendIndexCache
+
+START = date(2024, 1, 1)
+
+
+def random_rows(rng, n):
+    days = [to_day(START + timedelta(days=rng.randint(0, 400))) for _ in range(n)]
+    amounts = [round(rng.uniform(1, 500), 2) for _ in range(n)]
+    categories = [rng.choice(['Food', 'Travel', 'Bills']) for _ in range(n)]
+    return days, amounts, categories
+
+
+def naive_total(rows, start, end, category=None):
+    first, last = to_day(start), to_day(end)
+    return sum(
+        amount for day, amount, cat in zip(*rows)
+        if (first is None or day >= first) and (last is None or day <= last) and category in (None, cat)
+    )
+
+
+def random_bound(rng):
+    return rng.choice([None, str(START + timedelta(days=rng.randint(-30, 430)))])
+
+
+def test_range_totals_match_naive_sum():
+    rng = random.Random(7)
+    for _ in range(20):
+        rows = random_rows(rng, rng.randint(1, 60))
+        index = SpendIndex(*rows)
+        for _ in range(20):
+            start, end = random_bound(rng), random_bound(rng)
+            assert index.total(start, end) == pytest.approx(naive_total(rows, start, end))
+            for category, total, count in index.category_totals(start, end):
+                assert total == pytest.approx(naive_total(rows, start, end, category))
+            assert sum(index.monthly_totals(start, end).values()) == pytest.approx(naive_total(rows, start, end), abs=0.05)
+            assert sum(index.weekly_totals(start, end).values()) == pytest.approx(naive_total(rows, start, end), abs=0.05)
+
+
+def test_category_totals_counts_and_order():
+    index = SpendIndex(
+        [to_day('2024-01-01'), to_day('2024-01-01'), to_day('2024-01-02'), MISSING_DAY],
+        [10, 5, 30, 1000],
+        ['Food', 'Food', 'Travel', 'Food'],
+        [1, 2, 1, 1]
+    )
+    assert index.category_totals() == [('Travel', 30.0, 1), ('Food', 15.0, 3)]
+    assert index.category_totals('2024-01-02', '2024-01-02') == [('Travel', 30.0, 1)]
+    assert index.total(category='Bills') == 0.0
+
+
+def test_outlier_date_stays_sparse():
+    index = SpendIndex([to_day('1900-01-01'), to_day('2024-06-01')], [1, 2], ['Food', 'Food'])
+    assert len(index.all_days) == 2
+    assert index.total('2024-01-01') == 2
+    # Months are clipped to the data, so the range ends in June
+    assert index.monthly_totals('2024-05-15', '2024-07-01') == {'May 2024': 0.0, 'Jun 2024': 2.0}
+
+
+def test_empty_index():
+    index = SpendIndex([], [], [])
+    assert index.empty
+    assert index.total() == 0.0
+    assert index.category_totals() == []
+    assert index.monthly_totals() == {}
+
+
+def test_cache_rebuilds_on_revision_and_evicts_least_recent():
+    revisions = {1: 0, 2: 0, 3: 0}
+    builds = []
+
+    def build(user_id):
+        builds.append(user_id)
+        return object()
+
+    cache = SpendIndexCache(build, revisions.get, max_entries=2)
+    first = cache.get(1)
+    assert cache.get(1) is first
+    revisions[1] += 1
+    assert cache.get(1) is not first
+    cache.get(2)
+    cache.get(1)
+    cache.get(3)
+    assert list(cache.indexes) == [1, 3]
+    assert builds == [1, 1, 2, 3]
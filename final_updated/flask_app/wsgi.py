@@ -0,0 +1,40 @@
+"""WSGI entry point for serving the dashboard with several worker processes
+
+    cd final_updated/flask_app
+    gunicorn --workers 4 --threads 8 --timeout 120 wsgi:app
+
+Jobs, their progress, dashboard data and data revisions go through a SQLite file
+(instance/state.db, or STATE_DB) shared by every worker, so any worker can serve
+any request. See the README for the settings.
+"""
+import os
+
+# Must be set before app is imported, which picks the backend at import time
+os.environ.setdefault('STATE_BACKEND', 'sqlite')
+
+from app import app, db, init_db  # noqa: E402
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, which gunicorn does not run on anyway
+    fcntl = None
+
+
+def initialize():
+    """Create and upgrade the tables once, even if several workers start at the same moment"""
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, 'init.lock'), 'w') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with app.app_context():
+                init_db()
+                # Workers forked after a --preload import must not share these connections
+                db.engine.dispose()
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+initialize()
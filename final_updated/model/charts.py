@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')  # Headless backend: never open a window or need a display
+from matplotlib.figure import Figure
+
+# Rendered charts are stored here, named by a hash of the data they show
+CHART_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'result_graph_image')
+
+# Oldest charts are removed once the cache grows past this many files
+MAX_CACHED_CHARTS = 200
+
+SUPPORTED_FORMATS = ('png', 'svg')
+
+# Rendering runs on a small background pool so callers are never blocked by matplotlib
+_render_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chart-render')
+_cache_lock = threading.Lock()
+
+
+def aggregate_by_category(categorized_expenses):
+    """Sum [description, category, amount] rows per category, largest first"""
+    totals = {}
+    for expense in categorized_expenses:
+        category = str(expense[1])
+        totals[category] = totals.get(category, 0) + float(expense[2])
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def aggregate_by_month(expenses):
+    """Sum expense dictionaries with a YYYY-MM-DD 'date' per month, oldest first"""
+    totals = {}
+    for expense in expenses:
+        date = expense.get('date')
+        if not date:
+            continue
+        month = str(date)[:7]
+        totals[month] = totals.get(month, 0) + float(expense.get('amount', 0))
+    return dict(sorted(totals.items()))
+
+
+def chart_key(kind, data, fmt):
+    """Content hash identifying a chart of the given kind, data and format"""
+    payload = json.dumps({'kind': kind, 'data': data, 'format': fmt}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def chart_path(kind, data, fmt='png'):
+    """Path the chart for this data is (or will be) cached at"""
+    return os.path.join(CHART_CACHE_DIR, f"{kind}-{chart_key(kind, data, fmt)[:32]}.{fmt}")
+
+
+def _draw(kind, data):
+    """Draw a chart on a standalone Figure (no pyplot global state, safe off the main thread)"""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    labels = list(data.keys())
+    values = list(data.values())
+
+    if kind == 'category':
+        ax.bar(labels, values, color='skyblue')
+        ax.set_xlabel('Categories')
+        ax.set_title('Categorized Expenses')
+    elif kind == 'trend':
+        ax.plot(labels, values, marker='o', color='steelblue')
+        ax.set_xlabel('Month')
+        ax.set_title('Spending Trend')
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+
+    ax.set_ylabel('Total Amount')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+
+def _prune_cache():
+    """Remove the oldest cached charts beyond MAX_CACHED_CHARTS"""
+    files = [os.path.join(CHART_CACHE_DIR, name) for name in os.listdir(CHART_CACHE_DIR)]
+    files = [path for path in files if path.endswith(SUPPORTED_FORMATS)]
+    if len(files) <= MAX_CACHED_CHARTS:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - MAX_CACHED_CHARTS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def render_chart(kind, data, fmt='png'):
+    """Render a chart to the cache and return its path.
+
+    If a chart for exactly this data was rendered before, the cached file is returned
+    without touching matplotlib.
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported chart format: {fmt}")
+
+    path = chart_path(kind, data, fmt)
+    if os.path.exists(path):
+        logging.debug(f"Using cached {kind} chart {os.path.basename(path)}")
+        return path
+
+    os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+    fig = _draw(kind, data)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    fig.savefig(tmp_path, format=fmt)
+    os.replace(tmp_path, path)  # Readers never see a half-written image
+    logging.info(f"Rendered {kind} chart to {path}")
+
+    with _cache_lock:
+        _prune_cache()
+    return path
+
+
+def render_chart_async(kind, data, fmt='png'):
+    """Schedule render_chart on the background pool and return its Future"""
+    return _render_executor.submit(render_chart, kind, data, fmt)
+
+
+def render_expense_charts(categorized_expenses, expenses=None, formats=('png',)):
+    """Schedule the category chart (and the monthly trend chart when dated expenses are given)
+
+    Returns a dictionary of {(kind, format): Future resolving to the image path}.
+    """
+    charts = {'category': aggregate_by_category(categorized_expenses)}
+    if expenses:
+        monthly = aggregate_by_month(expenses)
+        if monthly:
+            charts['trend'] = monthly
+
+    return {
+        (kind, fmt): render_chart_async(kind, data, fmt)
+        for kind, data in charts.items()
+        for fmt in formats
+    }
@@ -0,0 +1,87 @@
+import re
+
+# Compact prompt: categories are given short codes, expenses are numbered descriptions
+# (amounts do not help the model pick a category) and the reply is one 'index:code'
+# line per expense instead of a JSON array that echoes every description back.
+PROMPT_TEMPLATE = """Categorize each expense. Categories (code = name: examples):
+{categories}
+
+Expenses:
+{expenses}
+
+Reply with one line per expense as index:code, for example 1:F. No other text."""
+
+CONFIDENCE_INSTRUCTION = "\nAdd :confidence from 0 to 1 after the code, for example 1:F:0.9."
+
+# Reply line such as '3:TR', '3: TR', '3. tr' or '3:TR:0.85'
+REPLY_LINE = re.compile(r'^\s*(\d+)\s*[:.)=-]\s*([A-Za-z]+)\s*(?::\s*([0-9]*\.?[0-9]+))?')
+
+
+def category_codes(categories):
+    """Give every category a short unique code: its first letter, or a longer prefix on collision
+
+    Returns {code: name} in category order.
+    """
+    codes = {}
+    for cat in categories:
+        letters = re.sub(r'[^A-Z0-9]', '', cat['name'].upper()) or 'C'
+        code = None
+        for length in range(1, len(letters) + 1):
+            if letters[:length] not in codes:
+                code = letters[:length]
+                break
+        if code is None:
+            code = f"{letters}{len(codes)}"
+        codes[code] = cat['name']
+    return codes
+
+
+def encode_categories(categories, codes):
+    """One 'code = name: description' line per category"""
+    names = {name: code for code, name in codes.items()}
+    return "\n".join(f"{names[cat['name']]} = {cat['name']}: {cat['description']}" for cat in categories)
+
+
+def encode_expenses(batch):
+    """Numbered descriptions, one per line, with whitespace collapsed"""
+    return "\n".join(
+        f"{index}. {' '.join(str(expense['description']).split())}"
+        for index, expense in enumerate(batch, start=1)
+    )
+
+
+def build_prompt(batch, categories, codes, with_confidence=False):
+    prompt = PROMPT_TEMPLATE.replace('{categories}', encode_categories(categories, codes))
+    prompt = prompt.replace('{expenses}', encode_expenses(batch))
+    if with_confidence:
+        prompt += CONFIDENCE_INSTRUCTION
+    return prompt
+
+
+def parse_reply(content, batch, codes):
+    """Turn 'index:code' lines into the item dictionaries the JSON prompt produces
+
+    Items are returned in batch order; an expense without a usable line (or with an
+    unknown code) gets None so the caller can fall back or escalate for it alone.
+    Raises ValueError if no line could be read at all.
+    """
+    items = [None] * len(batch)
+    lookup = {code.upper(): name for code, name in codes.items()}
+    found = 0
+    for line in content.splitlines():
+        match = REPLY_LINE.match(line.strip('`* '))
+        if not match:
+            continue
+        index = int(match.group(1)) - 1
+        name = lookup.get(match.group(2).upper())
+        if not 0 <= index < len(batch) or name is None or items[index] is not None:
+            continue
+        item = {'description': batch[index]['description'], 'category': name}
+        if match.group(3) is not None:
+            item['confidence'] = float(match.group(3))
+        items[index] = item
+        found += 1
+
+    if not found:
+        raise ValueError("Response has no index:code lines")
+    return items
@@ -0,0 +1,284 @@
+import argparse
+import json
+import logging
+import math
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from . import init
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(__file__), 'eval', 'labeled_expenses.csv')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'eval', 'results')
+BACKENDS = ('rules', 'llm', 'cache')
+PROMPT_FORMATS = ('compact', 'json')
+
+
+def load_labeled_dataset(path):
+    """Load a CSV with description, amount and category columns"""
+    df = pd.read_csv(path)
+    missing = [col for col in ('description', 'amount', 'category') if col not in df.columns]
+    if missing:
+        raise ValueError(f"Labeled dataset {path} is missing columns: {missing}")
+    return [
+        {'description': str(description), 'amount': float(amount), 'category': str(category)}
+        for description, amount, category in zip(df['description'], df['amount'], df['category'])
+    ]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers: the ceil(pct/100 * n)-th smallest"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # pct * n / 100 rather than pct / 100 * n, which is inexact for e.g. pct=7, n=100
+    rank = max(1, math.ceil(pct * len(ordered) / 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def current_commit():
+    """Short hash of the checked-out commit, if this is a git checkout"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_backend(backend, dataset, categories, prompt_template, batch_size):
+    """Categorize the dataset with one backend and measure accuracy and speed
+
+    - rules: the keyword fallback only
+    - llm: every batch goes to Ollama (force_recategorize), filling the cache
+    - cache: the normal cached path, expected to be served without model calls
+    """
+    expenses = [{'description': item['description'], 'amount': item['amount']} for item in dataset]
+    batches = [expenses[i:i + batch_size] for i in range(0, len(expenses), batch_size)]
+
+    predictions = []
+    latencies = []
+    calls_before = init.llm_call_count
+    init.llm_telemetry.reset()
+    started = time.perf_counter()
+
+    for batch in batches:
+        batch_start = time.perf_counter()
+        if backend == 'rules':
+            labels = [init.fallback_categorize_expense(expense, categories) for expense in batch]
+        else:
+            results = init.categorize_expense_batch(
+                batch, categories, prompt_template, force_recategorize=(backend == 'llm')
+            )
+            labels = [row[1] if row else None for row in results[:len(batch)]]
+            labels += [None] * (len(batch) - len(labels))
+        latencies.append(time.perf_counter() - batch_start)
+        predictions.extend(labels)
+
+    elapsed = time.perf_counter() - started
+    llm_calls = init.llm_call_count - calls_before
+    token_rates = init.llm_telemetry.summary(recent=0)['rates']
+    correct = sum(
+        1 for item, label in zip(dataset, predictions)
+        if label is not None and str(label).strip().lower() == item['category'].lower()
+    )
+    mistakes = [
+        {'description': item['description'], 'expected': item['category'], 'predicted': label}
+        for item, label in zip(dataset, predictions)
+        if label is None or str(label).strip().lower() != item['category'].lower()
+    ]
+
+    return {
+        'items': len(dataset),
+        'accuracy': correct / len(dataset) if dataset else None,
+        'items_per_sec': len(dataset) / elapsed if elapsed > 0 else None,
+        'llm_calls': llm_calls,
+        'llm_calls_per_100_items': llm_calls * 100 / len(dataset) if dataset else None,
+        'prompt_tokens_per_item': token_rates['prompt_tokens_per_item'],
+        'completion_tokens_per_item': token_rates['completion_tokens_per_item'],
+        'batch_latency_ms': {
+            'p50': _ms(percentile(latencies, 50)),
+            'p95': _ms(percentile(latencies, 95)),
+            'p99': _ms(percentile(latencies, 99)),
+            'max': _ms(max(latencies) if latencies else None)
+        },
+        'elapsed_sec': elapsed,
+        'escalation': _escalation_stats() if backend == 'llm' and init.ESCALATION_MODE else None,
+        'mistakes': mistakes
+    }
+
+
+def _escalation_stats():
+    telemetry = init.llm_telemetry.summary(recent=0)
+    return {'tiers': telemetry['tiers'], **telemetry['escalation']}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def evaluate(dataset_path=DEFAULT_DATASET, backends=BACKENDS, batch_size=None, ollama_host=None, escalation=None,
+             prompt_formats=None):
+    """Run the labeled dataset through the requested backends and build a report
+
+    Model results are cached in a throwaway directory so the evaluation neither reads
+    nor pollutes the real cache. The 'cache' backend is warmed first if 'llm' has not
+    already populated it. With several prompt formats the model backends run once per
+    format and are reported as e.g. 'llm:compact' and 'llm:json'.
+    """
+    prompt_formats = list(prompt_formats or [init.PROMPT_FORMAT])
+    batch_size = batch_size or init.BATCH_SIZE
+    dataset = load_labeled_dataset(dataset_path)
+    categories = init.load_categories()
+    prompt_template = init.load_prompt_template()
+
+    if ollama_host:
+        init.set_ollama_host(ollama_host)
+    if escalation is not None:
+        init.ESCALATION_MODE = escalation
+
+    report = {
+        'commit': current_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'dataset': os.path.abspath(dataset_path),
+        'items': len(dataset),
+        'batch_size': batch_size,
+        'ollama_host': init.OLLAMA_HOST,
+        'ollama_available': init.check_ollama_running(),
+        'prompt_formats': prompt_formats,
+        'escalation': {'fast_model': init.FAST_MODEL, 'model': init.MODEL, 'threshold': init.ESCALATION_THRESHOLD}
+                      if init.ESCALATION_MODE else None,
+        'backends': {}
+    }
+
+    original_cache_dir = init.CACHE_DIR
+    original_format = init.PROMPT_FORMAT
+    try:
+        if 'rules' in backends:
+            report['backends']['rules'] = run_backend('rules', dataset, categories, prompt_template, batch_size)
+        for prompt_format in prompt_formats:
+            init.PROMPT_FORMAT = prompt_format
+            with tempfile.TemporaryDirectory(prefix='expense-eval-cache-') as cache_dir:
+                init.CACHE_DIR = cache_dir
+                warmed = False
+                for backend in backends:
+                    if backend == 'rules':
+                        continue
+                    name = backend if len(prompt_formats) == 1 else f"{backend}:{prompt_format}"
+                    if backend == 'cache' and not warmed:
+                        run_backend('llm', dataset, categories, prompt_template, batch_size)
+                    logging.info(f"Evaluating backend '{name}' on {len(dataset)} items")
+                    report['backends'][name] = run_backend(backend, dataset, categories, prompt_template, batch_size)
+                    warmed = warmed or backend == 'llm'
+    finally:
+        init.CACHE_DIR = original_cache_dir
+        init.PROMPT_FORMAT = original_format
+
+    return report
+
+
+def compare_reports(baseline, current):
+    """Per-backend metric deltas between two saved reports"""
+    comparison = {}
+    for backend, metrics in current['backends'].items():
+        base = baseline.get('backends', {}).get(backend)
+        if not base:
+            continue
+        comparison[backend] = {
+            key: {'baseline': base.get(key), 'current': metrics.get(key)}
+            for key in ('accuracy', 'items_per_sec', 'llm_calls_per_100_items',
+                        'prompt_tokens_per_item', 'completion_tokens_per_item')
+        }
+        comparison[backend]['batch_latency_ms'] = {
+            pct: {'baseline': base['batch_latency_ms'].get(pct), 'current': metrics['batch_latency_ms'].get(pct)}
+            for pct in ('p50', 'p95', 'p99')
+        }
+    return comparison
+
+
+def _fmt(value):
+    return f"{value:.1f}" if value is not None else '-'
+
+
+def print_report(report):
+    print(f"\nCategorization evaluation ({report['items']} items, batch size {report['batch_size']}, "
+          f"commit {report['commit'] or 'unknown'})")
+    if not report['ollama_available']:
+        print(f"Warning: no Ollama server at {report['ollama_host']}, model backends used the fallback rules")
+    print(f"{'backend':<14} {'accuracy':>9} {'items/s':>10} {'calls/100':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'prompt tok/item':>16} {'compl tok/item':>15}")
+    for backend, metrics in report['backends'].items():
+        latency = metrics['batch_latency_ms']
+        print(f"{backend:<14} {metrics['accuracy']:>9.1%} {metrics['items_per_sec']:>10.1f} "
+              f"{metrics['llm_calls_per_100_items']:>10.1f} {latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} "
+              f"{_fmt(metrics.get('prompt_tokens_per_item')):>16} {_fmt(metrics.get('completion_tokens_per_item')):>15}")
+        escalation = metrics.get('escalation')
+        if escalation:
+            rate = escalation['escalation_rate']
+            print(f"  escalation: {escalation['accepted_fast']} items settled by the fast model, "
+                  f"{escalation['escalated']} escalated ({rate:.1%})" if rate is not None else "  escalation: no batches")
+            for tier, stats in escalation['tiers'].items():
+                print(f"    {tier:<6} {stats['calls']} calls, {stats['items']} items, "
+                      f"mean latency {stats['mean_latency_seconds'] * 1000:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate expense categorization accuracy and throughput")
+    parser.add_argument('--dataset', default=DEFAULT_DATASET, help="CSV with description, amount and category columns")
+    parser.add_argument('--backends', default=','.join(BACKENDS), help="Comma-separated list of: rules, llm, cache")
+    parser.add_argument('--batch-size', type=int, default=None, help="Expenses per model request")
+    parser.add_argument('--ollama-host', default=None, help="Ollama server to use, e.g. a local stub at localhost:11435")
+    parser.add_argument('--stub', action='store_true', help="Run the LLM backend against an in-process Ollama stub")
+    parser.add_argument('--stub-latency', default='fixed:0', help="Latency distribution for --stub (see ollama_stub.py)")
+    parser.add_argument('--escalation', action='store_true', default=None,
+                        help="Use two-tier escalation (fast model first, large model for uncertain items)")
+    parser.add_argument('--prompt-formats', default=None,
+                        help="Comma-separated prompt encodings to compare: compact, json (default: the configured one)")
+    parser.add_argument('--output', default=None, help="Where to save the JSON report (default: eval/results/)")
+    parser.add_argument('--compare', default=None, help="A previously saved report to compare against")
+    args = parser.parse_args(argv)
+
+    backends = [name.strip() for name in args.backends.split(',') if name.strip()]
+    unknown = [name for name in backends if name not in BACKENDS]
+    if unknown:
+        parser.error(f"Unknown backends: {unknown}")
+    prompt_formats = [name.strip() for name in (args.prompt_formats or '').split(',') if name.strip()] or None
+    if prompt_formats and any(name not in PROMPT_FORMATS for name in prompt_formats):
+        parser.error(f"Unknown prompt formats: {prompt_formats}")
+
+    ollama_host = args.ollama_host
+    stub = None
+    if args.stub:
+        from .ollama_stub import StubConfig, serve_in_thread
+        stub, ollama_host = serve_in_thread(StubConfig(latency=args.stub_latency, seed=0))
+
+    try:
+        report = evaluate(args.dataset, backends, args.batch_size, ollama_host, args.escalation, prompt_formats)
+    finally:
+        if stub is not None:
+            stub.shutdown()
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            report['comparison'] = compare_reports(json.load(f), report)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['commit'] or 'nocommit'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report)
+    print(f"\nSaved report to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
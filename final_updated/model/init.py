@@ -4,20 +4,26 @@ import ollama
 from .error_handler import ExpenseTrackerError, display_error_and_exit
 from .read_keep import read_keep_notes
 from .write_sheets import write_to_sheet
+from .recategorize import category_definitions, find_affected
+from .charts import aggregate_by_category, render_expense_charts
+from .ollama_pool import OllamaPool
+from .telemetry import llm_telemetry
+from . import compact_prompt, streaming
+from transaction import Transaction
 from halo import Halo
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
 import requests
 import subprocess
 import time
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import lru_cache
 import hashlib
 import pickle
+import tempfile
+import threading
 import argparse
-from datetime import datetime
 import re
 
 # Configure logging
@@ -35,9 +41,62 @@ CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache')
 if not os.path.exists(CACHE_DIR):
     os.makedirs(CACHE_DIR)
 
+# Number of expenses sent to the model per request
+BATCH_SIZE = 5
+
+# Number of CSV rows parsed at a time when reading expense exports
+CSV_CHUNK_SIZE = 50000
+
+# Latest categorization results, handed to the Flask app in-process and as a snapshot file
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), 'categorized_expenses.json')
+latest_results = None
+results_lock = threading.Lock()
+
 # Flag to track if we've already tried to start Ollama
 tried_starting_ollama = False
 
+# Ollama servers used for categorization (OLLAMA_HOSTS for several, OLLAMA_HOST for one)
+ollama_pool = OllamaPool.from_env()
+OLLAMA_HOST = ollama_pool.hosts[0]
+
+# Model used for categorization, and for escalated items in two-tier mode
+MODEL = os.getenv('OLLAMA_MODEL', 'llama3')
+
+# Two-tier escalation: a small model labels each batch with a confidence, and only
+# uncertain or invalid items are sent to MODEL
+ESCALATION_MODE = os.getenv('CATEGORIZATION_ESCALATION', 'off').lower() in ('1', 'true', 'on', 'yes')
+FAST_MODEL = os.getenv('OLLAMA_FAST_MODEL', 'llama3.2:1b')
+ESCALATION_THRESHOLD = float(os.getenv('CATEGORIZATION_CONFIDENCE_THRESHOLD', '0.8'))
+CONFIDENCE_INSTRUCTION = (
+    '\n\nAlso add a "confidence" field to each item: a number between 0 and 1 '
+    'saying how sure you are that the category is correct.'
+)
+
+# Prompt encoding: 'json' (prompt_template.txt with JSON in and out) or 'compact'
+# (category codes, numbered descriptions, 'index:code' replies). 'json' stays the
+# default until compact is shown to be as accurate on a real model: the stub's
+# replies come from the keyword rules, so it cannot compare the two.
+PROMPT_FORMAT = os.getenv('CATEGORIZATION_PROMPT', 'json').lower()
+
+# Stream replies from Ollama so items are parsed, cached and counted as they arrive
+STREAM_RESPONSES = os.getenv('CATEGORIZATION_STREAM', 'on').lower() in ('1', 'true', 'on', 'yes')
+
+# Number of chat requests sent to Ollama by this process (used by the evaluation harness)
+llm_call_count = 0
+
+def set_ollama_hosts(hosts, max_parallel=1):
+    """Point categorization at a different set of Ollama servers, e.g. local stubs"""
+    global ollama_pool, OLLAMA_HOST, tried_starting_ollama
+    if isinstance(hosts, str):
+        hosts = [hosts]
+    ollama_pool = OllamaPool([(host, None) for host in hosts], max_parallel=max_parallel)
+    OLLAMA_HOST = ollama_pool.hosts[0]
+    tried_starting_ollama = False
+
+def set_ollama_host(host):
+    """Point categorization at a different Ollama server, e.g. a local stub"""
+    set_ollama_hosts([host])
+
 def load_categories():
     """Load categories from the YAML file with fallback paths"""
     possible_paths = [
@@ -99,26 +158,104 @@ def load_prompt_template():
     Return the results in JSON format where each expense has a 'description' and 'category' field.
     """
 
+def fill_prompt(prompt_template, expenses_str, categories_str):
+    """Insert the expenses and categories into the prompt template.
+
+    Plain replacement rather than str.format, because the template contains a literal
+    JSON example whose braces str.format would treat as fields.
+    """
+    return prompt_template.replace('{expenses}', expenses_str).replace('{categories}', categories_str)
+
 def get_cache_key(expenses_batch):
-    """Generate a unique cache key for a batch of expenses"""
-    expense_str = json.dumps(expenses_batch, sort_keys=True)
+    """Generate a unique cache key for a batch of expenses (dictionaries or Transaction records)"""
+    expense_str = json.dumps(expenses_batch, sort_keys=True, default=Transaction.to_expense)
     return hashlib.md5(expense_str.encode()).hexdigest()
 
-def get_cached_results(cache_key):
-    """Try to get cached results"""
+def get_cached_entry(cache_key):
+    """Try to get a cached entry with its results and the category definitions used for them"""
     cache_file = os.path.join(CACHE_DIR, f"{cache_key}.pkl")
     if os.path.exists(cache_file):
         # Check if cache is less than 24 hours old
         if time.time() - os.path.getmtime(cache_file) < 86400:  # 24 hours
             with open(cache_file, 'rb') as f:
-                return pickle.load(f)
+                entry = pickle.load(f)
+            # Older cache files hold the bare results list
+            if isinstance(entry, list):
+                return {"results": entry, "categories": None}
+            return entry
     return None
 
-def save_to_cache(cache_key, results):
-    """Save results to cache"""
+def get_cached_results(cache_key):
+    """Try to get cached results"""
+    entry = get_cached_entry(cache_key)
+    return entry["results"] if entry else None
+
+def save_to_cache(cache_key, results, categories=None):
+    """Save results to cache together with the category definitions they were made with"""
     cache_file = os.path.join(CACHE_DIR, f"{cache_key}.pkl")
+    entry = {
+        "results": results,
+        "categories": category_definitions(categories) if categories else None
+    }
     with open(cache_file, 'wb') as f:
-        pickle.dump(results, f)
+        pickle.dump(entry, f)
+
+def get_valid_cached_results(cache_key, categories, prompt_template):
+    """Get cached results, re-categorizing only the rows invalidated by a category change"""
+    entry = get_cached_entry(cache_key)
+    if not entry or not entry["results"]:
+        return None
+
+    results, rerun_count = recategorize_affected(
+        entry["results"], entry["categories"], categories, prompt_template
+    )
+    if results != entry["results"]:
+        logging.info(f"Refreshed cached batch {cache_key[:8]} after category change ({rerun_count} re-categorized)")
+        save_to_cache(cache_key, results, categories)
+    return results
+
+def recategorize_affected(rows, old_definitions, categories, prompt_template):
+    """Re-categorize only the rows affected by a category change (see recategorize.find_affected)
+
+    Renamed labels are replaced, labels that are not categories get the keyword rules,
+    and only the remaining affected rows go back to the model.
+
+    Args:
+        rows: Categorized expenses as [description, category, amount] lists.
+        old_definitions: category_definitions() of the category set the rows were made with,
+            or None if unknown.
+        categories: The current categories.
+        prompt_template: Prompt template used for the rows that go back to the model.
+
+    Returns:
+        A tuple of (updated rows, number of rows sent back for categorization).
+    """
+    new_definitions = category_definitions(categories)
+    rerun_indices, relabels, invalid_indices = find_affected(rows, old_definitions, new_definitions)
+    if not rerun_indices and not relabels and not invalid_indices:
+        return rows, 0
+
+    updated = [list(row) for row in rows]
+    for index, category in relabels.items():
+        updated[index][1] = category
+    for index in invalid_indices:
+        updated[index][1] = fallback_categorize_expense({"description": str(rows[index][0])}, categories)
+
+    for start in range(0, len(rerun_indices), BATCH_SIZE):
+        indices = rerun_indices[start:start + BATCH_SIZE]
+        batch = [{"description": rows[i][0], "amount": rows[i][2]} for i in indices]
+        batch_results = categorize_expense_batch(batch, categories, prompt_template, force_recategorize=True)
+        for offset, index in enumerate(indices):
+            if offset < len(batch_results):
+                updated[index][1] = batch_results[offset][1]
+            else:
+                updated[index][1] = fallback_categorize_expense(batch[offset], categories)
+
+    logging.info(
+        f"Category change: {len(relabels)} relabeled, {len(invalid_indices)} invalid labels replaced by the rules, "
+        f"{len(rerun_indices)} re-categorized out of {len(rows)}"
+    )
+    return updated, len(rerun_indices)
 
 def fallback_categorize_expense(expense, categories):
     """Simple rule-based categorization when Ollama is not available"""
@@ -158,23 +295,16 @@ def fallback_categorize_expense(expense, categories):
     # Default category if no match found
     return "Extra"
 
-def check_ollama_running():
-    """Check if Ollama server is running"""
+def check_ollama_running(force=False):
+    """Check if at least one Ollama server in the pool is running"""
     global tried_starting_ollama
     
-    try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=3)
-        if response.status_code == 200:
-            logging.info("Ollama server is already running")
-            return True
-        else:
-            if not tried_starting_ollama:
-                logging.warning(f"Ollama server returned unexpected status code: {response.status_code}")
-            return False
-    except requests.exceptions.RequestException:
-        if not tried_starting_ollama:
-            logging.warning("Ollama server is not running")
-        return False
+    if ollama_pool.check_health(force):
+        logging.debug(f"Ollama servers available: {[e['host'] for e in ollama_pool.status() if e['healthy']]}")
+        return True
+    if not tried_starting_ollama:
+        logging.warning(f"No Ollama server is running at {', '.join(ollama_pool.hosts)}")
+    return False
 
 def start_ollama():
     """Since Ollama should already be running as a service, this function now just checks and logs status"""
@@ -185,32 +315,52 @@ def start_ollama():
         
     tried_starting_ollama = True
     
-    # Just check if Ollama is accessible
-    try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=3)
-        if response.status_code == 200:
-            logging.info("Successfully connected to Ollama server")
-            return True
+    # Just check if any Ollama server is accessible
+    if ollama_pool.check_health(force=True):
+        logging.info("Successfully connected to Ollama server")
+        return True
+    logging.error(f"Could not connect to any Ollama server at {', '.join(ollama_pool.hosts)}")
+    return False
+
+def parse_model_response(content):
+    """Extract the list of categorized items from the model's reply"""
+    # Find JSON in the response
+    json_match = re.search(r'```json\n(.*?)\n```', content, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(1)
+    else:
+        # Try to find any JSON-like structure
+        json_match = re.search(r'\[\s*\{.*\}\s*\]', content, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(0)
         else:
-            logging.error(f"Ollama server returned unexpected status code: {response.status_code}")
-            return False
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Could not connect to Ollama server: {str(e)}")
-        return False
+            json_str = content
+    
+    items = json.loads(json_str)
+    
+    # Validate the structure
+    if not isinstance(items, list):
+        raise ValueError("Response is not a list")
+    return items
 
-def categorize_expense_batch(batch, categories, prompt_template, force_recategorize=False):
-    """Categorize a batch of expenses"""
-    try:
-        # Generate cache key for this batch
-        cache_key = get_cache_key(batch)
-        
-        # Only use cache if not forcing recategorization
-        if not force_recategorize:
-            cached_results = get_cached_results(cache_key)
-            if cached_results:
-                logging.info(f"Using cached results for batch with key {cache_key[:8]}")
-                return cached_results
-        
+def query_model(batch, categories, prompt_template, model=None, tier=None, with_confidence=False, on_item=None):
+    """Send one batch to Ollama and return the parsed items, retrying on connection or parse errors
+
+    on_item(index, item) is called for every item as soon as it is parsed; with
+    streaming that is while the rest of the reply is still being generated.
+    """
+    global llm_call_count
+    model = model or MODEL
+    
+    if PROMPT_FORMAT == 'compact':
+        # Short category codes, numbered descriptions and 'index:code' replies
+        codes = compact_prompt.category_codes(categories)
+        prompt = compact_prompt.build_prompt(batch, categories, codes, with_confidence)
+        parse_reply = lambda content: compact_prompt.parse_reply(content, batch, codes)
+        make_parser = lambda: streaming.CompactStreamParser(batch, codes)
+        # A reply line is a handful of tokens, so cap generation to what the batch needs
+        num_predict = 12 * len(batch) + 16
+    else:
         # Format categories string
         categories_str = "\n".join(f"- {cat['name']}: {cat['description']}" for cat in categories)
         
@@ -224,9 +374,181 @@ def categorize_expense_batch(batch, categories, prompt_template, force_recategor
         
         # Create the prompt with simplified batch
         batch_str = json.dumps(simplified_batch, ensure_ascii=False)
+        prompt = fill_prompt(prompt_template, batch_str, categories_str)
+        if with_confidence:
+            prompt += CONFIDENCE_INSTRUCTION
+        parse_reply = parse_model_response
+        make_parser = lambda: streaming.JSONStreamParser(batch)
+        num_predict = 256
+    
+    # Log the prompt for debugging
+    logging.debug(f"Sending {PROMPT_FORMAT} prompt to {model}: {prompt[-300:]}")
+    
+    # Try multiple times in case of connection issues
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            # Make the API call with timeout
+            start_time = time.time()
+            llm_call_count += 1
+            call_info = {}
+            chat_args = dict(
+                model=model, 
+                messages=[{
+                    "role": "user", 
+                    "content": prompt
+                }],
+                options={
+                    "temperature": 0.1,
+                    "num_predict": num_predict,
+                    "top_k": 10,
+                    "top_p": 0.9
+                }
+            )
+            if STREAM_RESPONSES:
+                # Items are parsed and handed to on_item as the reply streams in, and the
+                # stream is dropped only if the reply goes off-format
+                parser = make_parser()
+                content, response, first_item_seconds, aborted = streaming.consume_stream(
+                    ollama_pool.chat_stream(info=call_info, **chat_args), parser, on_item
+                )
+            else:
+                response = ollama_pool.chat(info=call_info, **chat_args)
+                content = response['message']['content']
+                parser = None
+                first_item_seconds = None
+                aborted = False
+            
+            processing_time = time.time() - start_time
+            record = llm_telemetry.record_batch(
+                response, len(batch), processing_time,
+                queue_wait=call_info.get('queue_wait', 0.0), endpoint=call_info.get('endpoint'), model=model, tier=tier,
+                first_item_seconds=first_item_seconds, aborted=aborted
+            )
+            logging.info(
+                f"Ollama processing time ({model}): {processing_time:.2f} seconds "
+                f"(queue {record['queue_wait_seconds']:.2f}s, load {record['load_seconds']:.2f}s, "
+                f"{record['prompt_tokens']} prompt / {record['completion_tokens']} completion tokens)"
+            )
+            
+            # Try to parse the response
+            try:
+                if parser is not None:
+                    items = parser.result()
+                    if aborted:
+                        logging.warning(f"Stopped off-format reply from {model} after {sum(1 for item in items if item)} of {len(batch)} items")
+                        logging.debug(f"Raw response: {content[:500]}...")
+                    return items
+                items = parse_reply(content)
+                if on_item:
+                    for index, item in enumerate(items):
+                        if item is not None:
+                            on_item(index, item)
+                return items
+            except (json.JSONDecodeError, ValueError) as e:
+                logging.error(f"Error parsing model response: {str(e)}")
+                logging.debug(f"Raw response: {content[:500]}...")
+                
+                if attempt < max_retries - 1:
+                    logging.info(f"Retrying batch processing (attempt {attempt+2}/{max_retries})...")
+                    continue
+                else:
+                    raise ValueError(f"Failed to parse model response after {max_retries} attempts")
+        
+        except Exception as e:
+            if attempt < max_retries - 1:
+                logging.warning(f"Ollama connection error: {str(e)}. Retrying in 2 seconds...")
+                time.sleep(2)
+                continue
+            else:
+                logging.error(f"Ollama failed after {max_retries} attempts: {str(e)}")
+                raise
+
+def results_from_items(batch, items, categories):
+    """Pair parsed model items with the batch, using the fallback rules for missing or invalid ones
+
+    An item whose category is not one of the defined categories counts as invalid.
+    """
+    category_names = {cat['name'] for cat in categories}
+    results = []
+    for i, expense in enumerate(batch):
+        item = items[i] if i < len(items) else None
+        if isinstance(item, dict) and 'description' in item and item.get('category') in category_names:
+            results.append([item['description'], item['category'], expense['amount']])
+        else:
+            logging.warning(f"Invalid expense format in response: {item}")
+            # Use fallback for this expense
+            results.append([expense['description'], fallback_categorize_expense(expense, categories), expense['amount']])
+    return results
+
+def is_confident(item, category_names):
+    """Whether a fast-tier item has a valid category with confidence above the threshold"""
+    if not isinstance(item, dict) or item.get('category') not in category_names or 'description' not in item:
+        return False
+    try:
+        return float(item.get('confidence', 0)) >= ESCALATION_THRESHOLD
+    except (TypeError, ValueError):
+        return False
+
+def categorize_with_escalation(batch, categories, prompt_template, on_item=None):
+    """Label a batch with the fast model and send only uncertain or invalid items to the large one"""
+    category_names = {cat['name'] for cat in categories}
+    
+    def on_fast_item(index, item):
+        # Only confident fast-tier answers are final; the rest wait for the large model
+        if on_item and is_confident(item, category_names):
+            on_item(index, item)
+    
+    try:
+        fast_items = query_model(
+            batch, categories, prompt_template, FAST_MODEL, tier='fast', with_confidence=True, on_item=on_fast_item
+        )
+    except Exception as e:
+        logging.warning(f"Fast model {FAST_MODEL} failed, escalating the whole batch: {str(e)}")
+        fast_items = []
+    
+    results = [None] * len(batch)
+    uncertain = []
+    for i, expense in enumerate(batch):
+        item = fast_items[i] if i < len(fast_items) else None
+        if is_confident(item, category_names):
+            results[i] = [item['description'], item['category'], expense['amount']]
+        else:
+            uncertain.append(i)
+    
+    if uncertain:
+        escalated = [batch[i] for i in uncertain]
+        try:
+            large_items = query_model(
+                escalated, categories, prompt_template, MODEL, tier='large',
+                on_item=(lambda index, item: on_item(uncertain[index], item)) if on_item else None
+            )
+        except Exception as e:
+            logging.error(f"Large model {MODEL} failed on escalated items: {str(e)}")
+            large_items = []
+        for i, row in zip(uncertain, results_from_items(escalated, large_items, categories)):
+            results[i] = row
+    
+    llm_telemetry.record_escalation(len(batch) - len(uncertain), len(uncertain))
+    logging.info(f"Escalation: {len(batch) - len(uncertain)} items accepted from {FAST_MODEL}, {len(uncertain)} sent to {MODEL}")
+    return results
+
+def categorize_expense_batch(batch, categories, prompt_template, force_recategorize=False, item_callback=None):
+    """Categorize a batch of expenses
+
+    Every expense the model answers is committed to its own cache entry as soon as it
+    is parsed, and item_callback(index) is called so progress can move per item.
+    """
+    try:
+        # Generate cache key for this batch
+        cache_key = get_cache_key(batch)
         
-        # Log the prompt for debugging
-        logging.debug(f"Sending prompt to model: {batch_str[:200]}...")
+        # Only use cache if not forcing recategorization
+        if not force_recategorize:
+            cached_results = get_valid_cached_results(cache_key, categories, prompt_template)
+            if cached_results:
+                logging.info(f"Using cached results for batch with key {cache_key[:8]}")
+                return cached_results
         
         # Ensure Ollama is running
         ollama_available = check_ollama_running()
@@ -234,94 +556,28 @@ def categorize_expense_batch(batch, categories, prompt_template, force_recategor
             ollama_available = start_ollama()
         
         if ollama_available:
-            # Try multiple times in case of connection issues
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    # Make the API call with timeout
-                    start_time = time.time()
-                    response = ollama.chat(
-                        model='llama3', 
-                        messages=[{
-                            "role": "user", 
-                            "content": prompt_template.format(expenses=batch_str, categories=categories_str)
-                        }],
-                        options={
-                            "temperature": 0.1,
-                            "num_predict": 256,
-                            "top_k": 10,
-                            "top_p": 0.9
-                        }
-                    )
-                    
-                    processing_time = time.time() - start_time
-                    logging.info(f"Ollama processing time: {processing_time:.2f} seconds")
-                    
-                    # Extract the categorized expenses from the response
-                    content = response['message']['content']
-                    
-                    # Try to parse the JSON response
-                    try:
-                        # Find JSON in the response
-                        json_match = re.search(r'```json\n(.*?)\n```', content, re.DOTALL)
-                        if json_match:
-                            json_str = json_match.group(1)
-                        else:
-                            # Try to find any JSON-like structure
-                            json_match = re.search(r'\[\s*\{.*\}\s*\]', content, re.DOTALL)
-                            if json_match:
-                                json_str = json_match.group(0)
-                            else:
-                                json_str = content
-                        
-                        categorized_expenses = json.loads(json_str)
-                        
-                        # Validate the structure
-                        if not isinstance(categorized_expenses, list):
-                            raise ValueError("Response is not a list")
-                        
-                        # Convert to the expected format
-                        results = []
-                        for i, expense in enumerate(categorized_expenses):
-                            if isinstance(expense, dict) and 'description' in expense and 'category' in expense:
-                                results.append([
-                                    expense['description'],
-                                    expense['category'],
-                                    batch[i]['amount']
-                                ])
-                            else:
-                                logging.warning(f"Invalid expense format in response: {expense}")
-                                # Use fallback for this expense
-                                results.append([
-                                    batch[i]['description'],
-                                    fallback_categorize_expense(batch[i], categories),
-                                    batch[i]['amount']
-                                ])
-                        
-                        # Cache the results
-                        save_to_cache(cache_key, results)
-                        return results
-                        
-                    except (json.JSONDecodeError, ValueError) as e:
-                        logging.error(f"Error parsing model response: {str(e)}")
-                        logging.debug(f"Raw response: {content[:500]}...")
-                        
-                        if attempt < max_retries - 1:
-                            logging.info(f"Retrying batch processing (attempt {attempt+2}/{max_retries})...")
-                            continue
-                        else:
-                            raise ValueError(f"Failed to parse model response after {max_retries} attempts")
-                
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        logging.warning(f"Ollama connection error: {str(e)}. Retrying in 2 seconds...")
-                        time.sleep(2)
-                        continue
-                    else:
-                        logging.error(f"Ollama failed after {max_retries} attempts: {str(e)}")
-                        raise
+            category_names = {cat['name'] for cat in categories}
+            
+            def commit_item(index, item):
+                if not isinstance(item, dict) or item.get('category') not in category_names:
+                    return
+                expense = batch[index]
+                row = [item.get('description', expense['description']), item['category'], expense['amount']]
+                save_to_cache(get_cache_key([expense]), [row], categories)
+                if item_callback:
+                    item_callback(index)
+            
+            if ESCALATION_MODE:
+                results = categorize_with_escalation(batch, categories, prompt_template, on_item=commit_item)
+            else:
+                items = query_model(batch, categories, prompt_template, MODEL, on_item=commit_item)
+                results = results_from_items(batch, items, categories)
+            
+            # Cache the results
+            save_to_cache(cache_key, results, categories)
+            return results
         
-        # If Ollama is not available or all retries failed, use fallback
+        # If Ollama is not available, use fallback
         logging.info("Using fallback categorization method")
         results = []
         for expense in batch:
@@ -329,7 +585,7 @@ def categorize_expense_batch(batch, categories, prompt_template, force_recategor
             results.append([expense['description'], category, expense['amount']])
         
         # Cache the results
-        save_to_cache(cache_key, results)
+        save_to_cache(cache_key, results, categories)
         return results
             
     except Exception as e:
@@ -373,66 +629,88 @@ def categorize_expenses(expenses, categories, spinner=None, force_recategorize=F
     prompt_template = load_prompt_template()
     
     # Split expenses into batches for more efficient processing
-    batch_size = 5  # Reduced batch size for better performance
-    batches = [expenses_copy[i:i+batch_size] for i in range(0, len(expenses_copy), batch_size)]
+    batches = [expenses_copy[i:i+BATCH_SIZE] for i in range(0, len(expenses_copy), BATCH_SIZE)]
     total_batches = len(batches)
     
-    # Process each batch
-    all_results = []
-    categorized_count = 0
-    
     # Set up progress tracking
     total_expenses = len(expenses_copy)
     
-    for i, batch in enumerate(batches):
-        progress_pct = (i / total_batches)
-        status_msg = f"Categorizing expenses ({i+1}/{total_batches} batches, {progress_pct*100:.1f}% complete)"
-        
+    # Progress counts expenses rather than batches, so it moves while a batch streams
+    items_done = [0] * total_batches
+    progress_lock = threading.Lock()
+    
+    def report_progress():
+        with progress_lock:
+            done_items = sum(items_done)
+            done_batches = completed
+        progress_pct = done_items / total_expenses
+        status_msg = (f"Categorizing expenses ({done_items}/{total_expenses} expenses, "
+                      f"{done_batches}/{total_batches} batches, {progress_pct*100:.1f}% complete)")
         if spinner:
             spinner.text = status_msg
-        
         update_progress(status_msg, progress_pct)
-        logging.info(f"Processing batch {i+1}/{total_batches} ({progress_pct*100:.1f}%)")
+    
+    def item_done(i):
+        with progress_lock:
+            items_done[i] = min(items_done[i] + 1, len(batches[i]))
+        report_progress()
+    
+    def process_batch(i, batch):
+        """Categorize one batch, skipping the model when every expense is cached"""
+        # Check if we can use cached results for all expenses
+        all_cached = True
+        for expense in batch:
+            if force_recategorize:
+                all_cached = False
+                break
+            
+            # Check if this specific expense has cached results
+            batch_key = get_cache_key([expense])
+            if not get_valid_cached_results(batch_key, categories, prompt_template):
+                all_cached = False
+                break
         
-        try:
-            # Check if we can use cached results for all expenses
-            all_cached = True
+        if all_cached:
+            # If all expenses in this batch have cached results, we can skip processing
+            logging.info(f"Using cached results for all expenses in batch {i+1}/{total_batches}")
+            results = []
             for expense in batch:
-                if force_recategorize:
-                    all_cached = False
-                    break
-                
-                # Check if this specific expense has cached results
-                batch_key = get_cache_key([expense])
-                if not get_cached_results(batch_key):
-                    all_cached = False
-                    break
-            
-            if all_cached:
-                # If all expenses in this batch have cached results, we can skip processing
-                cache_status = f"Using cached results for batch {i+1}/{total_batches}"
-                update_progress(cache_status, progress_pct)
-                logging.info("Using cached results for all expenses")
-                
-                for expense in batch:
-                    batch_key = get_cache_key([expense])
-                    cached = get_cached_results(batch_key)
-                    if cached and len(cached) > 0:
-                        all_results.extend(cached)
-                        categorized_count += 1
-                continue
-            
-            # Process the batch
-            batch_results = categorize_expense_batch(batch, categories, prompt_template, force_recategorize)
+                cached = get_cached_results(get_cache_key([expense]))
+                if cached and len(cached) > 0:
+                    results.extend(cached)
+            return results
+        
+        # Process the batch, moving progress as each streamed item is committed
+        batch_results = categorize_expense_batch(
+            batch, categories, prompt_template, force_recategorize,
+            item_callback=lambda index: item_done(i)
+        )
+        if not batch_results:
+            logging.warning(f"No results for batch {i+1}")
+        return batch_results or []
+    
+    # Batches run concurrently up to the capacity of the Ollama pool, so adding
+    # endpoints increases throughput; results are kept in the original order
+    batch_results = [None] * total_batches
+    completed = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(total_batches, ollama_pool.capacity()))) as executor:
+        futures = {executor.submit(process_batch, i, batch): i for i, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                batch_results[i] = future.result()
+            except Exception as e:
+                logging.error(f"Error processing batch {i+1}: {str(e)}")
+                batch_results[i] = []
             
-            if batch_results:
-                all_results.extend(batch_results)
-                categorized_count += len(batch_results)
-            else:
-                logging.warning(f"No results for batch {i+1}")
-                
-        except Exception as e:
-            logging.error(f"Error processing batch {i+1}: {str(e)}")
+            with progress_lock:
+                completed += 1
+                items_done[i] = len(batches[i])
+            report_progress()
+            logging.info(f"Processed batch {i+1} ({completed}/{total_batches})")
+    
+    all_results = [row for results in batch_results for row in results]
+    categorized_count = len(all_results)
     
     # Set final progress
     final_status = f"Categorized {categorized_count}/{total_expenses} expenses"
@@ -443,81 +721,90 @@ def categorize_expenses(expenses, categories, spinner=None, force_recategorize=F
     
     return all_results
 
+def resolve_csv_columns(columns):
+    """Map the Recipient, Amount and Date fields onto the actual CSV header names"""
+    alt_columns = {'Recipient': 'description', 'Amount': 'amount', 'Date': 'date'}
+    resolved = {}
+    for req_col, alt_col in alt_columns.items():
+        if req_col in columns:
+            resolved[req_col] = req_col
+        elif alt_col in columns:
+            resolved[req_col] = alt_col
+        else:
+            # Try case-insensitive matching as fallback
+            resolved[req_col] = next((col for col in columns if str(col).lower() == req_col.lower()), None)
+    return resolved
+
+def parse_amounts(series):
+    """Convert an amount column to floats, treating missing or unparseable values as 0"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float).fillna(0)
+    cleaned = series.astype(str).str.replace(',', '', regex=False)
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0)
+
+def iter_expense_batches(csv_file_path, start_date=None, end_date=None, chunksize=CSV_CHUNK_SIZE):
+    """Stream expenses from a CSV file, yielding one list of expense dictionaries per chunk.
+
+    Only the needed columns are read, amounts and dates are parsed column-wise and the
+    date filter is applied to each chunk, so memory stays bounded by the chunk size.
+    """
+    if not os.path.exists(csv_file_path):
+        logging.error(f"CSV file does not exist: {csv_file_path}")
+        return
+
+    # Read just the header to work out which columns to load
+    header = pd.read_csv(csv_file_path, nrows=0).columns.tolist()
+    logging.info(f"CSV columns: {header}")
+
+    columns = resolve_csv_columns(header)
+    missing_columns = [col for col in ('Recipient', 'Amount') if columns[col] is None]
+    if missing_columns:
+        logging.error(f"CSV missing required columns: {missing_columns}")
+        return
+
+    date_col = columns['Date']
+    usecols = [col for col in columns.values() if col is not None]
+
+    filter_by_date = bool(start_date and end_date and date_col)
+    if filter_by_date:
+        start = pd.to_datetime(start_date)
+        end = pd.to_datetime(end_date)
+
+    for chunk in pd.read_csv(csv_file_path, usecols=usecols, chunksize=chunksize):
+        amounts = parse_amounts(chunk[columns['Amount']])
+
+        if date_col:
+            dates = pd.to_datetime(chunk[date_col], errors='coerce')
+            if filter_by_date:
+                mask = (dates >= start) & (dates <= end)
+                chunk, amounts, dates = chunk[mask], amounts[mask], dates[mask]
+            date_strs = dates.dt.strftime('%Y-%m-%d').astype(object).where(dates.notna(), None).tolist()
+        else:
+            date_strs = [None] * len(chunk)
+
+        if chunk.empty:
+            continue
+
+        yield [
+            {'description': description, 'amount': amount, 'date': date}
+            for description, amount, date in zip(chunk[columns['Recipient']].tolist(), amounts.tolist(), date_strs)
+        ]
+
 def read_expenses_from_csv(csv_file_path, start_date=None, end_date=None):
     """Read expenses from a CSV file"""
     try:
-        if not os.path.exists(csv_file_path):
-            logging.error(f"CSV file does not exist: {csv_file_path}")
-            return []
-        
-        # Read the CSV file
-        df = pd.read_csv(csv_file_path)
-        
-        # Check if the CSV has the expected columns
-        required_columns = ['Recipient', 'Amount']
-        alt_columns = {'Recipient': 'description', 'Amount': 'amount'}
-        
-        # Log the actual columns for debugging
-        logging.info(f"CSV columns: {df.columns.tolist()}")
-        
-        # Check and rename columns if needed
-        columns_to_rename = {}
-        for req_col, alt_col in alt_columns.items():
-            if req_col not in df.columns and alt_col in df.columns:
-                columns_to_rename[alt_col] = req_col
-        
-        if columns_to_rename:
-            df = df.rename(columns=columns_to_rename)
-        
-        # Ensure required columns exist
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            # Try case-insensitive matching as fallback
-            for missing_col in missing_columns.copy():
-                for col in df.columns:
-                    if col.lower() == missing_col.lower():
-                        df = df.rename(columns={col: missing_col})
-                        missing_columns.remove(missing_col)
-                        break
-        
-        if missing_columns:
-            logging.error(f"CSV missing required columns: {missing_columns}")
-            return []
-        
-        # Convert amount to float
-        try:
-            df['Amount'] = df['Amount'].apply(lambda x: float(str(x).replace(',', '')) if pd.notnull(x) else 0)
-        except Exception as e:
-            logging.error(f"Error converting amounts to float: {str(e)}")
-        
-        # Filter by date if provided
-        if start_date and end_date and 'Date' in df.columns:
-            try:
-                df['Date'] = pd.to_datetime(df['Date'])
-                start = pd.to_datetime(start_date)
-                end = pd.to_datetime(end_date)
-                df = df[(df['Date'] >= start) & (df['Date'] <= end)]
-            except Exception as e:
-                logging.error(f"Error filtering by date: {str(e)}")
-        
-        # Convert to list of dictionaries
         expenses = []
-        for _, row in df.iterrows():
-            expense = {
-                'description': row['Recipient'],
-                'amount': row['Amount'],
-                'date': row['Date'].strftime('%Y-%m-%d') if 'Date' in df.columns and pd.notnull(row['Date']) else None
-            }
-            expenses.append(expense)
-        
+        for batch in iter_expense_batches(csv_file_path, start_date, end_date):
+            expenses.extend(batch)
+
         logging.info(f"Read {len(expenses)} expenses from CSV")
         return expenses
     except Exception as e:
         logging.error(f"Error reading expenses from CSV: {str(e)}")
         return []
 
-def generate_final_report(image_path, api_key):
-    url = "https://api.deepseek.com/analyze"  # Example endpoint
+def generate_final_report(image_path, api_key, url):
+    """Post the chart image path to the report service at url; returns its JSON reply or None"""
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -526,68 +813,280 @@ def generate_final_report(image_path, api_key):
         "image_path": image_path
     }
     
-    response = requests.post(url, headers=headers, json=data)
+    try:
+        response = requests.post(url, headers=headers, json=data, timeout=30)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error generating report: {str(e)}")
+        return None
     
     if response.status_code == 200:
         report = response.json()
-        print("Final Report:", report)
+        logging.info(f"Final Report: {report}")
+        return report
     else:
-        print("Error generating report:", response.text)
-
-def visualize_expenses(categorized_expenses):
-    categories = {}
-    for expense in categorized_expenses:
-        category = expense[1]  # Assuming the category is at index 1
-        amount = expense[2]     # Assuming the amount is at index 2
-        if category in categories:
-            categories[category] += amount
-        else:
-            categories[category] = amount
-
-    print("Aggregated Categories:", categories)  # Debugging line
-
-    # Plotting
-    plt.figure(figsize=(10, 6))
-    plt.bar(categories.keys(), categories.values(), color='skyblue')
-    plt.xlabel('Categories')
-    plt.ylabel('Total Amount')
-    plt.title('Categorized Expenses')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.show()
-
-    # Save the figure to the result_graph_image folder
-    save_path = os.path.join(os.path.dirname(__file__), 'result_graph_image', 'categorized_expenses_graph.png')
-    plt.savefig(save_path)
-    plt.close()  # Close the figure to free up memory
-
-    # Generate the final report after saving the graph
-    api_key = "sk-d75907eae31d479d875f9b3578ddb9e5"  # Your actual API key
-    generate_final_report(save_path, api_key)
-
-    print("Categorized Expenses for Visualization:", categorized_expenses)  # Debugging line
-
-def send_to_dashboard(categorized_expenses):
-    """Save categorized expenses to a file to be read by the Flask app.
-    This avoids the 404 error when trying to POST to a non-existent API endpoint.
+        logging.error(f"Error generating report: {response.text}")
+        return None
+
+def visualize_expenses(categorized_expenses, expenses=None, formats=('png',), generate_report=True):
+    """Render the category (and, for dated expenses, trend) charts in the background.
+
+    Charts are rendered headlessly and cached by a hash of the aggregated data, so
+    unchanged data costs no rendering. If DEEPSEEK_REPORT_URL and DEEPSEEK_API_KEY are
+    set, the report request is chained onto the category chart instead of blocking the
+    caller; otherwise no report is requested.
+
+    Returns:
+        A dictionary of {(kind, format): Future} resolving to the chart image paths.
+    """
+    logging.debug(f"Aggregated Categories: {aggregate_by_category(categorized_expenses)}")
+
+    charts = render_expense_charts(categorized_expenses, expenses, formats)
+
+    category_chart = charts.get(('category', 'png'))
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    report_url = os.getenv("DEEPSEEK_REPORT_URL")
+    if generate_report and not (api_key and report_url):
+        logging.info("DEEPSEEK_REPORT_URL or DEEPSEEK_API_KEY is not set, skipping the expense report")
+    elif generate_report and category_chart is not None:
+
+        def report_when_rendered(future):
+            if future.exception() is None:
+                generate_final_report(future.result(), api_key, report_url)
+
+        category_chart.add_done_callback(report_when_rendered)
+
+    return charts
+
+def send_to_dashboard(categorized_expenses, categories=None):
+    """Publish categorized expenses for the Flask app.
+
+    The results are kept in memory for callers in the same process and written as a
+    compact, versioned snapshot for other processes. The snapshot is written to a
+    temporary file and renamed into place, so readers see either the previous or the
+    new version, never a partial file. The category definitions are saved alongside
+    so a later edit to categories.yaml can be applied incrementally (see recategorize.py).
+
+    Returns:
+        The version number of the published results, or None if saving failed.
     """
+    global latest_results
     try:
-        # Save the data to a file in the model directory
-        output_file = os.path.join(os.path.dirname(__file__), 'categorized_expenses.json')
-        with open(output_file, 'w') as f:
-            json.dump({"expenses": categorized_expenses}, f, indent=2)
-        logging.info(f"Saved {len(categorized_expenses)} categorized expenses to {output_file} for dashboard display")
-        return True
+        with results_lock:
+            previous_version = latest_results["version"] if latest_results else 0
+            data = {
+                "version": max(time.time_ns(), previous_version + 1),
+                "expenses": categorized_expenses
+            }
+            if categories:
+                data["categories"] = category_definitions(categories)
+
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(RESULTS_FILE), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f, separators=(',', ':'))
+                os.replace(tmp_path, RESULTS_FILE)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            latest_results = data
+
+        logging.info(f"Published {len(categorized_expenses)} categorized expenses as version {data['version']}")
+        return data["version"]
     except Exception as e:
         logging.error(f"Error saving categorized expenses: {str(e)}")
-        return False
+        return None
+
+def load_latest_results(min_version=0):
+    """Get the latest published results ({"version", "expenses", ...}).
+
+    Uses the in-memory copy when this process published it, otherwise reads the
+    snapshot file once. Returns None if nothing at least as new as min_version exists.
+    """
+    with results_lock:
+        data = latest_results
+    if data is None and os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, 'r') as f:
+            data = json.load(f)
+    if data is None or data.get("version", 0) < min_version:
+        return None
+    return data
+
+def build_arg_parser():
+    """Command line options for categorizing an expense export"""
+    parser = argparse.ArgumentParser(description="Categorize expenses with Ollama")
+    parser.add_argument('--input-file', default=None,
+                        help="CSV export to categorize (default: Gmail_Scrap/cached_transactions.csv)")
+    parser.add_argument('--output-file', default=None,
+                        help="Stream results to this JSON Lines file, checkpointing progress so reruns resume")
+    parser.add_argument('--start-date', default=None, help="Only include expenses on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--end-date', default=None, help="Only include expenses on or before this date (YYYY-MM-DD)")
+    parser.add_argument('--force-recategorize', action='store_true', help="Ignore cached results")
+    parser.add_argument('--checkpoint-file', default=None,
+                        help="Where to keep resume state (default: <output-file>.checkpoint)")
+    parser.add_argument('--checkpoint-every', type=int, default=10, help="Batches between checkpoints")
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help="Start from the beginning even if a checkpoint exists")
+    return parser
+
+def parse_args(argv=None):
+    return build_arg_parser().parse_args(argv)
+
+def file_signature(path):
+    """Identify an input file so a checkpoint is only reused for the same data"""
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+def load_checkpoint(checkpoint_file, signature, output_file):
+    """Load a checkpoint if it was written for this input and output"""
+    if not os.path.exists(checkpoint_file):
+        return None
+    try:
+        with open(checkpoint_file, 'r') as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable checkpoint {checkpoint_file}: {e}")
+        return None
+    if checkpoint.get("input") != signature or checkpoint.get("output") != os.path.abspath(output_file):
+        logging.warning(f"Ignoring checkpoint {checkpoint_file}: it was written for a different input, options or output")
+        return None
+    # Truncating a missing or shortened output to the offset would pad it with NUL bytes
+    output_size = os.path.getsize(output_file) if os.path.exists(output_file) else -1
+    if output_size < checkpoint.get("output_offset", 0):
+        logging.warning(f"Ignoring checkpoint {checkpoint_file}: {output_file} is missing or shorter than checkpointed")
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    """Atomically replace the checkpoint file"""
+    tmp_path = f"{checkpoint_file}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_file)
+
+def run_bulk(args, progress_callback=None):
+    """Stream an input CSV through categorization, appending results to a JSON Lines file.
+
+    Every args.checkpoint_every batches the output is flushed and the number of
+    completed batches and the output size in bytes are checkpointed. A rerun with the
+    same input, date filters, force_recategorize and output truncates anything written
+    after the last checkpoint and resumes from the next batch. The checkpoint is removed once the whole input is done.
+
+    Returns:
+        A dictionary with the number of batches and expenses processed.
+    """
+    input_file = args.input_file or "Gmail_Scrap/cached_transactions.csv"
+    output_file = args.output_file
+    checkpoint_file = args.checkpoint_file or f"{output_file}.checkpoint"
+    checkpoint_every = max(1, args.checkpoint_every)
+
+    if not os.path.exists(input_file):
+        raise ExpenseTrackerError(f"Input file does not exist: {input_file}")
+
+    # Results depend on the filters and on whether cached categories are reused
+    signature = dict(
+        file_signature(input_file),
+        start_date=args.start_date,
+        end_date=args.end_date,
+        force_recategorize=args.force_recategorize
+    )
+    checkpoint = load_checkpoint(checkpoint_file, signature, output_file) if args.resume else None
+    skip_batches = checkpoint["completed_batches"] if checkpoint else 0
+    expense_count = checkpoint["expenses"] if checkpoint else 0
+
+    if checkpoint:
+        logging.info(f"Resuming from checkpoint: {skip_batches} batches ({expense_count} expenses) already done")
+        with open(output_file, 'ab') as f:
+            f.truncate(checkpoint["output_offset"])
+        mode = 'ab'
+    else:
+        mode = 'wb'
+
+    categories = load_categories()
+    prompt_template = load_prompt_template()
+
+    def batches():
+        pending = []
+        for chunk in iter_expense_batches(input_file, args.start_date, args.end_date):
+            pending.extend(chunk)
+            while len(pending) >= BATCH_SIZE:
+                yield pending[:BATCH_SIZE]
+                pending = pending[BATCH_SIZE:]
+        if pending:
+            yield pending
+
+    batch_index = 0
+    # Binary, so tell() is a byte offset that truncate() can take back to
+    with open(output_file, mode) as out:
+        for batch_index, batch in enumerate(batches(), 1):
+            if batch_index <= skip_batches:
+                continue
+
+            results = categorize_expense_batch(batch, categories, prompt_template, args.force_recategorize)
+            for offset, expense in enumerate(batch):
+                category = results[offset][1] if offset < len(results) else fallback_categorize_expense(expense, categories)
+                record = {
+                    "date": expense.get('date'),
+                    "description": expense['description'],
+                    "category": category,
+                    "amount": expense['amount']
+                }
+                out.write((json.dumps(record, ensure_ascii=False, default=str) + "\n").encode('utf-8'))
+            expense_count += len(batch)
+
+            if batch_index % checkpoint_every == 0:
+                out.flush()
+                os.fsync(out.fileno())
+                save_checkpoint(checkpoint_file, {
+                    "input": signature,
+                    "output": os.path.abspath(output_file),
+                    "output_offset": out.tell(),
+                    "completed_batches": batch_index,
+                    "expenses": expense_count
+                })
+                status = f"Categorized {expense_count} expenses ({batch_index} batches)"
+                logging.info(status)
+                if progress_callback:
+                    progress_callback(status, None)
+
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    logging.info(f"Bulk categorization complete: {expense_count} expenses written to {output_file}")
+    return {"batches": batch_index, "expenses": expense_count, "output_file": output_file}
+
+def run_cli(argv=None):
+    """Entry point for python -m model.init"""
+    args = parse_args(argv)
+    if args.output_file:
+        return run_bulk(args)
+    # Read here rather than in main so the dated expenses can also be charted by month
+    csv_file_path = args.input_file or "Gmail_Scrap/cached_transactions.csv"
+    expenses = [
+        Transaction.from_dict(expense)
+        for expense in read_expenses_from_csv(csv_file_path, args.start_date, args.end_date)
+    ]
+    categorized_expenses = main(args, transactions=expenses)
+    if categorized_expenses:
+        # The Flask app renders its charts on request (/api/charts); here they are
+        # written out once the run is done
+        for (kind, fmt), future in visualize_expenses(categorized_expenses, expenses).items():
+            try:
+                logging.info(f"Saved {kind} chart to {future.result()}")
+            except Exception as e:
+                logging.error(f"Error rendering {kind} chart: {str(e)}")
+    return categorized_expenses
 
 def main(args=None, transactions=None, progress_callback=None):
     """Main function to categorize expenses and generate visualizations.
     
     Args:
         args: An object with start_date and end_date attributes for filtering expenses.
-        transactions: A list of transaction dictionaries that can be directly processed.
+        transactions: A list of Transaction records (or transaction dictionaries) that can
+            be directly processed; records are categorized as they are, without copying.
         progress_callback: A function to call with progress updates.
     
     Returns:
@@ -601,48 +1100,23 @@ def main(args=None, transactions=None, progress_callback=None):
                 progress_callback(status, percent)
             return
         
-        # Create a default Args object if none is provided or if it's not the right type
+        # Use the CLI defaults if no usable args object is provided
         if args is None or not hasattr(args, 'start_date') or not hasattr(args, 'end_date'):
-            class Args:
-                def __init__(self):
-                    self.start_date = None
-                    self.end_date = None
-                    self.input_file = None
-                    self.output_file = None
-                    self.categories_file = "config/categories.yaml"
-                    self.prompt_file = "config/prompt.yaml"
-                    self.force_recategorize = False
-                    self.use_openai = False
-            args = Args()
+            args = parse_args([])
         
         # Load categories
         categories = load_categories()
         
-        # Set the model name
-        model_name = "llama3"
-        
         if transactions is not None:
             # If transactions are directly provided, use them instead of reading from CSV
-            update_progress("Processing provided transactions", 85)
-            expenses = []
-            for txn in transactions:
-                try:
-                    expense = {
-                        'date': txn.get('date', datetime.now().strftime('%Y-%m-%d')),
-                        'amount': float(txn.get('amount', 0)),
-                        'description': txn.get('recipient', 'Unknown'),
-                        'category': '',  # Will be filled in by categorization
-                        'transaction_id': txn.get('txn_id', '')
-                    }
-                    expenses.append(expense)
-                except (ValueError, TypeError) as e:
-                    logging.warning(f"Failed to convert transaction to expense: {e}")
+            update_progress("Processing provided transactions", 5)
+            expenses = [Transaction.from_dict(txn) for txn in transactions]
             
-            update_progress("Prepared transactions for categorization", 90)
+            update_progress("Prepared transactions for categorization", 10)
         else:
             # Default behavior - read from CSV
             csv_file_path = args.input_file or "Gmail_Scrap/cached_transactions.csv"
-            update_progress("Reading expenses from CSV", 80)
+            update_progress("Reading expenses from CSV", 5)
             expenses = read_expenses_from_csv(csv_file_path, args.start_date, args.end_date)
         
         if not expenses:
@@ -650,21 +1124,20 @@ def main(args=None, transactions=None, progress_callback=None):
             return {}
 
         # Define a progress callback that maps from categorization progress to overall progress
-        def categorization_progress(status, percent):
-            # Map from 0-100% in categorization to 40-95% of overall progress
-            mapped_percent = 40 + (percent * 0.55)
-            update_progress(status, mapped_percent)
+        def categorization_progress(status, fraction):
+            # categorize_expenses reports a 0-1 fraction; map it to 20-95% of overall progress
+            update_progress(status, None if fraction is None else 20 + fraction * 75)
             
         # Check if Ollama is running and try to start it if not
         ollama_running = check_ollama_running()
         if not ollama_running:
-            update_progress("Starting Ollama service...", 60)
+            update_progress("Starting Ollama service...", 15)
             ollama_started = start_ollama()
             if not ollama_started:
                 logging.warning("Could not start Ollama. Will use fallback categorization.")
         
         # Categorize expenses
-        update_progress("Categorizing expenses...", 60)
+        update_progress("Categorizing expenses...", 20)
         categorized_expenses = categorize_expenses(
             expenses, 
             categories, 
@@ -680,7 +1153,7 @@ def main(args=None, transactions=None, progress_callback=None):
         
         # Attempt to send to dashboard API
         try:
-            send_to_dashboard(categorized_expenses)
+            send_to_dashboard(categorized_expenses, categories)
         except Exception as e:
             logging.warning(f"Failed to send to dashboard API: {e}")
         
@@ -695,4 +1168,4 @@ def main(args=None, transactions=None, progress_callback=None):
         return {}
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_cli()
\ No newline at end of file
@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+import time
+
+import httpx
+import ollama
+import requests
+
+# Seconds a health check result is trusted before /api/tags is queried again
+HEALTH_TTL = 10
+
+# Longest an endpoint is skipped after repeated failures
+MAX_BACKOFF = 60
+
+
+def normalize_host(host):
+    """Turn an OLLAMA_HOST style value (e.g. 'localhost:11434') into a base URL"""
+    host = host.strip().rstrip('/')
+    if not host.startswith(('http://', 'https://')):
+        host = f"http://{host}"
+    return host
+
+
+class EndpointError(Exception):
+    """An endpoint could not serve a request (connection failure or server error)"""
+
+
+class Endpoint:
+    """One Ollama server in the pool, with its load and health bookkeeping"""
+
+    def __init__(self, host, max_parallel=1, timeout=120):
+        self.host = normalize_host(host)
+        self.max_parallel = max(1, max_parallel)
+        self.client = ollama.Client(host=self.host, timeout=timeout)
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.retry_at = 0.0
+        self.checked_at = 0.0
+        self.requests = 0
+
+    def available(self, now):
+        """Healthy, or unhealthy long enough ago that it deserves another try"""
+        return self.healthy or now >= self.retry_at
+
+    def status(self):
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_parallel": self.max_parallel,
+            "failures": self.failures,
+            "requests": self.requests
+        }
+
+
+def parse_hosts(value):
+    """Parse 'host[@parallel],host[@parallel],...' into (host, parallel) pairs"""
+    hosts = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, parallel = item.partition('@')
+        hosts.append((host, int(parallel) if parallel else None))
+    return hosts
+
+
+class OllamaPool:
+    """Dispatches chat requests across several Ollama servers.
+
+    Each request goes to the available endpoint with the fewest outstanding requests.
+    When every endpoint is at its max_parallel limit, callers wait for a free slot
+    instead of piling more work onto one server. An endpoint that fails is marked
+    unhealthy and skipped with exponential backoff, and the request fails over to the
+    next endpoint.
+    """
+
+    def __init__(self, hosts, max_parallel=1, timeout=120):
+        self.endpoints = []
+        for host, parallel in hosts:
+            self.endpoints.append(Endpoint(host, parallel or max_parallel, timeout))
+        if not self.endpoints:
+            raise ValueError("OllamaPool needs at least one host")
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """Build the pool from OLLAMA_HOSTS (comma-separated, optional '@parallel'),
+        falling back to OLLAMA_HOST and then the default local server"""
+        hosts = parse_hosts(os.getenv('OLLAMA_HOSTS')) or parse_hosts(os.getenv('OLLAMA_HOST', 'localhost:11434'))
+        max_parallel = int(os.getenv('OLLAMA_MAX_PARALLEL', '1'))
+        return cls(hosts, max_parallel=max_parallel)
+
+    @property
+    def hosts(self):
+        return [endpoint.host for endpoint in self.endpoints]
+
+    def capacity(self):
+        """Total number of requests the pool runs at once"""
+        return sum(endpoint.max_parallel for endpoint in self.endpoints)
+
+    def status(self):
+        with self.condition:
+            return [endpoint.status() for endpoint in self.endpoints]
+
+    def check_health(self, force=False):
+        """Probe /api/tags on endpoints whose last check is stale; returns True if any is healthy"""
+        now = time.time()
+        for endpoint in self.endpoints:
+            if not force and now - endpoint.checked_at < HEALTH_TTL:
+                continue
+            try:
+                response = requests.get(f"{endpoint.host}/api/tags", timeout=3)
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            with self.condition:
+                endpoint.checked_at = time.time()
+                if ok:
+                    self._mark_healthy(endpoint)
+                else:
+                    self._mark_failed(endpoint, "health check failed")
+                self.condition.notify_all()
+        return any(endpoint.healthy for endpoint in self.endpoints)
+
+    def _mark_healthy(self, endpoint):
+        if not endpoint.healthy:
+            logging.info(f"Ollama endpoint {endpoint.host} is healthy again")
+        endpoint.healthy = True
+        endpoint.failures = 0
+
+    def _mark_failed(self, endpoint, reason):
+        endpoint.failures += 1
+        endpoint.retry_at = time.time() + min(MAX_BACKOFF, 2 ** endpoint.failures)
+        if endpoint.healthy:
+            logging.warning(f"Ollama endpoint {endpoint.host} marked unhealthy: {reason}")
+        endpoint.healthy = False
+
+    def _acquire(self, exclude):
+        """Wait for a slot on the least-loaded available endpoint not in exclude"""
+        with self.condition:
+            while True:
+                now = time.time()
+                candidates = [
+                    endpoint for endpoint in self.endpoints
+                    if endpoint not in exclude and endpoint.available(now)
+                ]
+                if not candidates:
+                    return None
+                free = [endpoint for endpoint in candidates if endpoint.outstanding < endpoint.max_parallel]
+                if free:
+                    endpoint = min(free, key=lambda e: (e.outstanding / e.max_parallel, e.requests))
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+                self.condition.wait(timeout=1)
+
+    def _release(self, endpoint):
+        with self.condition:
+            endpoint.outstanding -= 1
+            self.condition.notify_all()
+
+    def chat(self, info=None, **kwargs):
+        """ollama.chat on the least-loaded endpoint, failing over on endpoint errors
+
+        If an info dictionary is given it is filled with the serving 'endpoint' and the
+        'queue_wait' seconds spent waiting for a free slot.
+        """
+        tried = set()
+        last_error = None
+        queue_wait = 0.0
+        while len(tried) < len(self.endpoints):
+            wait_start = time.perf_counter()
+            endpoint = self._acquire(tried)
+            queue_wait += time.perf_counter() - wait_start
+            if endpoint is None:
+                break
+            tried.add(endpoint)
+            try:
+                response = endpoint.client.chat(**kwargs)
+                with self.condition:
+                    self._mark_healthy(endpoint)
+                if info is not None:
+                    info.update(endpoint=endpoint.host, queue_wait=queue_wait)
+                return response
+            except ollama.ResponseError as e:
+                if getattr(e, 'status_code', 0) < 500:
+                    raise
+                last_error = e
+                with self.condition:
+                    self._mark_failed(endpoint, str(e))
+            except (httpx.TransportError, ConnectionError, OSError) as e:
+                last_error = e
+                with self.condition:
+                    self._mark_failed(endpoint, str(e))
+            finally:
+                self._release(endpoint)
+            logging.warning(f"Ollama endpoint {endpoint.host} failed, trying another: {last_error}")
+
+        raise EndpointError(f"No Ollama endpoint could serve the request: {last_error}")
+
+    def chat_stream(self, info=None, **kwargs):
+        """Streaming ollama.chat: yields response chunks while holding the endpoint's slot
+
+        Fails over to another endpoint only until the first chunk has arrived. Closing
+        the generator early (e.g. to abort an off-format reply) closes the HTTP stream
+        and frees the slot.
+        """
+        tried = set()
+        last_error = None
+        queue_wait = 0.0
+        while len(tried) < len(self.endpoints):
+            wait_start = time.perf_counter()
+            endpoint = self._acquire(tried)
+            queue_wait += time.perf_counter() - wait_start
+            if endpoint is None:
+                break
+            tried.add(endpoint)
+            chunks = None
+            try:
+                chunks = endpoint.client.chat(stream=True, **kwargs)
+                first = next(chunks, None)
+            except ollama.ResponseError as e:
+                self._release(endpoint)
+                if getattr(e, 'status_code', 0) < 500:
+                    raise
+                last_error = e
+                with self.condition:
+                    self._mark_failed(endpoint, str(e))
+            except (httpx.TransportError, ConnectionError, OSError) as e:
+                self._release(endpoint)
+                last_error = e
+                with self.condition:
+                    self._mark_failed(endpoint, str(e))
+            except BaseException:
+                self._release(endpoint)
+                raise
+            else:
+                with self.condition:
+                    self._mark_healthy(endpoint)
+                if info is not None:
+                    info.update(endpoint=endpoint.host, queue_wait=queue_wait)
+                try:
+                    if first is not None:
+                        yield first
+                        yield from chunks
+                finally:
+                    chunks.close()
+                    self._release(endpoint)
+                return
+            logging.warning(f"Ollama endpoint {endpoint.host} failed, trying another: {last_error}")
+
+        raise EndpointError(f"No Ollama endpoint could serve the request: {last_error}")
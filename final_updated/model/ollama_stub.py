@@ -0,0 +1,356 @@
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .init import fallback_categorize_expense, load_categories
+
+
+class StubConfig:
+    """Behaviour of the stub server; every knob defaults to a fast, well-behaved model"""
+
+    def __init__(self, latency='fixed:0', per_item_latency=0.0, load_time=0.0, error_rate=0.0,
+                 truncate_rate=0.0, malformed_rate=0.0, max_concurrency=0, max_queue=0,
+                 seed=None, models=('llama3:latest',)):
+        self.latency = parse_latency(latency)
+        self.per_item_latency = per_item_latency
+        self.load_time = load_time
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.malformed_rate = malformed_rate
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.models = list(models)
+        self.random = random.Random(seed)
+
+
+def parse_latency(spec):
+    """Parse a latency distribution such as 'fixed:0.5', 'uniform:0.2,1.0',
+    'normal:0.8,0.2' or 'lognormal:-0.5,0.4' (all in seconds)"""
+    kind, _, params = str(spec).partition(':')
+    values = [float(value) for value in params.split(',') if value.strip()]
+    expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+    if kind not in expected or len(values) != expected[kind]:
+        raise ValueError(f"Invalid latency spec '{spec}'")
+    return kind, values
+
+
+def sample_latency(config):
+    kind, values = config.latency
+    rng = config.random
+    if kind == 'fixed':
+        seconds = values[0]
+    elif kind == 'uniform':
+        seconds = rng.uniform(values[0], values[1])
+    elif kind == 'normal':
+        seconds = rng.gauss(values[0], values[1])
+    else:
+        seconds = rng.lognormvariate(values[0], values[1])
+    return max(0.0, seconds)
+
+
+def extract_expenses(prompt):
+    """Pull the expense list out of a categorization prompt"""
+    match = re.search(r'\[\s*\{.*?\}\s*\]', prompt, re.DOTALL)
+    if not match:
+        return []
+    try:
+        expenses = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return []
+    return [expense for expense in expenses if isinstance(expense, dict) and 'description' in expense]
+
+
+def extract_categories(prompt):
+    """Pull '- Name: description' category lines out of a categorization prompt"""
+    section = prompt.split('Available categories:', 1)[-1]
+    categories = []
+    for line in section.splitlines():
+        match = re.match(r'^-\s*([^:]+):\s*(.+)$', line.strip())
+        if not match:
+            if categories:
+                break
+            continue
+        categories.append({'name': match.group(1).strip(), 'description': match.group(2).strip()})
+    return categories or load_categories()
+
+
+def extract_compact(prompt):
+    """Pull ({code: category}, descriptions) out of a compact 'index:code' prompt"""
+    categories = {}
+    descriptions = []
+    section = ''
+    for line in prompt.splitlines():
+        line = line.strip()
+        if line.startswith('Categorize each expense'):
+            section = 'categories'
+        elif line == 'Expenses:':
+            section = 'expenses'
+        elif section == 'categories':
+            match = re.match(r'^(\w+) = ([^:]+):\s*(.*)$', line)
+            if match:
+                categories[match.group(1)] = {'name': match.group(2).strip(), 'description': match.group(3).strip()}
+        elif section == 'expenses':
+            match = re.match(r'^\d+\.\s*(.*)$', line)
+            if match:
+                descriptions.append(match.group(1))
+    return categories, descriptions
+
+
+def build_compact_reply(prompt):
+    """Answer a compact prompt with 'index:code' lines"""
+    codes, descriptions = extract_compact(prompt)
+    categories = list(codes.values()) or load_categories()
+    code_for = {cat['name']: code for code, cat in codes.items()}
+    with_confidence = ':confidence' in prompt
+    lines = []
+    for index, description in enumerate(descriptions, start=1):
+        category = fallback_categorize_expense({'description': description, 'amount': 0}, categories)
+        line = f"{index}:{code_for.get(category, category)}"
+        if with_confidence:
+            line += ':0.3' if category == 'Extra' else ':0.9'
+        lines.append(line)
+    return "\n".join(lines), len(descriptions)
+
+
+def build_reply(prompt):
+    """Answer a categorization prompt the way llama3 is asked to, using the keyword rules
+
+    When the prompt asks for a confidence (two-tier escalation), items matched by a
+    keyword rule are reported as confident and items left in the default category are not.
+    """
+    if 'index:code' in prompt:
+        return build_compact_reply(prompt)
+    expenses = extract_expenses(prompt)
+    categories = extract_categories(prompt)
+    with_confidence = '"confidence"' in prompt
+    answer = []
+    for expense in expenses:
+        category = fallback_categorize_expense(expense, categories)
+        item = {'description': expense['description'], 'category': category}
+        if with_confidence:
+            item['confidence'] = 0.3 if category == 'Extra' else 0.9
+        answer.append(item)
+    return f"```json\n{json.dumps(answer, indent=2, ensure_ascii=False)}\n```", len(expenses)
+
+
+class StubState:
+    """Shared counters and the concurrency gate of a running stub"""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(config.max_concurrency) if config.max_concurrency else None
+        self.waiting = 0
+        self.loaded = False
+        self.stats = {'requests': 0, 'errors': 0, 'rejected': 0, 'truncated': 0, 'malformed': 0, 'in_flight': 0, 'peak_in_flight': 0}
+
+    def count(self, key, delta=1):
+        with self.lock:
+            self.stats[key] += delta
+            if key == 'in_flight':
+                self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = 'OllamaStub/1.0'
+
+    def log_message(self, format, *args):
+        logging.debug(f"ollama-stub: {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.server.state
+        if self.path.rstrip('/') == '/api/tags':
+            self._send_json(200, {'models': [
+                {'name': name, 'model': name, 'modified_at': '2024-01-01T00:00:00Z', 'size': 0, 'details': {'family': 'stub'}}
+                for name in state.config.models
+            ]})
+        elif self.path.rstrip('/') == '/stub/stats':
+            with state.lock:
+                self._send_json(200, dict(state.stats))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/api/chat':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        state = self.server.state
+        config = state.config
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': 'invalid JSON body'})
+            return
+        state.count('requests')
+
+        # Concurrency limit: queue like Ollama does, and reject once the queue is full
+        if state.slots is not None:
+            with state.lock:
+                if config.max_queue and state.waiting >= config.max_queue:
+                    state.stats['rejected'] += 1
+                    self._send_json(503, {'error': 'server busy, please try again. maximum pending requests exceeded'})
+                    return
+                state.waiting += 1
+            queued_at = time.perf_counter()
+            state.slots.acquire()
+            with state.lock:
+                state.waiting -= 1
+            queue_wait = time.perf_counter() - queued_at
+        else:
+            queue_wait = 0.0
+
+        state.count('in_flight')
+        try:
+            self._answer_chat(request, queue_wait)
+        finally:
+            state.count('in_flight', -1)
+            if state.slots is not None:
+                state.slots.release()
+
+    def _answer_chat(self, request, queue_wait):
+        state = self.server.state
+        config = state.config
+        rng = config.random
+        messages = request.get('messages') or []
+        prompt = messages[-1].get('content', '') if messages else ''
+        model = request.get('model', config.models[0])
+
+        load_seconds = 0.0
+        with state.lock:
+            if not state.loaded:
+                state.loaded = True
+                load_seconds = config.load_time
+
+        content, item_count = build_reply(prompt)
+        eval_seconds = sample_latency(config) + config.per_item_latency * item_count
+
+        if rng.random() < config.error_rate:
+            time.sleep(load_seconds + eval_seconds / 2)
+            state.count('errors')
+            self._send_json(500, {'error': 'stub: injected model failure'})
+            return
+        if rng.random() < config.malformed_rate:
+            state.count('malformed')
+            content = "Sure! Here are the categories you asked for: Food, Transport and a few others."
+        elif rng.random() < config.truncate_rate:
+            state.count('truncated')
+            content = content[:max(1, len(content) // 2)]
+
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        stats = {
+            'total_duration': int((load_seconds + eval_seconds) * 1e9),
+            'load_duration': int(load_seconds * 1e9),
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(eval_seconds * 0.2 * 1e9),
+            'eval_count': completion_tokens,
+            'eval_duration': int(eval_seconds * 0.8 * 1e9),
+        }
+        created_at = datetime.now(timezone.utc).isoformat()
+
+        if request.get('stream', True):
+            self._stream_chat(model, content, created_at, load_seconds, eval_seconds, stats)
+            return
+
+        time.sleep(load_seconds + eval_seconds)
+        self._send_json(200, {
+            'model': model,
+            'created_at': created_at,
+            'message': {'role': 'assistant', 'content': content},
+            'done_reason': 'stop',
+            'done': True,
+            **stats
+        })
+
+    def _stream_chat(self, model, content, created_at, load_seconds, eval_seconds, stats):
+        """Send the reply as newline-delimited JSON chunks spread over the decode time"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+
+        time.sleep(load_seconds)
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)] or ['']
+        delay = eval_seconds / len(pieces)
+        try:
+            for piece in pieces:
+                time.sleep(delay)
+                chunk = {'model': model, 'created_at': created_at,
+                         'message': {'role': 'assistant', 'content': piece}, 'done': False}
+                self.wfile.write(json.dumps(chunk).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            final = {'model': model, 'created_at': created_at,
+                     'message': {'role': 'assistant', 'content': ''}, 'done_reason': 'stop', 'done': True, **stats}
+            self.wfile.write(json.dumps(final).encode('utf-8') + b'\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading early (e.g. aborted an off-format reply)
+            logging.debug("ollama-stub: client closed the stream")
+
+
+def make_server(config=None, host='127.0.0.1', port=11435):
+    """Create (but do not start) a stub server; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(config or StubConfig())
+    return server
+
+
+def serve_in_thread(config=None, host='127.0.0.1', port=0):
+    """Start a stub server on a background thread and return (server, base_url)"""
+    server = make_server(config, host, port)
+    thread = threading.Thread(target=server.serve_forever, name='ollama-stub', daemon=True)
+    thread.start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ollama-compatible stub server for load testing categorization")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency', default='fixed:0',
+                        help="Per-request latency: fixed:S, uniform:MIN,MAX, normal:MEAN,STD or lognormal:MU,SIGMA (seconds)")
+    parser.add_argument('--per-item-latency', type=float, default=0.0, help="Extra seconds per expense in the prompt")
+    parser.add_argument('--load-time', type=float, default=0.0, help="Model load time added to the first request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help="Fraction of replies cut off halfway")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="Fraction of replies that are not JSON")
+    parser.add_argument('--max-concurrency', type=int, default=0, help="Requests processed at once (0 = unlimited)")
+    parser.add_argument('--max-queue', type=int, default=0, help="Requests allowed to wait for a slot before 503s (0 = unlimited)")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible latency and fault injection")
+    parser.add_argument('--model', action='append', dest='models', default=None, help="Model name to advertise (repeatable)")
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        latency=args.latency, per_item_latency=args.per_item_latency, load_time=args.load_time,
+        error_rate=args.error_rate, truncate_rate=args.truncate_rate, malformed_rate=args.malformed_rate,
+        max_concurrency=args.max_concurrency, max_queue=args.max_queue, seed=args.seed,
+        models=args.models or ('llama3:latest',)
+    )
+    server = make_server(config, args.host, args.port)
+    print(f"Ollama stub listening on http://{args.host}:{server.server_address[1]} (set OLLAMA_HOST to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
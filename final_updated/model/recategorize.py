@@ -0,0 +1,123 @@
+import logging
+
+
+def category_definitions(categories):
+    """Map each category name to a normalized form of its description.
+
+    Descriptions are compared as sets of comma-separated keywords, so reordering
+    or re-spacing the keywords in categories.yaml does not count as a redefinition.
+    """
+    definitions = {}
+    for cat in categories or []:
+        keywords = str(cat.get('description', '')).lower().split(',')
+        definitions[cat['name']] = sorted({kw.strip() for kw in keywords if kw.strip()})
+    return definitions
+
+
+def diff_categories(old_definitions, new_definitions):
+    """Compare two category sets (as returned by category_definitions)
+
+    Returns a dictionary with:
+    - removed: names that no longer exist and have no obvious successor
+    - renamed: {old_name: new_name} for categories whose description is unchanged
+    - redefined: names that still exist but whose description changed
+    - added: names that only exist in the new set
+    """
+    removed = [name for name in old_definitions if name not in new_definitions]
+    added = [name for name in new_definitions if name not in old_definitions]
+    redefined = [
+        name for name in old_definitions
+        if name in new_definitions and old_definitions[name] != new_definitions[name]
+    ]
+
+    # A removed category whose exact definition reappears under a single new name is a rename
+    renamed = {}
+    for name in list(removed):
+        candidates = [new for new in added if new_definitions[new] == old_definitions[name]]
+        if len(candidates) == 1 and candidates[0] not in renamed.values():
+            renamed[name] = candidates[0]
+            removed.remove(name)
+
+    return {
+        'removed': removed,
+        'renamed': renamed,
+        'redefined': redefined,
+        'added': [name for name in added if name not in renamed.values()]
+    }
+
+
+def gained_keywords(old_definitions, new_definitions, names):
+    """Keywords the named (added or redefined) categories have that they did not have before"""
+    old_definitions = old_definitions or {}
+    return [
+        keyword
+        for name in names
+        for keyword in new_definitions[name]
+        if keyword not in old_definitions.get(name, [])
+    ]
+
+
+def find_affected(rows, old_definitions, new_definitions):
+    """Find categorized rows ([description, category, amount]) invalidated by a category change
+
+    Returns (rerun_indices, relabels, invalid_indices):
+    - rerun_indices are the rows that have to go back to the model: those labeled with
+      a removed or redefined category, and those whose description contains a keyword
+      an added or redefined category gained (so they may belong there now)
+    - relabels maps row index -> new category name for pure renames, which can be
+      applied without another LLM call
+    - invalid_indices are rows whose label is not a category and was not removed by
+      the change (e.g. one the model made up), which the caller relabels with the
+      keyword rules instead of the model
+
+    Rows are not re-checked against an added category unless their description
+    contains one of its keywords: a row the model would move there for other reasons
+    keeps its label until it is categorized again.
+    """
+    if old_definitions is None:
+        # No record of the categories the rows were made with: labels that no longer
+        # exist cannot be told apart from invalid ones, and nothing is known to be added
+        diff = {'removed': [], 'renamed': {}, 'redefined': [], 'added': []}
+    else:
+        diff = diff_categories(old_definitions, new_definitions)
+
+    stale = set(diff['removed']) | set(diff['redefined'])
+    keywords = gained_keywords(old_definitions, new_definitions, diff['added'] + diff['redefined'])
+    rerun_indices = []
+    relabels = {}
+    invalid_indices = []
+    for index, row in enumerate(rows):
+        label = row[1]
+        if label in diff['renamed']:
+            relabels[index] = diff['renamed'][label]
+        elif label in stale:
+            rerun_indices.append(index)
+        elif label not in new_definitions:
+            invalid_indices.append(index)
+        elif keywords and any(keyword in str(row[0]).lower() for keyword in keywords):
+            rerun_indices.append(index)
+    return rerun_indices, relabels, invalid_indices
+
+
+def main():
+    """Re-categorize the saved dashboard results against the current categories.yaml"""
+    from . import init
+
+    saved = init.load_latest_results()
+    if not saved:
+        logging.error(f"No categorized expenses found at {init.RESULTS_FILE}")
+        return []
+
+    rows = saved.get('expenses', [])
+    categories = init.load_categories()
+    updated_rows, rerun_count = init.recategorize_affected(
+        rows, saved.get('categories'), categories, init.load_prompt_template()
+    )
+    logging.info(f"Re-categorized {rerun_count} of {len(rows)} expenses after category change")
+
+    init.send_to_dashboard(updated_rows, categories)
+    return updated_rows
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import json
+import re
+import time
+
+from .compact_prompt import REPLY_LINE
+
+# Text a reply may carry before its first item (e.g. "Here are the categories:")
+PREAMBLE_LIMIT = 300
+
+# Separators allowed between JSON items: whitespace, commas, the array brackets and code fences
+JSON_GAP = re.compile(r'^[\s,\[\]`]*(json)?[\s,\[\]`]*$')
+
+
+class CompactStreamParser:
+    """Incrementally parses 'index:code' lines as the reply streams in
+
+    A line counts once its newline arrives (or the stream ends). The first line that
+    is not an 'index:code' pair after an item has been read marks the reply as
+    off-format, and the parser is done once every expense in the batch has a code.
+    """
+
+    def __init__(self, batch, codes):
+        self.batch = batch
+        self.lookup = {code.upper(): name for code, name in codes.items()}
+        self.items = [None] * len(batch)
+        self.found = 0
+        self.buffer = ''
+        self.preamble = 0
+        self.off_format = False
+
+    @property
+    def done(self):
+        return self.found == len(self.batch)
+
+    def feed(self, text):
+        """Add streamed text; returns [(index, item)] for the items it completed"""
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        return self._parse_lines(lines)
+
+    def finish(self):
+        lines, self.buffer = [self.buffer], ''
+        return self._parse_lines(lines)
+
+    def _parse_lines(self, lines):
+        parsed = []
+        for line in lines:
+            line = line.strip('`* \t\r')
+            if not line or self.off_format:
+                continue
+            match = REPLY_LINE.match(line)
+            name = self.lookup.get(match.group(2).upper()) if match else None
+            index = int(match.group(1)) - 1 if match else -1
+            if name is None or not 0 <= index < len(self.batch):
+                self.preamble += len(line)
+                if self.found or self.preamble > PREAMBLE_LIMIT:
+                    self.off_format = True
+                continue
+            if self.items[index] is not None:
+                continue
+            item = {'description': self.batch[index]['description'], 'category': name}
+            if match.group(3) is not None:
+                item['confidence'] = float(match.group(3))
+            self.items[index] = item
+            self.found += 1
+            parsed.append((index, item))
+        return parsed
+
+    def result(self):
+        if not self.found:
+            raise ValueError("Response has no index:code lines")
+        return self.items
+
+
+class JSONStreamParser:
+    """Incrementally parses the objects of a JSON array reply as each one closes
+
+    Anything other than separators between two items, or a long preamble before the
+    first one, marks the reply as off-format. The parser is done when the array closes
+    or every expense in the batch has an item.
+    """
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.decoder = json.JSONDecoder()
+        self.items = []
+        self.buffer = ''
+        self.position = 0
+        self.closed = False
+        self.off_format = False
+
+    @property
+    def done(self):
+        return self.closed or len(self.items) >= len(self.batch)
+
+    def feed(self, text):
+        self.buffer += text
+        parsed = []
+        while not self.off_format and not self.closed:
+            start = self.buffer.find('{', self.position)
+            gap = self.buffer[self.position:start if start != -1 else len(self.buffer)]
+            if self.items and ']' in gap:
+                self.closed = True
+                break
+            if self.items and not JSON_GAP.match(gap):
+                self.off_format = True
+                break
+            if not self.items and len(gap) > PREAMBLE_LIMIT:
+                self.off_format = True
+                break
+            if start == -1:
+                break
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, start)
+            except json.JSONDecodeError:
+                # The object is still streaming in
+                break
+            self.position = end
+            parsed.append((len(self.items), item))
+            self.items.append(item)
+        return parsed
+
+    def finish(self):
+        return self.feed('')
+
+    def result(self):
+        if not self.items:
+            raise ValueError("Response has no JSON items")
+        return self.items
+
+
+def consume_stream(chunks, parser, on_item=None):
+    """Read a streamed chat reply through a parser, stopping early only if it goes off-format
+
+    Returns (content, last_chunk, first_item_seconds, aborted). Once the parser is
+    done the rest of the reply (num_predict keeps it short) is read without parsing,
+    so last_chunk is the final 'done' chunk with the token counts and durations.
+    Closing the chunk iterator early drops the connection, so the server stops
+    decoding an off-format reply.
+    """
+    started = time.perf_counter()
+    first_item_seconds = None
+    content = []
+    last_chunk = None
+    aborted = False
+    try:
+        for chunk in chunks:
+            last_chunk = chunk
+            text = chunk['message']['content'] or ''
+            content.append(text)
+            if parser.done:
+                continue
+            parsed = parser.feed(text)
+            if parsed and first_item_seconds is None:
+                first_item_seconds = time.perf_counter() - started
+            for index, item in parsed:
+                if on_item:
+                    on_item(index, item)
+            if parser.off_format:
+                aborted = True
+                break
+        else:
+            for index, item in parser.finish():
+                if first_item_seconds is None:
+                    first_item_seconds = time.perf_counter() - started
+                if on_item:
+                    on_item(index, item)
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+    return ''.join(content), last_chunk, first_item_seconds, aborted
@@ -0,0 +1,181 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+# Histogram bucket upper bounds; the last bucket collects everything above
+TOKENS_PER_SEC_BUCKETS = [5, 10, 20, 40, 80, 160, 320]
+LOAD_SECONDS_BUCKETS = [0.05, 0.25, 1, 2.5, 5, 10, 30]
+QUEUE_WAIT_SECONDS_BUCKETS = [0.01, 0.1, 0.5, 1, 5, 15, 60]
+
+# Number of individual batch records kept for inspection
+RECENT_BATCHES = 200
+
+
+def response_field(response, key):
+    """Read a field from an Ollama chat response (dict or response object), None if absent"""
+    try:
+        return response[key]
+    except (KeyError, TypeError, AttributeError):
+        return getattr(response, key, None)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None
+        }
+
+
+class LLMTelemetry:
+    """Per-batch Ollama statistics: token counts, eval/load durations and queue wait"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.recent = deque(maxlen=RECENT_BATCHES)
+            self.totals = {
+                "batches": 0, "items": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "eval_seconds": 0.0, "prompt_eval_seconds": 0.0, "load_seconds": 0.0,
+                "queue_wait_seconds": 0.0, "wall_seconds": 0.0, "cold_loads": 0,
+                "streamed": 0, "first_item_seconds": 0.0, "aborted": 0
+            }
+            self.decode_tokens_per_sec = Histogram(TOKENS_PER_SEC_BUCKETS)
+            self.prompt_tokens_per_sec = Histogram(TOKENS_PER_SEC_BUCKETS + [640, 1280])
+            self.load_seconds = Histogram(LOAD_SECONDS_BUCKETS)
+            self.queue_wait_seconds = Histogram(QUEUE_WAIT_SECONDS_BUCKETS)
+            # Two-tier escalation: per-tier call counts and latency, and how many items
+            # the fast tier settled on its own
+            self.tiers = {}
+            self.escalation = {"batches": 0, "items": 0, "accepted_fast": 0, "escalated": 0}
+
+    def record_batch(self, response, items, wall_seconds, queue_wait=0.0, endpoint=None, model=None, tier=None,
+                     first_item_seconds=None, aborted=False):
+        """Record one chat call. Durations from Ollama are in nanoseconds.
+
+        For streamed replies, response is the last chunk read (None if the stream was
+        empty); an aborted stream has no final statistics.
+        """
+        prompt_tokens = response_field(response, 'prompt_eval_count') or 0
+        completion_tokens = response_field(response, 'eval_count') or 0
+        eval_seconds = (response_field(response, 'eval_duration') or 0) / 1e9
+        prompt_eval_seconds = (response_field(response, 'prompt_eval_duration') or 0) / 1e9
+        load_seconds = (response_field(response, 'load_duration') or 0) / 1e9
+
+        record = {
+            "time": time.time(),
+            "endpoint": endpoint,
+            "model": model or response_field(response, 'model'),
+            "tier": tier,
+            "items": items,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "decode_tokens_per_sec": completion_tokens / eval_seconds if eval_seconds else None,
+            "prompt_tokens_per_sec": prompt_tokens / prompt_eval_seconds if prompt_eval_seconds else None,
+            "load_seconds": load_seconds,
+            "queue_wait_seconds": queue_wait,
+            "wall_seconds": wall_seconds,
+            "first_item_seconds": first_item_seconds,
+            "aborted": aborted
+        }
+
+        with self.lock:
+            self.recent.append(record)
+            totals = self.totals
+            totals["batches"] += 1
+            totals["items"] += items
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["eval_seconds"] += eval_seconds
+            totals["prompt_eval_seconds"] += prompt_eval_seconds
+            totals["load_seconds"] += load_seconds
+            totals["queue_wait_seconds"] += queue_wait
+            totals["wall_seconds"] += wall_seconds
+            # Ollama reports a near-zero load time when the model is already resident
+            if load_seconds > 0.5:
+                totals["cold_loads"] += 1
+            if first_item_seconds is not None:
+                totals["streamed"] += 1
+                totals["first_item_seconds"] += first_item_seconds
+            if aborted:
+                totals["aborted"] += 1
+
+            if record["decode_tokens_per_sec"] is not None:
+                self.decode_tokens_per_sec.observe(record["decode_tokens_per_sec"])
+            if record["prompt_tokens_per_sec"] is not None:
+                self.prompt_tokens_per_sec.observe(record["prompt_tokens_per_sec"])
+            self.load_seconds.observe(load_seconds)
+            self.queue_wait_seconds.observe(queue_wait)
+
+            if tier:
+                stats = self.tiers.setdefault(tier, {"calls": 0, "items": 0, "wall_seconds": 0.0, "completion_tokens": 0})
+                stats["calls"] += 1
+                stats["items"] += items
+                stats["wall_seconds"] += wall_seconds
+                stats["completion_tokens"] += completion_tokens
+        return record
+
+    def record_escalation(self, accepted_fast, escalated):
+        """Record the outcome of one two-tier batch"""
+        with self.lock:
+            self.escalation["batches"] += 1
+            self.escalation["items"] += accepted_fast + escalated
+            self.escalation["accepted_fast"] += accepted_fast
+            self.escalation["escalated"] += escalated
+
+    def summary(self, recent=20):
+        """Aggregated view for the app: totals, rates, histograms and the latest batches"""
+        with self.lock:
+            totals = dict(self.totals)
+            items = totals["items"]
+            return {
+                "totals": totals,
+                "rates": {
+                    "decode_tokens_per_sec": totals["completion_tokens"] / totals["eval_seconds"] if totals["eval_seconds"] else None,
+                    "prompt_tokens_per_sec": totals["prompt_tokens"] / totals["prompt_eval_seconds"] if totals["prompt_eval_seconds"] else None,
+                    "prompt_tokens_per_item": totals["prompt_tokens"] / items if items else None,
+                    "completion_tokens_per_item": totals["completion_tokens"] / items if items else None,
+                    "mean_queue_wait_seconds": totals["queue_wait_seconds"] / totals["batches"] if totals["batches"] else None,
+                    "mean_first_item_seconds": totals["first_item_seconds"] / totals["streamed"] if totals["streamed"] else None
+                },
+                "histograms": {
+                    "decode_tokens_per_sec": self.decode_tokens_per_sec.to_dict(),
+                    "prompt_tokens_per_sec": self.prompt_tokens_per_sec.to_dict(),
+                    "load_seconds": self.load_seconds.to_dict(),
+                    "queue_wait_seconds": self.queue_wait_seconds.to_dict()
+                },
+                "tiers": {
+                    tier: dict(stats, mean_latency_seconds=stats["wall_seconds"] / stats["calls"] if stats["calls"] else None)
+                    for tier, stats in self.tiers.items()
+                },
+                "escalation": dict(
+                    self.escalation,
+                    escalation_rate=self.escalation["escalated"] / self.escalation["items"] if self.escalation["items"] else None
+                ),
+                "recent": list(self.recent)[-recent:] if recent else []
+            }
+
+
+# Process-wide collector used by init.categorize_expense_batch
+llm_telemetry = LLMTelemetry()
+
+
+def summary(recent=20):
+    return llm_telemetry.summary(recent)
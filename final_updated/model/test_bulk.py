@@ -0,0 +1,91 @@
+import csv
+import json
+
+import pytest
+
+from model import init
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / 'expenses.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Recipient', 'Amount'])
+        for i in range(23):
+            writer.writerow([f'2024-01-{i % 28 + 1:02d}', f'Café {i}', i + 1])
+    return path
+
+
+def fake_batches(monkeypatch, crash_at=None):
+    calls = []
+
+    def categorize(batch, categories, prompt_template, force_recategorize):
+        calls.append([expense['description'] for expense in batch])
+        if len(calls) == crash_at:
+            raise Crash()
+        return [(expense['description'], 'Food') for expense in batch]
+
+    monkeypatch.setattr(init, 'categorize_expense_batch', categorize)
+    return calls
+
+
+def bulk_args(input_file, output_file, *extra):
+    return init.parse_args([
+        '--input-file', str(input_file), '--output-file', str(output_file), '--checkpoint-every', '2', *extra
+    ])
+
+
+def read_output(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_after_crash(monkeypatch, input_file, tmp_path):
+    output_file = tmp_path / 'out.jsonl'
+    fake_batches(monkeypatch, crash_at=4)
+    with pytest.raises(Crash):
+        init.run_bulk(bulk_args(input_file, output_file))
+    checkpoint = json.loads((tmp_path / 'out.jsonl.checkpoint').read_text())
+    assert checkpoint['completed_batches'] == 2
+    # Non-ASCII descriptions: the offset counts bytes, not characters
+    assert checkpoint['output_offset'] == len(b''.join(
+        (json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8') for row in read_output(output_file)[:10]
+    ))
+
+    calls = fake_batches(monkeypatch)
+    result = init.run_bulk(bulk_args(input_file, output_file))
+    assert len(calls) == 3
+    assert result['expenses'] == 23
+    assert [row['description'] for row in read_output(output_file)] == [f'Café {i}' for i in range(23)]
+    assert not (tmp_path / 'out.jsonl.checkpoint').exists()
+
+
+def test_checkpoint_ignored_for_other_options(monkeypatch, input_file, tmp_path):
+    output_file = tmp_path / 'out.jsonl'
+    fake_batches(monkeypatch, crash_at=4)
+    with pytest.raises(Crash):
+        init.run_bulk(bulk_args(input_file, output_file))
+
+    calls = fake_batches(monkeypatch)
+    init.run_bulk(bulk_args(input_file, output_file, '--force-recategorize'))
+    assert len(calls) == 5
+    assert len(read_output(output_file)) == 23
+
+
+def test_checkpoint_ignored_when_output_missing(monkeypatch, input_file, tmp_path):
+    output_file = tmp_path / 'out.jsonl'
+    fake_batches(monkeypatch, crash_at=4)
+    with pytest.raises(Crash):
+        init.run_bulk(bulk_args(input_file, output_file))
+    output_file.unlink()
+
+    calls = fake_batches(monkeypatch)
+    init.run_bulk(bulk_args(input_file, output_file))
+    assert len(calls) == 5
+    assert b'\0' not in output_file.read_bytes()
+    assert len(read_output(output_file)) == 23
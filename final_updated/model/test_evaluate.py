@@ -0,0 +1,26 @@
+from model.evaluate import percentile
+
+
+def test_percentile_nearest_rank_even_n():
+    values = list(range(1, 11))
+    assert percentile(values, 50) == 5
+    assert percentile(values, 95) == 10
+    values = list(range(1, 21))
+    assert percentile(values, 50) == 10
+    assert percentile(values, 95) == 19
+
+
+def test_percentile_nearest_rank_odd_n():
+    values = list(range(1, 12))
+    assert percentile(values, 50) == 6
+    assert percentile(values, 95) == 11
+    values = list(range(1, 22))
+    assert percentile(values, 50) == 11
+    assert percentile(values, 95) == 20
+
+
+def test_percentile_edges():
+    assert percentile([], 50) is None
+    assert percentile([7], 50) == 7
+    assert percentile([3, 1, 2], 0) == 1
+    assert percentile(list(range(1, 101)), 7) == 7
@@ -0,0 +1,54 @@
+from model.recategorize import category_definitions, find_affected
+
+OLD = category_definitions([
+    {'name': 'Food', 'description': 'swiggy, zomato'},
+    {'name': 'Travel', 'description': 'uber, ola'},
+    {'name': 'Bills', 'description': 'electricity'},
+    {'name': 'Misc', 'description': 'other'},
+])
+
+
+def test_find_affected_rename_remove_and_invalid():
+    new = category_definitions([
+        {'name': 'Food', 'description': 'zomato,  swiggy'},
+        {'name': 'Transport', 'description': 'uber, ola'},
+        {'name': 'Misc', 'description': 'other'},
+    ])
+    rows = [
+        ['Swiggy order', 'Food', 10],
+        ['Uber trip', 'Travel', 20],
+        ['Power bill', 'Bills', 30],
+        ['Something', 'Made Up', 40],
+    ]
+    rerun, relabels, invalid = find_affected(rows, OLD, new)
+    # Reordered keywords are not a redefinition; Travel -> Transport is a rename
+    assert rerun == [2]
+    assert relabels == {1: 'Transport'}
+    assert invalid == [3]
+
+
+def test_find_affected_gained_keywords():
+    new = category_definitions([
+        {'name': 'Food', 'description': 'swiggy, zomato, blinkit'},
+        {'name': 'Travel', 'description': 'uber, ola'},
+        {'name': 'Bills', 'description': 'electricity'},
+        {'name': 'Misc', 'description': 'other'},
+        {'name': 'Fuel', 'description': 'petrol, hp'},
+    ])
+    rows = [
+        ['Uber trip', 'Travel', 20],
+        ['BLINKIT grocery', 'Misc', 5],
+        ['HP Petrol Pump', 'Misc', 50],
+        ['Zomato', 'Food', 12],
+    ]
+    rerun, relabels, invalid = find_affected(rows, OLD, new)
+    # Food was redefined, so its rows go back; Misc rows match a gained keyword
+    assert rerun == [1, 2, 3]
+    assert relabels == {}
+    assert invalid == []
+
+
+def test_find_affected_without_old_definitions():
+    rows = [['Swiggy', 'Food', 1], ['Uber', 'Travel', 2]]
+    rerun, relabels, invalid = find_affected(rows, None, category_definitions([{'name': 'Food', 'description': 'swiggy'}]))
+    assert (rerun, relabels, invalid) == ([], {}, [1])
@@ -0,0 +1,93 @@
+import json
+
+from model.streaming import CompactStreamParser, JSONStreamParser, consume_stream
+
+BATCH = [{'description': 'Swiggy'}, {'description': 'Uber'}, {'description': 'Amazon'}]
+CODES = {'F': 'Food', 'T': 'Transport', 'S': 'Shopping'}
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def feed_all(parser, pieces):
+    parsed = []
+    for piece in pieces:
+        parsed.extend(parser.feed(piece))
+    parsed.extend(parser.finish())
+    return parsed
+
+
+def chunks(pieces):
+    for piece in pieces:
+        yield {'message': {'content': piece}, 'done': False}
+    yield {'message': {'content': ''}, 'done': True, 'eval_count': 12}
+
+
+def test_compact_parser_split_chunks():
+    reply = "Here you go:\n1:F\n2: t:0.9\n3. S\n"
+    for size in (1, 2, 3, 7, len(reply)):
+        parser = CompactStreamParser(BATCH, CODES)
+        parsed = feed_all(parser, split_every(reply, size))
+        assert [index for index, item in parsed] == [0, 1, 2]
+        assert parser.done and not parser.off_format
+        assert [item['category'] for item in parser.result()] == ['Food', 'Transport', 'Shopping']
+        assert parser.result()[1]['confidence'] == 0.9
+
+
+def test_compact_parser_last_line_without_newline():
+    parser = CompactStreamParser(BATCH, CODES)
+    assert feed_all(parser, ["1:F\n2:T\n3", ":S"])[-1] == (2, {'description': 'Amazon', 'category': 'Shopping'})
+
+
+def test_compact_parser_off_format_after_item():
+    parser = CompactStreamParser(BATCH, CODES)
+    feed_all(parser, ["1:F\n", "Sure! Let me explain\n", "2:T\n"])
+    assert parser.off_format
+    assert parser.result()[1] is None
+
+
+def test_json_parser_split_chunks():
+    items = [{'description': e['description'], 'category': c} for e, c in zip(BATCH, ['Food', 'Transport', 'Shopping'])]
+    reply = "```json\n" + json.dumps(items, indent=2) + "\n```"
+    for size in (1, 2, 5, 11, len(reply)):
+        parser = JSONStreamParser(BATCH)
+        parsed = feed_all(parser, split_every(reply, size))
+        assert [index for index, item in parsed] == [0, 1, 2]
+        assert parser.done and not parser.off_format
+        assert parser.result() == items
+
+
+def test_json_parser_braces_inside_strings():
+    reply = '[{"description": "Cafe {corner}", "category": "Food"}, {"description": "x}", "category": "Other"}]'
+    parser = JSONStreamParser(BATCH)
+    parsed = feed_all(parser, split_every(reply, 4))
+    assert [item['description'] for index, item in parsed] == ['Cafe {corner}', 'x}']
+    assert parser.closed and not parser.off_format
+
+
+def test_json_parser_off_format_between_items():
+    parser = JSONStreamParser(BATCH)
+    feed_all(parser, ['[{"description": "Swiggy", "category": "Food"}', ' and then ', '{"description": "Uber"}]'])
+    assert parser.off_format
+    assert len(parser.result()) == 1
+
+
+def test_consume_stream_reads_to_done_chunk():
+    seen = []
+    content, last_chunk, first_item_seconds, aborted = consume_stream(
+        chunks(split_every("1:F\n2:T\n3:S\n", 2)), CompactStreamParser(BATCH, CODES),
+        on_item=lambda index, item: seen.append(index)
+    )
+    assert seen == [0, 1, 2]
+    assert content == "1:F\n2:T\n3:S\n"
+    assert last_chunk['done'] and last_chunk['eval_count'] == 12
+    assert first_item_seconds is not None and not aborted
+
+
+def test_consume_stream_aborts_off_format():
+    content, last_chunk, first_item_seconds, aborted = consume_stream(
+        chunks(["1:F\n", "I think\n", "2:T\n"]), CompactStreamParser(BATCH, CODES)
+    )
+    assert aborted
+    assert not last_chunk['done']
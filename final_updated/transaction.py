@@ -0,0 +1,127 @@
+import math
+
+# Keys each field may have in the rows a source produces: the Gmail scraper's CSV
+# columns ('Recipient', 'Amount'), n8n's webhook objects and the app's own dictionaries
+SOURCE_KEYS = {
+    'date': ('date', 'Date'),
+    'amount': ('amount', 'Amount'),
+    'recipient': ('recipient', 'Recipient', 'description', 'Description'),
+    'category': ('category', 'Category'),
+    'txn_id': ('txn_id', 'Txn ID', 'transaction_id', 'Transaction ID'),
+    'txn_status': ('txn_status', 'Txn Status', 'status', 'Status'),
+    'payment_mode': ('payment_mode', 'Payment Mode'),
+    'type': ('type', 'Type'),
+}
+
+
+def parse_amount(value):
+    """Amount as a float, 0.0 if it is missing or not a number"""
+    try:
+        amount = float(value)
+    except (ValueError, TypeError):
+        return 0.0
+    return 0.0 if math.isnan(amount) else amount
+
+
+def _text(value, default=''):
+    """Value as a string, default if it is missing (None, or NaN from a CSV)"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return default
+    return str(value)
+
+
+def _first(row, keys):
+    for key in keys:
+        value = row.get(key)
+        if value is not None and value != '':
+            return value
+    return None
+
+
+class Transaction:
+    """One transaction, converted once from the row its source produced
+
+    The scraper, the n8n fetcher, the model and the app all pass these records along
+    instead of copying each row into a dictionary of their own. Records can be read
+    like those dictionaries (tx['description'] as the model does, tx.get('recipient')
+    as the app does); a field that is None counts as missing. day is the date as a
+    day number (see flask_app/dates.py) once the app has converted it.
+    """
+
+    __slots__ = ('date', 'day', 'amount', 'recipient', 'category', 'txn_id', 'txn_status', 'payment_mode', 'type')
+
+    # Other names the layers use for a field
+    ALIASES = {'description': 'recipient', 'transaction_id': 'txn_id'}
+
+    def __init__(self, date=None, amount=0.0, recipient='Unknown', category=None, txn_id='',
+                 txn_status='', payment_mode='', type='', day=None):
+        self.date = date
+        self.day = day
+        self.amount = amount
+        self.recipient = recipient
+        self.category = category
+        self.txn_id = txn_id
+        self.txn_status = txn_status
+        self.payment_mode = payment_mode
+        self.type = type
+
+    @classmethod
+    def from_dict(cls, row):
+        """Record for a scraper, n8n or app dictionary (a record is returned as it is)"""
+        if isinstance(row, cls):
+            return row
+        category = _first(row, SOURCE_KEYS['category'])
+        return cls(
+            date=_text(_first(row, SOURCE_KEYS['date']), None),
+            amount=parse_amount(_first(row, SOURCE_KEYS['amount'])),
+            recipient=_text(_first(row, SOURCE_KEYS['recipient']), 'Unknown'),
+            category=_text(category, None),
+            txn_id=_text(_first(row, SOURCE_KEYS['txn_id'])),
+            txn_status=_text(_first(row, SOURCE_KEYS['txn_status'])),
+            payment_mode=_text(_first(row, SOURCE_KEYS['payment_mode'])),
+            type=_text(_first(row, SOURCE_KEYS['type']))
+        )
+
+    def __getitem__(self, key):
+        name = self.ALIASES.get(key, key)
+        if name not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, name)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def to_dict(self):
+        """The dictionary the dashboard displays"""
+        return {
+            'date': self.date,
+            'amount': self.amount,
+            'recipient': self.recipient,
+            'description': self.recipient,
+            'category': self.category or 'Other',
+            'txn_id': self.txn_id,
+            'txn_status': self.txn_status,
+            'payment_mode': self.payment_mode,
+            'type': self.type
+        }
+
+    def to_expense(self):
+        """The expense dictionary the model used to build, which its cache keys are hashes of
+
+        The model built it before categorizing, so category is always empty: a record
+        keeps its cache key after attach_categories has set its category.
+        """
+        return {
+            'date': self.date,
+            'amount': self.amount,
+            'description': self.recipient,
+            'category': '',
+            'transaction_id': self.txn_id
+        }
+
+    def __repr__(self):
+        return f"Transaction(date={self.date!r}, amount={self.amount!r}, recipient={self.recipient!r}, category={self.category!r})"
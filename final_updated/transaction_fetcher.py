@@ -1,12 +1,68 @@
 import requests
 import json
+import logging
+import time
 from datetime import datetime, timedelta
 
+from transaction import Transaction
+
 # Configuration
 # IMPORTANT: Use the webhook URL configured in your n8n instance
 # Use the production webhook URL instead of the test one
 N8N_WEBHOOK_URL = "http://localhost:5678/webhook/transactions"  # Production URL
 
+# Seconds to wait for the n8n workflow to respond
+REQUEST_TIMEOUT = 60
+
+
+class FetchResult:
+    """Outcome of one call to the n8n webhook
+
+    status is 'ok' (transactions may still be empty), or 'error' with error_kind one of
+    'webhook_inactive', 'invalid_json', 'http_error', 'timeout' or 'connection'.
+    elapsed is the seconds spent on the request. transactions are the objects n8n
+    returned and records the same transactions as Transaction records.
+    """
+
+    def __init__(self, transactions=None, status='ok', error_kind=None, message='', status_code=None, elapsed=0.0, url=None):
+        self.transactions = transactions or []
+        self.records = [Transaction.from_dict(tx) for tx in self.transactions]
+        self.status = status
+        self.error_kind = error_kind
+        self.message = message
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.url = url
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+    def __repr__(self):
+        return (f"FetchResult(status={self.status!r}, error_kind={self.error_kind!r}, "
+                f"transactions={len(self.transactions)}, elapsed={self.elapsed:.2f})")
+
+
+def extract_transactions(data):
+    """Pull the transaction objects out of the webhook's JSON reply"""
+    if isinstance(data, list):
+        # Filter out workflow start messages and only keep actual transaction data
+        return [tx for tx in data if 'Transaction ID' in tx or 'transaction_id' in tx or 'txn_id' in tx]
+    if isinstance(data, dict):
+        # Check if this is just a workflow start message
+        if data.get('message') == 'Workflow was started':
+            logging.info("Received workflow start message, but no transaction data")
+            return []
+        
+        # Check for transactions key
+        if 'transactions' in data:
+            return data['transactions']
+        # Check if this is a single transaction object with proper fields
+        if any(key in data for key in ['Transaction ID', 'transaction_id', 'txn_id', 'Amount', 'amount']):
+            return [data]
+    return []
+
+
 def fetch_transactions(start_date=None, end_date=None, test_mode=True):
     """
     Fetch transactions from the n8n API endpoint.
@@ -14,12 +70,12 @@ def fetch_transactions(start_date=None, end_date=None, test_mode=True):
     Parameters:
     - start_date: Optional start date in YYYY-MM-DD format
     - end_date: Optional end date in YYYY-MM-DD format
-    - test_mode: Whether to use test mode URL (not used anymore)
+    - test_mode: Whether to use the test webhook URL instead of the production one
     
     Returns:
-    - List of transaction objects, or an empty list if none are found
+    - FetchResult with the transactions (possibly none), or the kind of error that
+      prevented fetching them; the webhook is called exactly once
     """
-    # We're using the production URL by default now
     url = N8N_WEBHOOK_URL if not test_mode else "http://localhost:5678/webhook-test/transactions"
     
     # Default to last 30 days if no dates provided
@@ -28,7 +84,7 @@ def fetch_transactions(start_date=None, end_date=None, test_mode=True):
         start = end - timedelta(days=30)
         start_date = start_date or start.strftime("%Y-%m-%d")
         end_date = end_date or end.strftime("%Y-%m-%d")
-        print(f"Using default date range: {start_date} to {end_date}")
+        logging.info(f"Using default date range: {start_date} to {end_date}")
     
     # Prepare parameters
     params = {
@@ -37,105 +93,80 @@ def fetch_transactions(start_date=None, end_date=None, test_mode=True):
         "end_date": end_date
     }
     
+    logging.info(f"Fetching transactions from n8n API at {url} for {start_date} to {end_date}")
+    started = time.perf_counter()
+    
+    def result(**kwargs):
+        return FetchResult(url=url, elapsed=time.perf_counter() - started, **kwargs)
+    
     try:
-        print(f"Fetching transactions from n8n API at {url}")
-        print(f"Date range: {start_date} to {end_date}")
-        
-        # Make the API request with an increased timeout
-        response = requests.get(url, params=params, timeout=60)  # Increased timeout to 60 seconds
-        
-        # Log the response status
-        print(f"API response status: {response.status_code}")
-        print(f"Response body: {response.text[:500]}")  # Print part of the response for debugging
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                
-                # Handle different response formats
-                transactions = []
-                
-                if isinstance(data, list):
-                    # Filter out workflow start messages and only keep actual transaction data
-                    transactions = [tx for tx in data if 'Transaction ID' in tx or 'transaction_id' in tx or 'txn_id' in tx]
-                elif isinstance(data, dict):
-                    # Check if this is just a workflow start message
-                    if data.get('message') == 'Workflow was started':
-                        print("Received workflow start message, but no transaction data")
-                        return []
-                    
-                    # Check for transactions key  
-                    if 'transactions' in data:
-                        transactions = data['transactions']
-                    # Check if this is a single transaction object with proper fields
-                    elif any(key in data for key in ['Transaction ID', 'transaction_id', 'txn_id', 'Amount', 'amount']):
-                        transactions = [data]
-                
-                transaction_count = len(transactions)
-                print(f"Successfully fetched {transaction_count} transactions")
-                return transactions
-            except json.JSONDecodeError:
-                print(f"Error parsing JSON response from {url}: {response.text[:200]}...")
-                print("The response is not valid JSON. Make sure the 'Respond to Webhook' node in n8n is set to return JSON data.")
-                return []
-        elif response.status_code == 404:
-            # Special handling for n8n webhook test mode
-            try:
-                error_data = response.json()
-                error_msg = error_data.get("message", "")
-                if "webhook" in error_msg:
-                    print(f"\n⚠️ WEBHOOK ERROR: {error_msg}")
-            except:
-                pass
-            
-            print(f"Error response from {url}: {response.status_code}")
-            print(f"Response content: {response.text[:200]}...")
-            return []
-        else:
-            print(f"Error response from {url}: {response.status_code}")
-            print(f"Response content: {response.text[:200]}...")
-            return []
-                
+        response = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
     except requests.exceptions.Timeout:
-        print(f"\n⚠️ TIMEOUT ERROR: The request to {url} timed out. This means n8n took too long to respond.")
-        print("This could be because the workflow is processing a lot of data or has complex operations.")
-        print("\nTry using the production webhook instead of the test webhook:")
-        print("1. Make sure your workflow is activated in n8n")
-        print("2. Try again using test_mode=False")
-        
+        logging.error(
+            f"Request to {url} timed out after {REQUEST_TIMEOUT}s; the workflow may be processing "
+            f"a lot of data, or try the activated production webhook (test_mode=False)"
+        )
+        return result(status='error', error_kind='timeout', message=f"n8n did not respond within {REQUEST_TIMEOUT} seconds")
     except requests.RequestException as e:
-        print(f"Error connecting to n8n API at {url}: {str(e)}")
+        logging.error(
+            f"Error connecting to n8n API at {url}: {str(e)}. Make sure n8n is running "
+            f"(http://localhost:5678) and the workflow is ACTIVATED"
+        )
+        return result(status='error', error_kind='connection', message=str(e))
     
-    # If we get here, the connection failed
-    print("\n❌ Connection attempt failed.")
+    logging.info(f"API response status: {response.status_code}")
+    logging.debug(f"Response body: {response.text[:500]}")
     
-    print("\nTROUBLESHOOTING STEPS:")
-    print("1. Make sure your n8n instance is running (http://localhost:5678)")
-    print("2. Open your workflow with the webhook node")
-    print("3. Make sure the workflow is ACTIVATED (toggle in top-right)")
-    print("4. The webhook might be taking too long - try simplifying your workflow")
-    print("5. Use the production webhook URL instead of the test webhook")
+    if response.status_code == 200:
+        try:
+            data = response.json()
+        except json.JSONDecodeError:
+            logging.error(
+                f"Error parsing JSON response from {url}: {response.text[:200]}... Make sure the "
+                f"'Respond to Webhook' node in n8n is set to return JSON data."
+            )
+            return result(status='error', error_kind='invalid_json', message="Response is not valid JSON", status_code=200)
+        
+        transactions = extract_transactions(data)
+        logging.info(f"Successfully fetched {len(transactions)} transactions")
+        return result(transactions=transactions, status_code=200)
     
-    return []
+    if response.status_code == 404:
+        # n8n answers 404 for a test webhook that is not listening or a workflow that is not active
+        try:
+            error_msg = response.json().get("message", "")
+        except (ValueError, AttributeError):
+            error_msg = ""
+        if "webhook" in error_msg:
+            logging.warning(f"Webhook error from {url}: {error_msg}")
+            return result(status='error', error_kind='webhook_inactive', message=error_msg, status_code=404)
+    
+    logging.error(f"Error response from {url}: {response.status_code} {response.text[:200]}...")
+    return result(
+        status='error', error_kind='http_error',
+        message=f"n8n responded with HTTP {response.status_code}", status_code=response.status_code
+    )
 
 if __name__ == "__main__":
     # Example usage
+    logging.basicConfig(level=logging.INFO)
     print("Fetching transactions for the last 30 days...")
-    transactions = fetch_transactions()
+    result = fetch_transactions()
+    transactions = result.records
     
     # Display results
-    print(f"Found {len(transactions)} transactions")
+    print(f"Found {len(transactions)} transactions in {result.elapsed:.2f}s")
     
     if transactions:
         print("\nSample transactions:")
         for idx, tx in enumerate(transactions[:5], 1):  # Show first 5 transactions
-            print(f"{idx}. {tx.get('date')} - Rs.{tx.get('amount')} to {tx.get('recipient')} - {tx.get('status')}")
+            print(f"{idx}. {tx.date} - Rs.{tx.amount} to {tx.recipient} - {tx.txn_status}")
         
         if len(transactions) > 5:
             print(f"... and {len(transactions) - 5} more")
     else:
-        print("No transactions found. Please check your n8n workflow and webhook URL.")
+        print(f"No transactions found ({result.error_kind or 'empty'}: {result.message}). "
+              f"Please check your n8n workflow and webhook URL.")
     
     print("\nTo use in your application, import the fetch_transactions function.")
     print("Example: from transaction_fetcher import fetch_transactions") 
\ No newline at end of file